@@ -3,12 +3,26 @@ Sunday Natural Products GmbH - Robot Framework Metrics Dashboard
 Flask API и Web Interface
 """
 import os
+import gzip
 import json
+import time
+import threading
+from collections import OrderedDict
+from functools import wraps
 from pathlib import Path
-from datetime import datetime
-from flask import Flask, render_template, jsonify, send_from_directory, request
+from datetime import datetime, timezone
+from flask import (Flask, Response, g, render_template, jsonify, send_from_directory, request,
+                   make_response, stream_with_context)
+from werkzeug.local import LocalProxy
 
 from metrics_parser import MetricsParser
+from ingest_service import read_ingest_status
+from jobs import JobManager
+from keyword_profile import keyword_key
+from namespaces import DEFAULT_NAMESPACE, NamespaceRegistry, validate_namespace
+from retention import RetentionPolicy
+from instrumentation import (REGISTRY, pop_request_timings, profiler_from_env, server_timing_header,
+                             start_request_timings)
 
 # Flask setup
 app = Flask(__name__)
@@ -19,8 +33,218 @@ METRICS_DATA_DIR = os.getenv('METRICS_DATA_DIR', '/app/data')
 ROBOT_RESULTS_DIR = os.getenv('ROBOT_RESULTS_DIR', '/robot_results')
 HISTORY_DIR = os.path.join(METRICS_DATA_DIR, 'history')
 
-# Initialize parser
-parser = MetricsParser(ROBOT_RESULTS_DIR, HISTORY_DIR)
+# Parser за всеки namespace (history backend: METRICS_HISTORY_BACKEND=sqlite|file).
+# Заявките избират namespace с ?ns=project/branch/env (default: METRICS_NAMESPACE),
+# а `parser` е parser-ът на namespace-а на текущата заявка.
+NAMESPACE = validate_namespace(os.getenv('METRICS_NAMESPACE'))
+namespaces = NamespaceRegistry(HISTORY_DIR, lambda history_dir: MetricsParser(ROBOT_RESULTS_DIR, history_dir))
+parser = LocalProxy(lambda: g.parser)
+
+# Routes, които могат да създадат нов namespace (ingest)
+NAMESPACE_CREATING_ENDPOINTS = ('api_parse', 'api_ingest')
+
+# Routes, които не четат историята на namespace - грешен ?ns= не ги засяга
+NAMESPACE_FREE_ENDPOINTS = (
+    'static', 'health', 'prometheus_metrics', 'dashboard', 'robot_report', 'robot_log',
+    'log_html', 'report_html', 'serve_robot_files', 'api_ingest_status', 'api_namespaces',
+    'api_jobs', 'api_job'
+)
+
+# Кеш на сериализираните API отговори: (generation, endpoint, args) -> body
+RESPONSE_CACHE_SIZE = int(os.getenv('METRICS_RESPONSE_CACHE_SIZE', '256'))
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Retention по подразбиране (METRICS_RETENTION_*) - runs, които compactor-ът
+# още може да свие, не се кешират като immutable
+RETENTION = RetentionPolicy.from_env()
+
+# Server-sent events: колко често се проверява журналът и колко живее
+# един stream (браузърът се reconnect-ва сам с Last-Event-ID)
+EVENTS_POLL_INTERVAL = float(os.getenv('METRICS_EVENTS_POLL_INTERVAL', '1'))
+EVENTS_HEARTBEAT = 15
+EVENTS_STREAM_SECONDS = int(os.getenv('METRICS_EVENTS_STREAM_SECONDS', '300'))
+
+# Всеки stream държи gunicorn thread за целия си живот (gthread: 2 workers x
+# 16 threads) - над METRICS_EVENTS_MAX_STREAMS на worker новите получават 503,
+# за да остават threads за обикновените заявки
+EVENTS_MAX_STREAMS = int(os.getenv('METRICS_EVENTS_MAX_STREAMS', '8'))
+EVENTS_RETRY_AFTER = int(os.getenv('METRICS_EVENTS_RETRY_AFTER', '30'))
+_event_slots = threading.BoundedSemaphore(max(EVENTS_MAX_STREAMS, 1))
+
+# Server-Timing header на всеки отговор (фазите на заявката) и профилиране
+# на заявки, по-бавни от METRICS_PROFILE_SLOW_MS
+TIMING_HEADERS = os.getenv('METRICS_TIMING_HEADERS', 'false').lower() == 'true'
+profiler = profiler_from_env()
+
+# Push ingest (POST /api/ingest) - колко upload-а се парсват едновременно
+# във всеки worker; над лимита клиентът получава 503 + Retry-After
+INGEST_CONCURRENCY = int(os.getenv('METRICS_INGEST_CONCURRENCY', '2'))
+INGEST_RETRY_AFTER = int(os.getenv('METRICS_INGEST_RETRY_AFTER', '5'))
+_ingest_slots = threading.BoundedSemaphore(max(INGEST_CONCURRENCY, 1))
+
+# Parse jobs (POST /api/parse) - process pool на всеки web worker
+JOB_WORKERS = int(os.getenv('METRICS_JOB_WORKERS', '1'))
+jobs = JobManager(HISTORY_DIR, ROBOT_RESULTS_DIR, workers=JOB_WORKERS)
+
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+
+# ============================================================================
+# INSTRUMENTATION
+# ============================================================================
+
+@app.before_request
+def start_request_instrumentation():
+    request.environ['metrics.started'] = time.perf_counter()
+    start_request_timings()
+    if profiler:
+        request.environ['metrics.samples'] = profiler.begin()
+
+
+@app.after_request
+def finish_request_instrumentation(response):
+    started = request.environ.get('metrics.started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+
+    REGISTRY.inc('rf_metrics_http_requests_total', route=route, method=request.method,
+                 status=response.status_code)
+    REGISTRY.observe('rf_metrics_http_request_duration_seconds', elapsed, route=route,
+                     method=request.method)
+    timings = pop_request_timings()
+    if TIMING_HEADERS:
+        response.headers['Server-Timing'] = server_timing_header(timings, elapsed)
+    if profiler and 'metrics.samples' in request.environ:
+        profile = profiler.end(request.environ['metrics.samples'], elapsed,
+                               f"{request.method} {request.full_path.rstrip('?')}")
+        if profile:
+            print(f"🐢 Slow request {request.method} {request.path} ({elapsed * 1000:.0f}ms), "
+                  f"profile: {profile}")
+    REGISTRY.flush()
+    return response
+
+
+# ============================================================================
+# NAMESPACES
+# ============================================================================
+
+@app.before_request
+def resolve_namespace():
+    """?ns= -> g.namespace/g.parser; непознат namespace се създава само от ingest"""
+    if request.endpoint is None or request.endpoint in NAMESPACE_FREE_ENDPOINTS:
+        return None
+    try:
+        g.namespace = validate_namespace(request.args.get('ns') or NAMESPACE)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    g.parser = namespaces.get(g.namespace, create=request.endpoint in NAMESPACE_CREATING_ENDPOINTS)
+    if g.parser is None:
+        return jsonify({'error': f'Namespace not found: {g.namespace}'}), 404
+
+
+@app.context_processor
+def namespace_context():
+    """Namespace-ът за линковете в templates (None за default)"""
+    namespace = g.get('namespace')
+    if namespace is None:
+        # Страници без namespace (dashboard) - невалиден ?ns= се игнорира
+        try:
+            namespace = validate_namespace(request.args.get('ns') or NAMESPACE)
+        except ValueError:
+            namespace = None
+    return {'namespace': namespace if namespace and namespace != NAMESPACE else None}
+
+
+# ============================================================================
+# RESPONSE CACHING
+# ============================================================================
+
+def _cache_get(key):
+    with _response_cache_lock:
+        cached = _response_cache.get(key)
+        if cached is not None:
+            _response_cache.move_to_end(key)
+        return cached
+
+
+def _cache_put(key, value):
+    with _response_cache_lock:
+        _response_cache[key] = value
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
+
+def _not_modified(etag: str, last_modified) -> bool:
+    """Conditional GET - If-None-Match има предимство пред If-Modified-Since"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified and request.if_modified_since:
+        return request.if_modified_since >= last_modified
+    return False
+
+
+def cached_api(immutable: bool = False):
+    """
+    ETag/Last-Modified + memoize на успешните JSON отговори.
+
+    Обикновените routes зависят от history generation-а (сменя се при
+    ingest/delete/clear) и клиентът ги валидира при всяка заявка.
+    immutable=True е за /api/runs/<run_id> - съдържанието на run се
+    променя само от compactor-а, затова ETag е run_id + retention нивото.
+    Отговорът се кешира дълго само ако retention политиката на namespace
+    вече не може да свие run-а; иначе клиентът го валидира всеки път.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if immutable:
+                run_id = kwargs['run_id']
+                # Изтрит run не трябва да се връща от кеша, свит - с тестовете си
+                tier = parser.store.run_tier(run_id)
+                etag, last_modified = f'{run_id}-{tier}', None
+                if tier and not namespaces.retention(g.namespace, RETENTION).may_compact(tier):
+                    cache_control = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+                else:
+                    cache_control = 'no-cache'
+                key = (g.namespace, request.endpoint, run_id, tier,
+                       tuple(sorted(request.args.items(multi=True))))
+                fresh = tier is not None
+            else:
+                generation, modified = parser.generation.current()
+                etag = f'g{generation}'
+                last_modified = datetime.fromtimestamp(int(modified), tz=timezone.utc) if modified else None
+                cache_control = 'no-cache'
+                key = (g.namespace, generation, request.endpoint, tuple(sorted(kwargs.items())),
+                       tuple(sorted(request.args.items(multi=True))))
+                fresh = True
+
+            if fresh and _not_modified(etag, last_modified):
+                REGISTRY.inc('rf_metrics_cache_requests_total', cache='response', result='not_modified')
+                response = app.response_class(status=304)
+            else:
+                cached = _cache_get(key) if fresh else None
+                REGISTRY.inc('rf_metrics_cache_requests_total', cache='response',
+                             result='miss' if cached is None else 'hit')
+                if cached is None:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    _cache_put(key, (response.get_data(), response.mimetype))
+                else:
+                    response = app.response_class(cached[0], mimetype=cached[1])
+
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = cache_control
+            return response
+        return wrapper
+    return decorator
 
 
 # ============================================================================
@@ -36,7 +260,8 @@ def dashboard():
 @app.route('/run/<run_id>')
 def run_details(run_id):
     """Детайли за конкретен run"""
-    run = parser.get_run_by_id(run_id)
+    # Тестовете се зареждат от страницата през /api/runs/<run_id>/tests
+    run = parser.get_run_header(run_id)
     if not run:
         return "Run not found", 404
     return render_template('run_details.html', run=run)
@@ -104,24 +329,56 @@ def serve_robot_files(filename):
 
 @app.route('/health')
 def health():
-    """Health check endpoint"""
+    """Health check endpoint - проверява и че историята (на METRICS_NAMESPACE) се чете"""
+    # ?ns= не се взема предвид - health е за service-а, не за namespace
+    namespace = NAMESPACE if namespaces.exists(NAMESPACE) else DEFAULT_NAMESPACE
+    try:
+        health_parser = namespaces.get(namespace)
+        total_runs = health_parser.count_runs()
+    except Exception as e:
+        return jsonify({
+            'status': 'unhealthy',
+            'timestamp': datetime.now().isoformat(),
+            'service': 'metrics-dashboard',
+            'error': str(e)
+        }), 503
+
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'service': 'metrics-dashboard'
+        'service': 'metrics-dashboard',
+        'namespace': namespace,
+        'history_backend': health_parser.store.name,
+        'total_runs': total_runs
     })
 
 
-@app.route('/api/status')
-def api_status():
-    """API status информация"""
-    runs = parser.get_all_runs()
-    latest_run = runs[0] if runs else None
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus метрики на всички процеси на service-а (workers + ingest)"""
+    for namespace in namespaces.names():
+        namespace_parser = namespaces.get(namespace)
+        if namespace_parser is not None:
+            REGISTRY.set('rf_metrics_history_runs', namespace_parser.count_runs(), namespace=namespace)
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
-    return jsonify({
+
+@app.route('/api/ingest/status')
+def api_ingest_status():
+    """Статус на ingest service-а (queue depth, latency на последния ingest)"""
+    status = read_ingest_status(HISTORY_DIR)
+    if status is None:
+        return jsonify({'error': 'Ingest service status not available'}), 404
+    return jsonify(status)
+
+
+def status_payload(latest_run, total_runs: int) -> dict:
+    """Payload на /api/status от summary на последния run"""
+    return {
         'status': 'operational',
         'timestamp': datetime.now().isoformat(),
-        'total_runs': len(runs),
+        'namespace': g.namespace,
+        'total_runs': total_runs,
         'latest_run': {
             'run_id': latest_run['run_id'],
             'timestamp': latest_run['timestamp'],
@@ -132,34 +389,136 @@ def api_status():
         'pass_rate': latest_run['summary']['pass_rate'] if latest_run else 0,
         'avg_duration': latest_run['duration'] if latest_run else 0,
         'last_run': latest_run['timestamp'] if latest_run else 'N/A'
+    }
+
+
+def trends_payload(runs: list) -> dict:
+    """Payload на /api/trends от summaries (newest first)"""
+    return {
+        'runs': [r['run_id'] for r in runs],
+        'timestamps': [r['timestamp'] for r in runs],
+        'totals': [r['summary']['total'] for r in runs],
+        'passed': [r['summary']['passed'] for r in runs],
+        'failed': [r['summary']['failed'] for r in runs],
+        'pass_rates': [r['summary']['pass_rate'] for r in runs],
+        'durations': [r['duration'] for r in runs]
+    }
+
+
+def regressions_payload(regressions: list) -> dict:
+    """Payload на /api/duration-regressions (added_seconds - общо добавено време)"""
+    return {
+        'total': len(regressions),
+        'added_seconds': round(sum(r['added_seconds'] for r in regressions), 3),
+        'tests': regressions
+    }
+
+
+@app.route('/api/events')
+def api_events():
+    """
+    SSE stream със събитията от историята (run_ingested, runs_ingested,
+    run_deleted, history_cleared). Без Last-Event-ID започва от текущия
+    generation, т.е. без replay на стари събития. Когато worker-ът вече
+    държи EVENTS_MAX_STREAMS streams - 503 с Retry-After.
+    """
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_id')
+    try:
+        last_id = int(last_id) if last_id else parser.events.last_id()
+    except ValueError:
+        return jsonify({'error': f'Invalid Last-Event-ID: {last_id}'}), 400
+
+    if not _event_slots.acquire(blocking=False):
+        response = Response(f"retry: {EVENTS_RETRY_AFTER * 1000}\n\n", status=503,
+                            mimetype='text/event-stream')
+        response.headers['Retry-After'] = str(EVENTS_RETRY_AFTER)
+        return response
+
+    def stream(last_id):
+        yield f"retry: 3000\nid: {last_id}\n\n"
+        cursor = None
+        started = last_beat = time.monotonic()
+        while time.monotonic() - started < EVENTS_STREAM_SECONDS:
+            # stat на generation файла е евтин - журналът се чете само при промяна
+            if parser.events.last_id() != last_id:
+                events, cursor = parser.events.read_since(last_id, cursor)
+                for event in events:
+                    last_id = event['id']
+                    yield (f"id: {event['id']}\nevent: {event['type']}\n"
+                           f"data: {json.dumps(event['data'])}\n\n")
+                if not events:
+                    # Bump без събитие (напр. make clean-history)
+                    last_id = parser.events.last_id()
+                    yield f"id: {last_id}\nevent: history_changed\ndata: {{}}\n\n"
+                last_beat = time.monotonic()
+            elif time.monotonic() - last_beat >= EVENTS_HEARTBEAT:
+                yield ": heartbeat\n\n"
+                last_beat = time.monotonic()
+            time.sleep(EVENTS_POLL_INTERVAL)
+
+    response = Response(stream_with_context(stream(last_id)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Слотът се освобождава когато сървърът затвори отговора (край или disconnect)
+    response.call_on_close(_event_slots.release)
+    return response
+
+
+@app.route('/api/namespaces')
+def api_namespaces():
+    """
+    Всички namespaces с броя runs и последния run - обобщение през
+    проектите/branches (?project=&branch=&environment= филтрират).
+    """
+    filters = {part: request.args.get(part) for part in ('project', 'branch', 'environment')
+               if request.args.get(part)}
+    summaries = []
+    for namespace in namespaces.names():
+        summary = namespaces.summary(namespace)
+        if summary and all(summary[part] == value for part, value in filters.items()):
+            summaries.append(summary)
+
+    return jsonify({
+        'default': NAMESPACE,
+        'total': len(summaries),
+        'total_runs': sum(s['total_runs'] for s in summaries),
+        'namespaces': summaries
     })
 
 
+@app.route('/api/status')
+@cached_api()
+def api_status():
+    """API status информация"""
+    latest = parser.list_runs(limit=1)
+    return jsonify(status_payload(latest[0] if latest else None, parser.count_runs()))
+
+
 @app.route('/api/runs')
+@cached_api()
 def api_runs():
-    """Връща всички runs"""
+    """Runs newest first, на страници (?limit=&cursor=<next_cursor>)"""
     limit = request.args.get('limit', type=int, default=50)
-    runs = parser.get_all_runs()[:limit]
-
-    # Simplified version за списък
-    simplified = [{
-        'run_id': run['run_id'],
-        'timestamp': run['timestamp'],
-        'suite_name': run['suite_name'],
-        'duration': run['duration'],
-        'summary': run['summary']
-    } for run in runs]
+    try:
+        runs, next_cursor = parser.list_runs_page(limit=max(limit, 1),
+                                                  cursor=request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     return jsonify({
         'total': len(runs),
-        'runs': simplified
+        'runs': runs,
+        'next_cursor': next_cursor
     })
 
 
 @app.route('/api/runs/<run_id>')
+@cached_api(immutable=True)
 def api_run_details(run_id):
-    """Детайли за конкретен run"""
-    run = parser.get_run_by_id(run_id)
+    """Детайли за конкретен run (?tests=false - без тестовете)"""
+    if request.args.get('tests', 'true').lower() in ('false', '0'):
+        run = parser.get_run_header(run_id)
+    else:
+        run = parser.get_run_by_id(run_id)
 
     if not run:
         return jsonify({'error': 'Run not found'}), 404
@@ -167,35 +526,285 @@ def api_run_details(run_id):
     return jsonify(run)
 
 
+def list_arg(name: str):
+    """Comma-separated query параметър -> списък (или None)"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+@app.route('/api/runs/<run_id>/tests')
+@cached_api(immutable=True)
+def api_run_tests(run_id):
+    """
+    Тестовете на run на страници: ?offset=&limit=, филтри status= (може
+    FAIL,SKIP), tag=, suite= (с под-suites), q= (по име), sort=index|
+    duration|name, fields= и max_message= (съкращава съобщенията)
+    """
+    try:
+        page = parser.get_run_tests(
+            run_id,
+            offset=max(request.args.get('offset', type=int, default=0), 0),
+            limit=max(request.args.get('limit', type=int, default=100), 1),
+            statuses=list_arg('status'),
+            tag=request.args.get('tag'),
+            suite=request.args.get('suite'),
+            q=request.args.get('q'),
+            sort=request.args.get('sort', 'index'),
+            fields=list_arg('fields'),
+            max_message=request.args.get('max_message', type=int)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if page is None:
+        return jsonify({'error': 'Run not found'}), 404
+    return jsonify(page)
+
+
+@app.route('/api/runs/<run_id>/failures')
+@cached_api(immutable=True)
+def api_run_failures(run_id):
+    """FAIL тестовете на run, групирани по failure signature (най-големите първи)"""
+    clusters = parser.get_failure_clusters(run_id)
+    if clusters is None:
+        return jsonify({'error': 'Run not found'}), 404
+    return jsonify(clusters)
+
+
+def time_arg(name: str):
+    """Query параметър за време - epoch секунди или ISO 8601"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid '{name}' parameter: {value}")
+
+
 @app.route('/api/trends')
+@cached_api()
 def api_trends():
-    """Trend данни за графики"""
+    """Trend данни за графики (?from=&to=&buckets=&mode=avg|lttb за time-range)"""
+    if any(arg in request.args for arg in ('from', 'to', 'buckets')):
+        try:
+            series = parser.get_trend_series(
+                start=time_arg('from'),
+                end=time_arg('to'),
+                buckets=request.args.get('buckets', type=int, default=100),
+                mode=request.args.get('mode', 'avg')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(series)
+
     runs_count = request.args.get('runs', type=int, default=20)
-    runs = parser.get_all_runs()[:runs_count]
+    return jsonify(trends_payload(parser.list_runs(limit=runs_count)))
 
-    if not runs:
-        return jsonify({
-            'runs': [],
-            'timestamps': [],
-            'totals': [],
-            'passed': [],
-            'failed': [],
-            'pass_rates': [],
-            'durations': []
-        })
+
+def stat_history(kind: str, name: str):
+    """Серията на tag/suite за ?from=&to=&buckets=&mode=avg|lttb"""
+    try:
+        series = parser.get_stat_series(
+            kind, name,
+            start=time_arg('from'),
+            end=time_arg('to'),
+            buckets=request.args.get('buckets', type=int, default=100),
+            mode=request.args.get('mode', 'avg')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(series)
+
+
+@app.route('/api/tags/<path:tag>/history')
+@cached_api()
+def api_tag_history(tag):
+    """Pass/fail/skip и време на един tag през историята"""
+    return stat_history('tag', tag)
+
+
+@app.route('/api/suites/<path:suite>/history')
+@cached_api()
+def api_suite_history(suite):
+    """Pass/fail/skip и време на един suite (пълното име, напр. Root.Login) през историята"""
+    return stat_history('suite', suite)
+
+
+@app.route('/api/rollups')
+@cached_api()
+def api_rollups():
+    """Daily/weekly rollups на runs, свити от retention политиката (?period=day|week&from=&to=)"""
+    try:
+        rollups = parser.get_rollups(
+            period=request.args.get('period', 'day'),
+            start=time_arg('from'),
+            end=time_arg('to')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     return jsonify({
-        'runs': [r['run_id'] for r in runs],
-        'timestamps': [r['timestamp'] for r in runs],
-        'totals': [r['summary']['total'] for r in runs],
-        'passed': [r['summary']['passed'] for r in runs],
-        'failed': [r['summary']['failed'] for r in runs],
-        'pass_rates': [r['summary']['pass_rate'] for r in runs],
-        'durations': [r['duration'] for r in runs]
+        'total': len(rollups),
+        'rollups': rollups
+    })
+
+
+@app.route('/api/failures')
+@cached_api()
+def api_failures():
+    """Най-честите failure signatures в ?from=&to= (epoch или ISO 8601), ?limit="""
+    try:
+        signatures = parser.get_failure_signatures(
+            start=time_arg('from'),
+            end=time_arg('to'),
+            limit=max(request.args.get('limit', type=int, default=20), 1)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'total': len(signatures),
+        'signatures': signatures
+    })
+
+
+@app.route('/api/failures/<signature>')
+@cached_api()
+def api_signature_failures(signature):
+    """Тестовете (по runs, newest first) с даден failure signature"""
+    limit = max(request.args.get('limit', type=int, default=100), 1)
+    failures = parser.get_signature_failures(signature, limit=limit)
+    if failures is None:
+        return jsonify({'error': 'Signature not found'}), 404
+    return jsonify(failures)
+
+
+@app.route('/api/runs/<run_id>/keywords')
+@cached_api(immutable=True)
+def api_run_keywords(run_id):
+    """Keyword профилът на run (METRICS_KEYWORD_PROFILE=true при парсването)"""
+    profile = parser.get_keyword_profile(run_id)
+    if profile is None:
+        return jsonify({'error': 'Run not found'}), 404
+    return jsonify(profile)
+
+
+@app.route('/api/keywords/hot')
+@cached_api()
+def api_hot_keywords():
+    """Keywords с най-много време - ?run_id= или ?from=&to=, ?sort=self_time|total|calls|p95&limit="""
+    try:
+        keywords = parser.get_hot_keywords(
+            start=time_arg('from'),
+            end=time_arg('to'),
+            sort=request.args.get('sort', 'self_time'),
+            limit=max(request.args.get('limit', type=int, default=20), 1),
+            run_id=request.args.get('run_id')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if keywords is None:
+        return jsonify({'error': 'Run not found'}), 404
+
+    return jsonify({
+        'total': len(keywords),
+        'keywords': keywords
+    })
+
+
+@app.route('/api/keywords/trend')
+@cached_api()
+def api_keyword_trend():
+    """Времената на един keyword по runs (?name=&owner=&from=&to=), oldest first"""
+    name = request.args.get('name')
+    if not name:
+        return jsonify({'error': 'name parameter required'}), 400
+    owner = request.args.get('owner', '')
+    try:
+        points = parser.get_keyword_trend(name, owner=owner, start=time_arg('from'), end=time_arg('to'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'keyword': keyword_key(name, owner),
+        'name': name,
+        'owner': owner,
+        'total': len(points),
+        'points': points
     })
 
 
+# Секции на /api/dashboard (?fields=status,trends,...)
+DASHBOARD_FIELDS = ('status', 'trends', 'tag_stats', 'flaky_tests', 'slowest_tests',
+                    'duration_regressions', 'recent_runs')
+
+
+@app.route('/api/dashboard')
+@cached_api()
+def api_dashboard():
+    """
+    Всички данни за dashboard-а с една заявка.
+
+    Summaries се четат веднъж (за status, trends и recent runs), а
+    последният run се зарежда най-много веднъж - с тестовете само ако
+    е поискан slowest_tests.
+    """
+    fields = request.args.get('fields')
+    fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else list(DASHBOARD_FIELDS)
+    unknown = [f for f in fields if f not in DASHBOARD_FIELDS]
+    if unknown:
+        return jsonify({
+            'error': f"Unknown field(s): {', '.join(unknown)} (expected: {', '.join(DASHBOARD_FIELDS)})"
+        }), 400
+
+    trend_runs = request.args.get('runs', type=int, default=20)
+    recent_limit = request.args.get('limit', type=int, default=10)
+    flaky_runs = request.args.get('flaky_runs', type=int, default=10)
+
+    runs = parser.list_runs(limit=max(trend_runs, recent_limit, 1))
+    latest_summary = runs[0] if runs else None
+
+    latest_run = None
+    if latest_summary and 'slowest_tests' in fields:
+        latest_run = parser.get_run_by_id(latest_summary['run_id'])
+    elif latest_summary and 'tag_stats' in fields:
+        latest_run = parser.store.get_run(latest_summary['run_id'], include_tests=False)
+
+    data = {}
+    if 'status' in fields:
+        data['status'] = status_payload(latest_summary, parser.count_runs())
+    if 'trends' in fields:
+        data['trends'] = trends_payload(runs[:trend_runs])
+    if 'tag_stats' in fields:
+        data['tag_stats'] = {
+            'run_id': latest_run['run_id'] if latest_run else None,
+            'tags': latest_run.get('tag_stats', []) if latest_run else []
+        }
+    if 'flaky_tests' in fields:
+        flaky = parser.get_flaky_tests(runs_count=flaky_runs)
+        data['flaky_tests'] = {'total': len(flaky), 'tests': flaky}
+    if 'slowest_tests' in fields:
+        tests = latest_run.get('tests', []) if latest_run else []
+        slowest = sorted(tests, key=lambda x: x['duration'], reverse=True)[:10]
+        data['slowest_tests'] = {'total': len(slowest), 'tests': slowest}
+    if 'duration_regressions' in fields:
+        data['duration_regressions'] = regressions_payload(parser.get_duration_regressions(limit=10))
+    if 'recent_runs' in fields:
+        recent = runs[:recent_limit]
+        data['recent_runs'] = {'total': len(recent), 'runs': recent}
+
+    return jsonify(data)
+
+
 @app.route('/api/flaky-tests')
+@cached_api()
 def api_flaky_tests():
     """Flaky тестове"""
     runs_count = request.args.get('runs', type=int, default=10)
@@ -207,7 +816,79 @@ def api_flaky_tests():
     })
 
 
+@app.route('/api/duration-regressions')
+@cached_api()
+def api_duration_regressions():
+    """
+    Тестове, значимо по-бавни от обичайното си време (медиана/p95 на
+    последните изпълнения). ?run_id= - само флагнатите в този run.
+    """
+    regressions = parser.get_duration_regressions(
+        run_id=request.args.get('run_id'),
+        min_ratio=request.args.get('min_ratio', type=float),
+        min_score=request.args.get('min_score', type=float),
+        limit=request.args.get('limit', type=int, default=50)
+    )
+
+    return jsonify(regressions_payload(regressions))
+
+
+@app.route('/api/durations')
+@cached_api()
+def api_durations():
+    """
+    Очакваното време на всеки тест (EWMA от историята) и резултатите му в
+    последните ?window= изпълнения - по тях test_runner.py подбира и
+    нарежда тестовете за pabot. ?tag= филтрира по tag-овете в последния run.
+    """
+    tests = parser.get_expected_durations(
+        tag=request.args.get('tag'),
+        window=request.args.get('window', type=int, default=10)
+    )
+
+    return jsonify({
+        'total': len(tests),
+        'tests': tests
+    })
+
+
+@app.route('/api/tests')
+@cached_api()
+def api_tests():
+    """Per-test агрегати през цялата история"""
+    window = request.args.get('window', type=int, default=10)
+    limit = request.args.get('limit', type=int, default=100)
+    tests = parser.get_test_aggregates(
+        window=window,
+        query=request.args.get('q'),
+        sort=request.args.get('sort', 'failed'),
+        limit=limit
+    )
+
+    return jsonify({
+        'total': len(tests),
+        'tests': tests
+    })
+
+
+@app.route('/api/tests/history')
+@cached_api()
+def api_test_history():
+    """История на един тест (?key=<suite path>.<test name>)"""
+    key = request.args.get('key')
+    if not key:
+        return jsonify({'error': 'key parameter required'}), 400
+
+    limit = request.args.get('limit', type=int, default=50)
+    history = parser.get_test_history(key, limit=limit)
+    if not history:
+        return jsonify({'error': 'Test not found'}), 404
+
+    return jsonify(history)
+
+
 @app.route('/api/slowest-tests')
+@cached_api()
 def api_slowest_tests():
     """Най-бавни тестове"""
     run_id = request.args.get('run_id')
@@ -220,13 +901,13 @@ def api_slowest_tests():
 
 
 @app.route('/api/tag-stats')
+@cached_api()
 def api_tag_stats():
     """Статистики по тагове от последния run"""
-    runs = parser.get_all_runs()
-    if not runs:
+    latest_run = parser.get_latest_run()
+    if not latest_run:
         return jsonify({'tags': []})
 
-    latest_run = runs[0]
     return jsonify({
         'run_id': latest_run['run_id'],
         'tags': latest_run.get('tag_stats', [])
@@ -234,13 +915,13 @@ def api_tag_stats():
 
 
 @app.route('/api/suite-stats')
+@cached_api()
 def api_suite_stats():
     """Статистики по suites от последния run"""
-    runs = parser.get_all_runs()
-    if not runs:
+    latest_run = parser.get_latest_run()
+    if not latest_run:
         return jsonify({'suites': []})
 
-    latest_run = runs[0]
     return jsonify({
         'run_id': latest_run['run_id'],
         'suites': latest_run.get('suite_stats', [])
@@ -249,29 +930,91 @@ def api_suite_stats():
 
 @app.route('/api/parse', methods=['POST'])
 def api_parse():
-    """Force парсване на output.xml"""
+    """
+    Парсване на output.xml като background job - връща веднага job_id;
+    състоянието и прогресът са на /api/jobs/<job_id>. Повторно подаване
+    на непроменен файл връща същия job (coalesced), докато run-ът му е в историята.
+    """
     xml_path = Path(ROBOT_RESULTS_DIR) / 'output.xml'
 
-    if not xml_path.exists():
-        return jsonify({'error': 'output.xml not found'}), 404
-
     try:
-        metrics = parser.parse_output_xml(xml_path)
-        if metrics:
-            parser.save_metrics(metrics)
-            return jsonify({
-                'status': 'success',
-                'run_id': metrics['run_id'],
-                'message': 'Metrics parsed and saved'
-            })
-        else:
-            return jsonify({'error': 'Failed to parse XML'}), 500
-
+        job = jobs.submit(xml_path, g.namespace, parser.store)
+    except FileNotFoundError:
+        return jsonify({'error': 'output.xml not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    return jsonify({
+        'status': 'accepted',
+        **job,
+        'url': f"/api/jobs/{job['job_id']}"
+    }), 202
+
+
+@app.route('/api/jobs')
+def api_jobs():
+    """Последните parse jobs, newest first (?limit=)"""
+    recent = jobs.recent(limit=max(request.args.get('limit', type=int, default=20), 1))
+    return jsonify({
+        'total': len(recent),
+        'jobs': recent
+    })
+
+
+@app.route('/api/jobs/<job_id>')
+def api_job(job_id):
+    """Състояние (queued | running | done | failed) и прогрес на parse job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+
+@app.route('/api/ingest', methods=['POST'])
+def api_ingest():
+    """
+    Push на output.xml от CI агент (?ns=project/branch/env).
+
+    Тялото е output.xml (Content-Encoding: gzip по избор, може и chunked) и
+    се парсва докато пристига - без да се буферира целият файл. Run ID-то
+    е sha256 на съдържанието, така че повторен push не създава нов run.
+    """
+    encoding = (request.headers.get('Content-Encoding') or 'identity').lower()
+    if encoding not in ('identity', 'gzip'):
+        return jsonify({'error': f'Unsupported Content-Encoding: {encoding} (expected: gzip)'}), 415
+
+    if not _ingest_slots.acquire(blocking=False):
+        REGISTRY.inc('rf_metrics_ingest_requests_total', result='rejected')
+        response = jsonify({'error': 'Too many concurrent ingests, retry later'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(INGEST_RETRY_AFTER)
+        return response
+
+    try:
+        stream = request.stream
+        if encoding == 'gzip':
+            stream = gzip.GzipFile(fileobj=stream, mode='rb')
+        # Прекъснат upload или невалиден gzip/XML -> run_id None
+        run_id, created = parser.ingest_stream(stream)
+    finally:
+        _ingest_slots.release()
+
+    if not run_id:
+        REGISTRY.inc('rf_metrics_ingest_requests_total', result='error')
+        return jsonify({'error': 'Failed to parse XML'}), 400
+
+    REGISTRY.inc('rf_metrics_ingest_requests_total', result='created' if created else 'duplicate')
+    return jsonify({
+        'status': 'success',
+        'namespace': g.namespace,
+        'run_id': run_id,
+        'created': created,
+        'message': 'Metrics parsed and saved' if created else 'Run already in history'
+    }), 201 if created else 200
+
 
 @app.route('/api/compare')
+@cached_api()
 def api_compare():
     """Сравнява два runs"""
     run1_id = request.args.get('run1')
@@ -314,13 +1057,10 @@ def api_compare():
 @app.route('/api/delete/<run_id>', methods=['DELETE'])
 def api_delete_run(run_id):
     """Изтрива run от историята"""
-    file_path = Path(HISTORY_DIR) / f"{run_id}.json"
-
-    if not file_path.exists():
-        return jsonify({'error': 'Run not found'}), 404
-
     try:
-        file_path.unlink()
+        if not parser.delete_run(run_id):
+            return jsonify({'error': 'Run not found'}), 404
+
         return jsonify({
             'status': 'success',
             'message': f'Run {run_id} deleted'
@@ -333,25 +1073,12 @@ def api_delete_run(run_id):
 def clear_data():
     """Clear all historical metrics data"""
     try:
-        history_path = Path(HISTORY_DIR)
-        deleted_count = 0
-
-        # Изтрий само JSON файловете (директорията е mounted volume)
-        if history_path.exists():
-            for json_file in history_path.glob('*.json'):
-                try:
-                    json_file.unlink()
-                    deleted_count += 1
-                except Exception as e:
-                    print(f"Warning: Could not delete {json_file}: {e}")
-
-        # Reload parser за да почне с празна история
-        global parser
-        parser = MetricsParser(ROBOT_RESULTS_DIR, HISTORY_DIR)
+        # Директорията е mounted volume - чистим само съдържанието на store-а
+        deleted_count = parser.clear_history()
 
         return jsonify({
             'success': True,
-            'message': f'Cleared {deleted_count} history file(s)',
+            'message': f'Cleared {deleted_count} run(s)',
             'timestamp': datetime.now().isoformat()
         })
     except Exception as e:
@@ -362,10 +1089,11 @@ def clear_data():
 
 
 @app.route('/api/recent-runs')
+@cached_api()
 def api_recent_runs():
     """Recent test runs"""
     limit = request.args.get('limit', type=int, default=10)
-    runs = parser.get_all_runs()[:limit]
+    runs = parser.list_runs(limit=limit)
 
     return jsonify({
         'runs': [{
@@ -381,14 +1109,13 @@ def api_recent_runs():
 
 
 @app.route('/api/tag/<tag>')
+@cached_api()
 def api_tag_details(tag):
     """Tag details - показва всички тестове за даден tag"""
-    runs = parser.get_all_runs()
-    if not runs:
+    latest_run = parser.get_latest_run(include_tests=True)
+    if not latest_run:
         return jsonify({'tests': [], 'test_count': 0, 'pass_rate': 0})
 
-    latest_run = runs[0]
-
     # Намери тестове с този tag
     tests = []
     if 'tests' in latest_run:
@@ -446,6 +1173,7 @@ if __name__ == '__main__':
     print("=" * 60)
     print(f"Results Dir: {ROBOT_RESULTS_DIR}")
     print(f"History Dir: {HISTORY_DIR}")
+    print(f"Namespace: {NAMESPACE}")
     print(f"Dashboard: http://localhost:5000")
     print("=" * 60)
 
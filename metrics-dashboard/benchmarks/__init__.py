@@ -0,0 +1,14 @@
+"""
+Robot Framework Metrics - Benchmarks
+Синтетични output.xml / history данни и benchmarks на metrics pipeline-а
+
+    python3 -m benchmarks --preset small --output bench.json --baseline baseline.json
+    python3 -m benchmarks.synthetic xml /tmp/out --suites 50 --tests 40
+"""
+import sys
+from pathlib import Path
+
+# Модулите на dashboard-а (metrics_parser, app, ...) са top-level в metrics-dashboard/
+DASHBOARD_DIR = Path(__file__).resolve().parent.parent
+if str(DASHBOARD_DIR) not in sys.path:
+    sys.path.insert(0, str(DASHBOARD_DIR))
@@ -0,0 +1,166 @@
+"""
+Robot Framework Metrics - Benchmark runner
+Измерване (latency percentiles, throughput, peak RSS), JSON отчет и сравнение с baseline
+"""
+import gc
+import json
+import math
+import time
+import resource
+import platform
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+REPORT_VERSION = 1
+
+# Метрики, по които се сравнява с baseline (по-малко е по-добре)
+COMPARED_METRICS = ('p50_ms', 'p99_ms', 'peak_rss_mb')
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile на сортиран списък"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS на текущия процес (ru_maxrss е в KB на Linux, в байтове на macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if platform.system() == 'Darwin':
+        peak /= 1024
+    return round(peak / 1024, 1)
+
+
+def measure(fn: Callable, repeat: int = 20, warmup: int = 1, budget: float = 10.0,
+            setup: Optional[Callable] = None, items: int = 1) -> Dict:
+    """
+    Извиква fn до `repeat` пъти (минимум 3, ако budget секунди изтекат
+    по-рано) и връща статистиките. setup() се вика преди всяко извикване и
+    не се мери; items е броят обработени елементи на едно извикване (тестове,
+    runs, ...) за items_per_sec.
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+
+    latencies = []
+    deadline = time.perf_counter() + budget
+    gc.collect()
+    for index in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+        if index >= 2 and time.perf_counter() > deadline:
+            break
+
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'runs': len(latencies),
+        'mean_ms': round(total / len(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'min_ms': round(latencies[0] * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+        'ops_per_sec': round(len(latencies) / total, 2) if total else None,
+        'items_per_sec': round(items * len(latencies) / total, 1) if total else None,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def new_report(config: Dict) -> Dict:
+    return {
+        'version': REPORT_VERSION,
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': config,
+        'benchmarks': {}
+    }
+
+
+def save_report(report: Dict, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def load_report(path) -> Dict:
+    with open(path, 'r') as f:
+        report = json.load(f)
+    if report.get('version') != REPORT_VERSION:
+        raise ValueError(f"{path}: unsupported report version {report.get('version')}")
+    return report
+
+
+def compare_reports(report: Dict, baseline: Dict, threshold: float = 0.2,
+                    names: Optional[Iterable[str]] = None) -> List[Dict]:
+    """
+    Сравнява benchmarks от baseline-а с текущия отчет.
+
+    Връща по ред за всеки benchmark/метрика с ratio = current / baseline;
+    regression=True, ако ratio > 1 + threshold. Benchmark, който е минал
+    в baseline-а, но липсва или е с грешка в текущия отчет, е регресия
+    (metric 'missing'/'error'). names ограничава сравнението до избраните
+    benchmarks (--only).
+    """
+    selected = set(names) if names is not None else None
+    rows = []
+    for name, previous in baseline['benchmarks'].items():
+        if 'error' in previous or (selected is not None and name not in selected):
+            continue
+        current = report['benchmarks'].get(name)
+        if not current or 'error' in current:
+            rows.append({
+                'benchmark': name,
+                'metric': 'error' if current else 'missing',
+                'baseline': None,
+                'current': None,
+                'ratio': None,
+                'regression': True
+            })
+            continue
+        for metric in COMPARED_METRICS:
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            ratio = after / before
+            rows.append({
+                'benchmark': name,
+                'metric': metric,
+                'baseline': before,
+                'current': after,
+                'ratio': round(ratio, 3),
+                'regression': ratio > 1 + threshold
+            })
+    return rows
+
+
+def print_report(report: Dict):
+    print(f"\n{'benchmark':<44} {'runs':>5} {'p50 ms':>10} {'p99 ms':>10} "
+          f"{'ops/s':>10} {'rss MB':>8}")
+    for name, result in report['benchmarks'].items():
+        if 'error' in result:
+            print(f"{name:<44} ✗ {result['error']}")
+            continue
+        print(f"{name:<44} {result['runs']:>5} {result['p50_ms']:>10.2f} {result['p99_ms']:>10.2f} "
+              f"{result['ops_per_sec'] or 0:>10.1f} {result['peak_rss_mb']:>8.1f}")
+
+
+def print_comparison(rows: List[Dict]):
+    print(f"\n{'benchmark':<44} {'metric':<12} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for row in rows:
+        mark = '✗' if row['regression'] else '✓'
+        if row['ratio'] is None:
+            print(f"{row['benchmark']:<44} {row['metric']:<12} {'-':>10} {'-':>10} {'-':>7} {mark}")
+            continue
+        print(f"{row['benchmark']:<44} {row['metric']:<12} {row['baseline']:>10.2f} "
+              f"{row['current']:>10.2f} {row['ratio']:>7.2f} {mark}")
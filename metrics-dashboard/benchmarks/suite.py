@@ -0,0 +1,325 @@
+"""
+Robot Framework Metrics - Benchmark suite
+Benchmarks на парсера, history store-а и Flask routes върху синтетични данни
+"""
+import os
+import json
+import shutil
+import fnmatch
+import argparse
+import itertools
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from benchmarks.bench import (compare_reports, load_report, measure, new_report, print_comparison,
+                              print_report, save_report)
+from benchmarks.synthetic import generate_history, generate_output_xml, generate_pabot_results
+
+
+# output.xml (suites x tests) и history (runs x tests на run)
+PRESETS = {
+    'small': {'suites': 20, 'tests': 25, 'keyword_depth': 2, 'keywords': 3,
+              'history_runs': 1000, 'history_tests': 50, 'shards': 4},
+    'medium': {'suites': 50, 'tests': 40, 'keyword_depth': 3, 'keywords': 3,
+               'history_runs': 10000, 'history_tests': 100, 'shards': 8},
+    'large': {'suites': 100, 'tests': 100, 'keyword_depth': 3, 'keywords': 4,
+              'history_runs': 100000, 'history_tests': 100, 'shards': 16},
+}
+
+# GET routes през Flask test client-а; {run_id} и т.н. се попълват от историята
+ROUTES = (
+    '/',
+    '/run/{run_id}',
+    '/health',
+    '/api/status',
+    '/api/dashboard',
+    '/api/runs',
+    '/api/runs?limit=200',
+    '/api/runs/{run_id}',
+    '/api/runs/{run_id}?tests=false',
+    '/api/runs/{run_id}/tests?limit=100',
+    '/api/runs/{run_id}/tests?status=FAIL&sort=duration',
+    '/api/trends',
+    '/api/trends?from=0&buckets=100',
+    '/api/rollups',
+    '/api/flaky-tests',
+    '/api/tests',
+    '/api/tests/history?key={test_key}',
+    '/api/slowest-tests',
+    '/api/tag-stats',
+    '/api/suite-stats',
+    '/api/compare?run1={run_id}&run2={previous_run_id}',
+    '/api/recent-runs',
+    '/api/tag/{tag}',
+)
+
+FIXTURES_FILENAME = 'fixtures.json'
+
+
+# ----------------------------------------------------------------------
+# Fixtures
+# ----------------------------------------------------------------------
+
+def prepare_fixtures(workdir: Path, config: Dict, regenerate: bool = False) -> Dict:
+    """
+    Генерира output.xml, pabot shards и history в workdir. Ако workdir
+    вече има fixtures със същата конфигурация, те се преизползват.
+    """
+    marker = workdir / FIXTURES_FILENAME
+    if not regenerate and marker.exists():
+        with open(marker, 'r') as f:
+            fixtures = json.load(f)
+        if fixtures.get('config') == config:
+            print(f"⏭️  Reusing fixtures in {workdir}")
+            return fixtures
+
+    if workdir.exists():
+        shutil.rmtree(workdir)
+    workdir.mkdir(parents=True)
+
+    xml_options = {key: config[key] for key in ('tests', 'keyword_depth', 'keywords')}
+    print(f"🔄 Generating output.xml ({config['suites']} suites x {config['tests']} tests)...")
+    xml = generate_output_xml(workdir / 'results' / 'output.xml', suites=config['suites'],
+                              **xml_options)
+    print(f"🔄 Generating pabot results ({config['shards']} shards)...")
+    generate_pabot_results(workdir / 'pabot', shards=config['shards'], suites=config['suites'],
+                           **xml_options)
+    print(f"🔄 Generating history ({config['history_runs']} runs, {config['backend']})...")
+    history = generate_history(workdir / 'data' / 'history', runs=config['history_runs'],
+                               tests=config['history_tests'], backend=config['backend'])
+
+    fixtures = {
+        'config': config,
+        'workdir': str(workdir),
+        'results_dir': str(workdir / 'results'),
+        'data_dir': str(workdir / 'data'),
+        'history_dir': history['history_dir'],
+        'pabot_dir': str(workdir / 'pabot' / 'pabot_results'),
+        'output_xml': xml['path'],
+        'xml_tests': xml['tests'],
+        'xml_bytes': xml['bytes']
+    }
+    with open(marker, 'w') as f:
+        json.dump(fixtures, f, indent=2)
+    return fixtures
+
+
+def _environment(fixtures: Dict):
+    """Env-ът на dashboard-а за процеса на benchmark-а (преди import на app/parser)"""
+    os.environ['METRICS_DATA_DIR'] = fixtures['data_dir']
+    os.environ['ROBOT_RESULTS_DIR'] = fixtures['results_dir']
+    os.environ['METRICS_HISTORY_BACKEND'] = fixtures['config']['backend']
+    # Мерим самите handlers, а не кеша на отговорите
+    os.environ['METRICS_RESPONSE_CACHE_SIZE'] = '0'
+
+
+def _scratch_history(fixtures: Dict, name: str) -> str:
+    """Копие на историята за benchmarks, които пишат в нея"""
+    scratch = Path(fixtures['workdir']) / 'scratch' / name
+    if scratch.exists():
+        shutil.rmtree(scratch)
+    shutil.copytree(fixtures['history_dir'], scratch)
+    return str(scratch)
+
+
+# ----------------------------------------------------------------------
+# Benchmarks - всеки се изпълнява в отделен процес (peak RSS е негов)
+# ----------------------------------------------------------------------
+
+def bench_parse_output_xml(fixtures: Dict, options: Dict) -> Dict:
+    from metrics_parser import MetricsParser
+    parser = MetricsParser(fixtures['results_dir'], _scratch_history(fixtures, 'parse'))
+    xml_path = Path(fixtures['output_xml'])
+    return measure(lambda: parser.parse_output_xml(xml_path), items=fixtures['xml_tests'],
+                   **options)
+
+
+def bench_save_metrics(fixtures: Dict, options: Dict) -> Dict:
+    from metrics_parser import MetricsParser
+    parser = MetricsParser(fixtures['results_dir'], _scratch_history(fixtures, 'save'))
+    metrics = parser.parse_output_xml(Path(fixtures['output_xml']))
+    counter = itertools.count()
+    base = datetime.now().astimezone()
+    current = {}
+
+    def setup():
+        # Нов run, по-нов от цялата история (инкременталният път)
+        index = next(counter)
+        current['run'] = {**metrics, 'run_id': f'bench{index:07d}',
+                          'timestamp': (base + timedelta(minutes=index)).isoformat()}
+
+    return measure(lambda: parser.save_metrics(current['run']), setup=setup,
+                   items=fixtures['xml_tests'], **options)
+
+
+def bench_ingest_shards(fixtures: Dict, options: Dict) -> Dict:
+    from metrics_parser import MetricsParser
+    parser = MetricsParser(fixtures['results_dir'], _scratch_history(fixtures, 'shards'))
+
+    def setup():
+        # Слетият run е един и същ - трием го, за да се запише наново
+        for summary in parser.list_runs(limit=1):
+            parser.delete_run(summary['run_id'])
+
+    return measure(lambda: parser.ingest_batch(fixtures['pabot_dir'], merge_shards=True),
+                   setup=setup, items=fixtures['xml_tests'], **options)
+
+
+def _history_parser():
+    from metrics_parser import MetricsParser
+    return MetricsParser(os.environ['ROBOT_RESULTS_DIR'],
+                         os.path.join(os.environ['METRICS_DATA_DIR'], 'history'))
+
+
+def bench_get_all_runs(fixtures: Dict, options: Dict) -> Dict:
+    parser = _history_parser()
+    return measure(parser.get_all_runs, items=parser.count_runs(), **options)
+
+
+def bench_get_flaky_tests(fixtures: Dict, options: Dict) -> Dict:
+    parser = _history_parser()
+    return measure(lambda: parser.get_flaky_tests(runs_count=10), **options)
+
+
+def bench_get_trend_data(fixtures: Dict, options: Dict) -> Dict:
+    parser = _history_parser()
+    return measure(lambda: parser.get_trend_data(limit=20), **options)
+
+
+def bench_route(route: str, fixtures: Dict, options: Dict) -> Dict:
+    import app as dashboard
+    client = dashboard.app.test_client()
+
+    # dashboard.parser е proxy към parser-а на заявката - fixtures се четат от namespace-а директно
+    parser = dashboard.namespaces.get(dashboard.NAMESPACE)
+    runs = parser.list_runs(limit=2)
+    latest = parser.get_run_by_id(runs[0]['run_id'])
+    test = latest['tests'][0]
+    url = route.format(
+        run_id=runs[0]['run_id'],
+        previous_run_id=runs[-1]['run_id'],
+        test_key=f"{test['suite']}.{test['name']}" if test.get('suite') else test['name'],
+        tag=(test.get('tags') or ['none'])[0]
+    )
+
+    def call():
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} -> {response.status_code}")
+        response.get_data()
+
+    return measure(call, **options)
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    'parse_output_xml': bench_parse_output_xml,
+    'save_metrics': bench_save_metrics,
+    'ingest_batch[merge_shards]': bench_ingest_shards,
+    'get_all_runs': bench_get_all_runs,
+    'get_flaky_tests': bench_get_flaky_tests,
+    'get_trend_data': bench_get_trend_data,
+}
+BENCHMARKS.update({f'GET {route}': route for route in ROUTES})
+
+
+def run_benchmark(name: str, fixtures: Dict, options: Dict) -> Dict:
+    """Изпълнява един benchmark в текущия процес"""
+    _environment(fixtures)
+    target = BENCHMARKS[name]
+    try:
+        if isinstance(target, str):
+            return bench_route(target, fixtures, options)
+        return target(fixtures, options)
+    except Exception as e:
+        return {'error': f"{type(e).__name__}: {e}"}
+
+
+# ----------------------------------------------------------------------
+# CLI
+# ----------------------------------------------------------------------
+
+def select_benchmarks(patterns: List[str]) -> List[str]:
+    if not patterns:
+        return list(BENCHMARKS)
+    return [name for name in BENCHMARKS
+            if any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)]
+
+
+def main():
+    cli = argparse.ArgumentParser(description='Benchmark the Robot Framework metrics pipeline')
+    cli.add_argument('--preset', choices=sorted(PRESETS), default='small')
+    cli.add_argument('--backend', default=os.getenv('METRICS_HISTORY_BACKEND', 'sqlite'),
+                     help='History backend (sqlite|file)')
+    cli.add_argument('--history-runs', type=int, help='Override the preset history size')
+    cli.add_argument('--history-tests', type=int, help='Override the tests per history run')
+    cli.add_argument('--suites', type=int, help='Override the preset output.xml suites')
+    cli.add_argument('--tests', type=int, help='Override the preset tests per suite')
+    cli.add_argument('--workdir', help='Fixtures directory (default: a temp dir per preset/backend)')
+    cli.add_argument('--regenerate', action='store_true', help='Regenerate the fixtures')
+    cli.add_argument('--only', action='append', metavar='PATTERN',
+                     help='Run only benchmarks matching the glob (repeatable)')
+    cli.add_argument('--list', action='store_true', help='List the benchmarks and exit')
+    cli.add_argument('--repeat', type=int, default=20, help='Max measured calls per benchmark')
+    cli.add_argument('--budget', type=float, default=10.0, help='Max seconds per benchmark')
+    cli.add_argument('--in-process', action='store_true',
+                     help='Run all benchmarks in this process (faster, shared peak RSS)')
+    cli.add_argument('--output', default='bench_report.json', help='JSON report path')
+    cli.add_argument('--baseline', help='Compare against this JSON report')
+    cli.add_argument('--threshold', type=float, default=0.2,
+                     help='Allowed slowdown vs baseline (0.2 = 20%%)')
+    args = cli.parse_args()
+
+    names = select_benchmarks(args.only)
+    if args.list:
+        print('\n'.join(names))
+        return 0
+
+    config = dict(PRESETS[args.preset], backend=args.backend.lower())
+    for key in ('history_runs', 'history_tests', 'suites', 'tests'):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+    workdir = Path(args.workdir or Path(tempfile.gettempdir()) /
+                   f"rf-metrics-bench-{args.preset}-{config['backend']}")
+
+    fixtures = prepare_fixtures(workdir, config, regenerate=args.regenerate)
+    options = {'repeat': args.repeat, 'budget': args.budget}
+    report = new_report(dict(config, preset=args.preset, xml_tests=fixtures['xml_tests'],
+                             xml_bytes=fixtures['xml_bytes'], **options))
+
+    context = multiprocessing.get_context('spawn')
+    failed = []
+    for name in names:
+        print(f"🔄 {name}...")
+        if args.in_process:
+            result = run_benchmark(name, fixtures, options)
+        else:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(run_benchmark, name, fixtures, options).result()
+        report['benchmarks'][name] = result
+        if 'error' in result:
+            failed.append(name)
+            print(f"✗ {name}: {result['error']}")
+
+    print_report(report)
+    save_report(report, args.output)
+    print(f"\n✓ Report written to {args.output}")
+
+    status = 0
+    if failed:
+        print(f"\n✗ {len(failed)} benchmark(s) failed: {', '.join(failed)}")
+        status = 1
+
+    if args.baseline:
+        rows = compare_reports(report, load_report(args.baseline), threshold=args.threshold, names=names)
+        print_comparison(rows)
+        regressions = {row['benchmark'] for row in rows if row['regression']}
+        if regressions:
+            print(f"\n✗ {len(regressions)} benchmark(s) regressed more than {args.threshold:.0%} "
+                  f"or are missing/failing")
+            return 1
+        print(f"\n✓ No regressions over {args.threshold:.0%}")
+    return status
@@ -0,0 +1,331 @@
+"""
+Robot Framework Metrics - Synthetic data
+Генератори на синтетични output.xml файлове и history директории
+"""
+import sys
+import random
+import hashlib
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+from xml.sax.saxutils import escape, quoteattr
+
+from benchmarks import DASHBOARD_DIR  # noqa: F401 - sys.path към модулите на dashboard-а
+from history_store import create_history_store
+from trend_series import add_stat_durations
+
+
+STATUSES = ('PASS', 'FAIL', 'SKIP')
+
+LOREM = ('Element locator did not match any elements after waiting for the page to load '
+         'and the expected value was not equal to the actual value returned by the server ')
+
+
+def _message(rng: random.Random, size: int) -> str:
+    if size <= 0:
+        return ''
+    start = rng.randrange(len(LOREM))
+    text = (LOREM * (size // len(LOREM) + 2))[start:start + size]
+    return text.strip() or 'Failed'
+
+
+def _time(dt: datetime) -> str:
+    # RF 7 пише локално време без timezone
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.%f')
+
+
+class _XmlWriter:
+    """Пише output.xml (RF 7 schema) ред по ред, без да държи дървото в паметта"""
+
+    def __init__(self, f, rng: random.Random, keyword_depth: int, keywords: int,
+                 message_size: int):
+        self.f = f
+        self.rng = rng
+        self.keyword_depth = keyword_depth
+        self.keywords = keywords
+        self.message_size = message_size
+
+    def keyword(self, depth: int, start: datetime, elapsed: float, indent: str):
+        f = self.f
+        f.write(f'{indent}<kw name="Keyword Level {depth}" owner="SyntheticLibrary">\n')
+        f.write(f'{indent}<arg>${{value}}</arg>\n')
+        if depth < self.keyword_depth:
+            child_elapsed = elapsed / self.keywords
+            for index in range(self.keywords):
+                self.keyword(depth + 1, start + timedelta(seconds=child_elapsed * index),
+                             child_elapsed, indent + ' ')
+        else:
+            text = escape(_message(self.rng, self.message_size))
+            f.write(f'{indent}<msg time="{_time(start)}" level="INFO">{text}</msg>\n')
+        f.write(f'{indent}<status status="PASS" start="{_time(start)}" elapsed="{elapsed:.3f}"/>\n')
+        f.write(f'{indent}</kw>\n')
+
+
+def generate_output_xml(path, suites: int = 10, tests: int = 20, keyword_depth: int = 2,
+                        keywords: int = 3, message_size: int = 80, tags: int = 3,
+                        tag_pool: int = 20, fail_rate: float = 0.1, skip_rate: float = 0.02,
+                        seed: int = 0, start: Optional[datetime] = None,
+                        name: str = 'Synthetic', suite_indexes: Optional[List[int]] = None) -> Dict:
+    """
+    Записва синтетичен output.xml.
+
+    suites x tests тестове, всеки с keywords^1 + ... + keywords^keyword_depth
+    вложени keywords и `tags` тага от пул от `tag_pool`. suite_indexes
+    избира подмножество от suites (за pabot shards) - тестовете на всеки
+    suite са едни и същи, независимо в кой shard е.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    start = start or datetime(2026, 1, 1, 12, 0, 0)
+    suite_indexes = list(range(suites)) if suite_indexes is None else suite_indexes
+
+    totals = {status: 0 for status in STATUSES}
+    tag_totals: Dict[str, Dict[str, int]] = {}
+    suite_totals = []
+    now = start
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write(f'<robot generator="Robot 7.1.1 (synthetic)" generated="{_time(start)}" '
+                f'rpa="false" schemaversion="5">\n')
+        f.write(f'<suite id="s1" name={quoteattr(name)} source="/robot_src/tests">\n')
+
+        for suite_index in suite_indexes:
+            # Отделен rng за всеки suite - shards дават същите тестове като цялото
+            rng = random.Random(f'{seed}:{suite_index}')
+            writer = _XmlWriter(f, rng, keyword_depth, keywords, message_size)
+            suite_name = f'Suite {suite_index + 1:04d}'
+            suite_id = f's1-s{suite_index + 1}'
+            suite_start = now
+            counts = {status: 0 for status in STATUSES}
+            f.write(f' <suite id="{suite_id}" name="{suite_name}" '
+                    f'source="/robot_src/tests/suite_{suite_index + 1:04d}.robot">\n')
+
+            for test_index in range(tests):
+                roll = rng.random()
+                status = 'FAIL' if roll < fail_rate else 'SKIP' if roll < fail_rate + skip_rate else 'PASS'
+                elapsed = round(rng.uniform(0.1, 5.0), 3)
+                test_tags = sorted({f'tag-{rng.randrange(tag_pool):03d}' for _ in range(tags)})
+
+                f.write(f'  <test id="{suite_id}-t{test_index + 1}" '
+                        f'name="Test {suite_index + 1:04d}-{test_index + 1:04d}" line="{test_index + 1}">\n')
+                writer.keyword(1, now, elapsed, '   ')
+                for tag in test_tags:
+                    f.write(f'   <tag>{tag}</tag>\n')
+                message = escape(_message(rng, message_size)) if status != 'PASS' else ''
+                f.write(f'   <status status="{status}" start="{_time(now)}" '
+                        f'elapsed="{elapsed:.3f}">{message}</status>\n')
+                f.write('  </test>\n')
+
+                now += timedelta(seconds=elapsed)
+                counts[status] += 1
+                for tag in test_tags:
+                    tag_counts = tag_totals.setdefault(tag, {s: 0 for s in STATUSES})
+                    tag_counts[status] += 1
+
+            suite_status = 'FAIL' if counts['FAIL'] else 'PASS'
+            f.write(f'  <status status="{suite_status}" start="{_time(suite_start)}" '
+                    f'elapsed="{(now - suite_start).total_seconds():.3f}"/>\n')
+            f.write(' </suite>\n')
+            suite_totals.append((suite_id, suite_name, counts))
+            for status in STATUSES:
+                totals[status] += counts[status]
+
+        root_status = 'FAIL' if totals['FAIL'] else 'PASS'
+        f.write(f' <status status="{root_status}" start="{_time(start)}" '
+                f'elapsed="{(now - start).total_seconds():.3f}"/>\n')
+        f.write('</suite>\n')
+
+        def stat(counts, text, attrs=''):
+            return (f'<stat pass="{counts["PASS"]}" fail="{counts["FAIL"]}" '
+                    f'skip="{counts["SKIP"]}"{attrs}>{escape(text)}</stat>\n')
+
+        f.write('<statistics>\n<total>\n')
+        f.write(stat(totals, 'All Tests'))
+        f.write('</total>\n<tag>\n')
+        for tag in sorted(tag_totals):
+            f.write(stat(tag_totals[tag], tag))
+        f.write('</tag>\n<suite>\n')
+        for suite_id, suite_name, counts in suite_totals:
+            f.write(stat(counts, f'{name}.{suite_name}', f' name="{suite_name}" id="{suite_id}"'))
+        f.write('</suite>\n</statistics>\n<errors>\n</errors>\n</robot>\n')
+
+    return {
+        'path': str(path),
+        'suites': len(suite_indexes),
+        'tests': sum(totals.values()),
+        'bytes': path.stat().st_size
+    }
+
+
+def generate_pabot_results(results_dir, shards: int = 4, suites: int = 10, **options) -> Dict:
+    """
+    Pabot структура: pabot_results/<n>/output.xml (suites round-robin по
+    shards) + слятият output.xml в results_dir.
+    """
+    results_dir = Path(results_dir)
+    shard_files = []
+    for shard in range(shards):
+        indexes = list(range(shard, suites, shards))
+        if indexes:
+            shard_files.append(generate_output_xml(
+                results_dir / 'pabot_results' / str(shard) / 'output.xml',
+                suites=suites, suite_indexes=indexes, **options
+            ))
+    merged = generate_output_xml(results_dir / 'output.xml', suites=suites, **options)
+    return {'merged': merged, 'shards': shard_files}
+
+
+# ----------------------------------------------------------------------
+# History
+# ----------------------------------------------------------------------
+
+def _stats(name: str, counts: Dict[str, int]) -> Dict:
+    total = counts['PASS'] + counts['FAIL']
+    return {
+        'name': name,
+        'total': total,
+        'passed': counts['PASS'],
+        'failed': counts['FAIL'],
+        'skipped': counts['SKIP'],
+        'pass_rate': round(counts['PASS'] / total * 100, 2) if total else 0
+    }
+
+
+def synthetic_run(index: int, when: datetime, tests: int = 50, suites: int = 5,
+                  flaky_rate: float = 0.05, fail_rate: float = 0.02, tags: int = 2,
+                  tag_pool: int = 10, message_size: int = 80, seed: int = 0) -> Dict:
+    """Един run във формата на parse_output_xml (без XML-а)"""
+    rng = random.Random(f'{seed}:{index}')
+    # Кои тестове са flaky не зависи от run-а
+    layout = random.Random(seed)
+    run_id = hashlib.sha256(f'synthetic:{seed}:{index}'.encode()).hexdigest()[:12]
+
+    run_tests = []
+    totals = {status: 0 for status in STATUSES}
+    tag_totals: Dict[str, Dict[str, int]] = {}
+    suite_totals: Dict[str, Dict[str, int]] = {}
+    now = when
+    for test_index in range(tests):
+        flaky = layout.random() < flaky_rate
+        test_tags = sorted({f'tag-{layout.randrange(tag_pool):03d}' for _ in range(tags)})
+        suite = f'Synthetic.Suite {test_index % suites + 1:03d}'
+
+        failed = rng.random() < (0.5 if flaky else fail_rate)
+        status = 'FAIL' if failed else 'PASS'
+        duration = round(rng.uniform(0.1, 5.0), 2)
+        end = now + timedelta(seconds=duration)
+        run_tests.append({
+            'name': f'Test {test_index + 1:05d}',
+            'suite': suite,
+            'status': status,
+            'start_time': now.isoformat(),
+            'end_time': end.isoformat(),
+            'duration': duration,
+            'message': _message(rng, message_size) if failed else '',
+            'tags': test_tags
+        })
+        now = end
+
+        totals[status] += 1
+        for tag in test_tags:
+            tag_totals.setdefault(tag, {s: 0 for s in STATUSES})[status] += 1
+        suite_totals.setdefault(suite, {s: 0 for s in STATUSES})[status] += 1
+
+    tag_stats = [_stats(tag, tag_totals[tag]) for tag in sorted(tag_totals)]
+    suite_stats = [_stats(suite, suite_totals[suite]) for suite in sorted(suite_totals)]
+    add_stat_durations(tag_stats, suite_stats, run_tests)
+
+    total = sum(totals.values())
+    duration = round((now - when).total_seconds(), 2)
+    return {
+        'run_id': run_id,
+        'timestamp': when.isoformat(),
+        'start_time': when.isoformat(),
+        'end_time': now.isoformat(),
+        'duration': duration,
+        'summary': {
+            'total': total,
+            'passed': totals['PASS'],
+            'failed': totals['FAIL'],
+            'skipped': totals['SKIP'],
+            'pass_rate': round(totals['PASS'] / total * 100, 2) if total else 0
+        },
+        'tests': run_tests,
+        'tag_stats': tag_stats,
+        'suite_stats': suite_stats,
+        'suite_name': 'Synthetic'
+    }
+
+
+def generate_history(history_dir, runs: int = 1000, tests: int = 50, backend: Optional[str] = None,
+                     interval: float = 3600, end: Optional[datetime] = None,
+                     batch_size: int = 500, **options) -> Dict:
+    """
+    Записва `runs` синтетични runs (по един на `interval` секунди до `end`)
+    в history_dir през history store-а - без XML и без events.
+    """
+    store = create_history_store(history_dir, backend)
+    end = end or datetime.now().astimezone().replace(microsecond=0)
+    created = 0
+    for start in range(0, runs, batch_size):
+        batch = [
+            synthetic_run(index, end - timedelta(seconds=interval * (runs - 1 - index)),
+                          tests=tests, **options)
+            for index in range(start, min(start + batch_size, runs))
+        ]
+        created += store.save_runs(batch)
+    return {'history_dir': str(history_dir), 'backend': store.name, 'runs': created}
+
+
+def main():
+    cli = argparse.ArgumentParser(description='Generate synthetic Robot Framework data')
+    commands = cli.add_subparsers(dest='command', required=True)
+
+    xml = commands.add_parser('xml', help='Write a synthetic output.xml (or pabot results)')
+    xml.add_argument('results_dir')
+    xml.add_argument('--suites', type=int, default=10)
+    xml.add_argument('--tests', type=int, default=20, help='Tests per suite')
+    xml.add_argument('--keyword-depth', type=int, default=2)
+    xml.add_argument('--keywords', type=int, default=3, help='Keywords per level')
+    xml.add_argument('--message-size', type=int, default=80)
+    xml.add_argument('--tags', type=int, default=3, help='Tags per test')
+    xml.add_argument('--tag-pool', type=int, default=20)
+    xml.add_argument('--fail-rate', type=float, default=0.1)
+    xml.add_argument('--shards', type=int, default=0, help='Write pabot_results with N shards')
+    xml.add_argument('--seed', type=int, default=0)
+
+    history = commands.add_parser('history', help='Write a synthetic history directory')
+    history.add_argument('history_dir')
+    history.add_argument('--runs', type=int, default=1000)
+    history.add_argument('--tests', type=int, default=50, help='Tests per run')
+    history.add_argument('--backend', help='History backend (default: METRICS_HISTORY_BACKEND)')
+    history.add_argument('--interval', type=float, default=3600, help='Seconds between runs')
+    history.add_argument('--flaky-rate', type=float, default=0.05)
+    history.add_argument('--seed', type=int, default=0)
+
+    args = cli.parse_args()
+    if args.command == 'xml':
+        options = dict(tests=args.tests, keyword_depth=args.keyword_depth, keywords=args.keywords,
+                       message_size=args.message_size, tags=args.tags, tag_pool=args.tag_pool,
+                       fail_rate=args.fail_rate, seed=args.seed)
+        if args.shards:
+            result = generate_pabot_results(args.results_dir, shards=args.shards,
+                                            suites=args.suites, **options)
+            print(f"✓ {len(result['shards'])} shard(s) + merged output.xml "
+                  f"({result['merged']['tests']} tests, {result['merged']['bytes']} bytes)")
+        else:
+            result = generate_output_xml(Path(args.results_dir) / 'output.xml',
+                                         suites=args.suites, **options)
+            print(f"✓ {result['path']} ({result['tests']} tests, {result['bytes']} bytes)")
+    else:
+        result = generate_history(args.history_dir, runs=args.runs, tests=args.tests,
+                                  backend=args.backend, interval=args.interval,
+                                  flaky_rate=args.flaky_rate, seed=args.seed)
+        print(f"✓ {result['runs']} run(s) in {result['history_dir']} ({result['backend']})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Robot Framework Metrics - Failure signatures
+Нормализиране на failure съобщенията и групиране по signature
+
+Едно счупване (напр. login след deploy) дава стотици FAIL съобщения,
+които се различават само по id-та, числа, timestamps и локатори. След
+нормализиране те имат еднакъв текст - sha1 хешът му е signature-ът на
+грешката, а тестовете с еднакъв signature са един cluster.
+"""
+import hashlib
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from testcase_history import test_key
+
+
+SIGNATURE_LENGTH = 16
+MAX_MESSAGE_LENGTH = 500
+
+# Префикс на SeleniumLibrary локатор: 'xpath=//button[@name="login"]', "css:#id", '//div'
+LOCATOR_PREFIX = (r'(?:(?:xpath|css|id|name|link|partial link|class|tag|dom|jquery|identifier|text)'
+                  r'\s*[=:]|//|\.//)')
+
+# Редът има значение - локаторите и URL-ите преди числата в тях
+NORMALIZERS = [
+    (re.compile(rf"'{LOCATOR_PREFIX}[^']*'", re.IGNORECASE), "'<selector>'"),
+    (re.compile(rf'"{LOCATOR_PREFIX}[^"]*"', re.IGNORECASE), '"<selector>"'),
+    # Selenium/WebDriver JSON локатори
+    (re.compile(r'("selector"\s*:\s*)"(?:[^"\\]|\\.)*"'), r'\1"<selector>"'),
+    (re.compile(r'https?://[^\s\'"<>)]+'), '<url>'),
+    (re.compile(r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b', re.IGNORECASE),
+     '<uuid>'),
+    (re.compile(r'\b\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2}(?:[.,]\d+)?)?)?'
+                r'(?:Z|[+-]\d{2}:?\d{2})?'), '<ts>'),
+    (re.compile(r'\b\d{1,2}:\d{2}(?::\d{2}(?:[.,]\d+)?)?\b'), '<ts>'),
+    (re.compile(r'\b0x[0-9a-f]+\b', re.IGNORECASE), '<hex>'),
+    # Hex id-та (session, hash) - поне 8 символа и поне една цифра
+    (re.compile(r'\b(?=[0-9a-f]*\d)[0-9a-f]{8,}\b', re.IGNORECASE), '<hex>'),
+    (re.compile(r'\d+(?:\.\d+)?'), '<n>'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def normalize_message(message: str) -> str:
+    """Failure съобщение без променливите части (id-та, числа, време, локатори)"""
+    normalized = message[:MAX_MESSAGE_LENGTH * 4]
+    for pattern, replacement in NORMALIZERS:
+        normalized = pattern.sub(replacement, normalized)
+    return normalized.strip()[:MAX_MESSAGE_LENGTH]
+
+
+def message_signature(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:SIGNATURE_LENGTH]
+
+
+def test_failures(tests: Iterable[Dict]) -> Iterator[Tuple[int, str, str, Dict]]:
+    """(idx, signature, normalized message, test) за FAIL тестовете на run"""
+    for idx, test in enumerate(tests):
+        if test.get('status') != 'FAIL':
+            continue
+        normalized = normalize_message(test.get('message') or '')
+        yield idx, message_signature(normalized), normalized, test
+
+
+def cluster_entry(signature: str, message: str, example: Optional[str]) -> Dict:
+    return {
+        'signature': signature,
+        'message': message,
+        'example': example,
+        'count': 0,
+        'tests': []
+    }
+
+
+def run_clusters(run: Dict) -> List[Dict]:
+    """Failure clusters на един run, най-големите първи"""
+    clusters = {}
+    for idx, signature, normalized, test in test_failures(run.get('tests', [])):
+        cluster = clusters.get(signature)
+        if cluster is None:
+            cluster = clusters[signature] = cluster_entry(signature, normalized, test.get('message'))
+        cluster['count'] += 1
+        cluster['tests'].append({
+            'idx': idx,
+            'key': test_key(test),
+            'suite': test.get('suite') or '',
+            'name': test.get('name')
+        })
+    return sorted_clusters(clusters.values())
+
+
+def sorted_clusters(clusters: Iterable[Dict]) -> List[Dict]:
+    return sorted(clusters, key=lambda c: (-c.get('count', c.get('failures', 0)), c['signature']))
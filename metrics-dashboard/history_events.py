@@ -0,0 +1,108 @@
+"""
+Robot Framework Metrics - History events
+Журнал на промените в историята (за /api/events)
+"""
+import os
+import json
+import fcntl
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from history_store import HistoryGeneration
+
+
+EVENTS_FILENAME = 'events.log'
+
+# Над този размер журналът се съкращава до последните EVENTS_KEEP_LINES
+EVENTS_MAX_BYTES = 1024 * 1024
+EVENTS_KEEP_LINES = 500
+
+RUN_INGESTED = 'run_ingested'
+RUNS_INGESTED = 'runs_ingested'
+RUN_DELETED = 'run_deleted'
+HISTORY_CLEARED = 'history_cleared'
+HISTORY_COMPACTED = 'history_compacted'
+
+
+class EventJournal:
+    """
+    Append-only JSON lines журнал в history_dir.
+
+    Всеки процес, който пише в историята (gunicorn workers, ingest
+    service, batch CLI), добавя ред тук; ID-то на събитието е новият
+    history generation. SSE stream-овете четат журнала инкрементално от
+    последния offset, така че събитията стигат до всички workers.
+    """
+
+    def __init__(self, history_dir, generation: Optional[HistoryGeneration] = None):
+        self.path = Path(history_dir) / EVENTS_FILENAME
+        self.generation = generation or HistoryGeneration(history_dir)
+        self._lock_path = self.path.with_name(f".{EVENTS_FILENAME}.lock")
+
+    def last_id(self) -> int:
+        return self.generation.current()[0]
+
+    def publish(self, event_type: str, data: Dict) -> int:
+        """Bump на generation-а + запис на събитието; връща ID-то му"""
+        with open(self._lock_path, 'a') as lock:
+            # Под един lock, за да са ID-тата в журнала подредени. Редът се
+            # записва преди bump-а - който види новия generation, вижда и събитието
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            event_id = self.generation.current()[0] + 1
+            event = {
+                'id': event_id,
+                'type': event_type,
+                'time': datetime.now().isoformat(),
+                'data': data
+            }
+            line = json.dumps(event, separators=(',', ':')) + '\n'
+            with open(self.path, 'a') as f:
+                f.write(line)
+                size = f.tell()
+            if size > EVENTS_MAX_BYTES:
+                self._truncate()
+            self.generation.bump()
+        return event_id
+
+    def _truncate(self):
+        with open(self.path, 'r') as f:
+            lines = f.readlines()[-EVENTS_KEEP_LINES:]
+        tmp_path = self.path.with_name(f".{EVENTS_FILENAME}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            f.writelines(lines)
+        os.replace(tmp_path, self.path)
+
+    def read_since(self, last_id: int, cursor: Optional[Tuple[int, int]] = None):
+        """
+        Събитията с id > last_id -> (events, cursor).
+
+        cursor е (inode, offset) от предишното извикване - четат се само
+        новите байтове; след съкращаване на журнала (нов inode) се чете
+        отначало.
+        """
+        events: List[Dict] = []
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return events, None
+
+        with f:
+            stat = os.fstat(f.fileno())
+            offset = 0
+            if cursor and cursor[0] == stat.st_ino and cursor[1] <= stat.st_size:
+                offset = cursor[1]
+            f.seek(offset)
+            chunk = f.read()
+
+        # Само завършени редове - незавършеният се чете следващия път
+        end = chunk.rfind(b'\n') + 1
+        for line in chunk[:end].splitlines():
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if event.get('id', 0) > last_id:
+                events.append(event)
+
+        return events, (stat.st_ino, offset + end)
@@ -0,0 +1,1917 @@
+"""
+Robot Framework Metrics History Store
+Съхранение и индексиране на историята от runs
+"""
+import os
+import json
+import fcntl
+import sqlite3
+import bisect
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from retention import (COMPACT_BATCH_SIZE, DAY_SECONDS, ROLLUP_FIELDS, ROLLUP_STAT_FIELDS,
+                       TIER_FULL, TIER_SUMMARY, RetentionPolicy, rollup_point, rollup_run,
+                       rollup_stat_point, sorted_rollups)
+from instrumentation import REGISTRY, record_timing
+from run_format import LEGACY_SUFFIX, RUN_SUFFIX, read_run, write_run
+from failure_signatures import cluster_entry, run_clusters, sorted_clusters, test_failures
+from keyword_profile import HOT_SORTS, PROFILE_FIELDS, hot_keywords, keyword_key, profile_rows
+from testcase_history import TestAggregate, test_key
+from trend_series import STAT_KINDS, stat_point, stat_totals, test_stat_totals
+
+
+DEFAULT_BACKEND = 'sqlite'
+SQLITE_FILENAME = 'history.db'
+LEGACY_DIRNAME = 'legacy'
+GENERATION_FILENAME = 'generation'
+
+# Архивът на свитите тестове и rollups на файловия backend
+RETENTION_DIRNAME = 'retention'
+ARCHIVE_FILENAME = 'test_archive.json'
+ROLLUPS_FILENAME = 'rollups.json'
+
+# Keyword профилите на файловия backend - по един JSON до всеки run
+KEYWORDS_DIRNAME = 'keywords'
+KEYWORD_PROFILE_KEY = 'keyword_profile'
+
+# Полета на тест за ?fields= и възможни сортирания на тестовете в run
+TEST_FIELDS = ('name', 'suite', 'status', 'start_time', 'end_time', 'duration', 'message', 'tags')
+TEST_SORTS = ('index', 'duration', 'name')
+
+
+def run_summary(run: Dict) -> Dict:
+    """Лек summary на run - без тестовете (за списъци и trend-ове)"""
+    return {
+        'run_id': run['run_id'],
+        'timestamp': run['timestamp'],
+        'suite_name': run.get('suite_name', 'Unknown'),
+        'duration': run.get('duration', 0),
+        'summary': run['summary']
+    }
+
+
+def test_execution(run: Dict, test: Dict) -> Dict:
+    """Един ред от историята на тест"""
+    return {
+        'run_id': run['run_id'],
+        'timestamp': run['timestamp'],
+        'status': test.get('status'),
+        'duration': test.get('duration', 0),
+        'message': test.get('message', '')
+    }
+
+
+def without_profile(metrics: Dict) -> Dict:
+    """Run без keyword профила - той се пази отделно от run-а"""
+    return {key: value for key, value in metrics.items() if key != KEYWORD_PROFILE_KEY}
+
+
+def keyword_point(run_id: str, timestamp: str, row) -> Dict:
+    """Точка от trend-а на keyword"""
+    return {
+        'run_id': run_id,
+        'timestamp': timestamp,
+        **{field: row[field] for field in PROFILE_FIELDS[2:]}
+    }
+
+
+def signature_entry(signature: str, message: str, example: Optional[str], ts: float) -> Dict:
+    """Ред на /api/failures - signature през runs"""
+    return {
+        'signature': signature,
+        'message': message,
+        'example': example,
+        'failures': 0,
+        'runs': 0,
+        'tests': 0,
+        'first_seen': ts,
+        'last_seen': ts
+    }
+
+
+def series_point(ts: float, summary: Dict) -> Dict:
+    """Една точка от trend серията"""
+    return {
+        'ts': ts,
+        'run_id': summary['run_id'],
+        'timestamp': summary['timestamp'],
+        'pass_rate': summary['summary']['pass_rate'],
+        'total': summary['summary']['total'],
+        'passed': summary['summary']['passed'],
+        'failed': summary['summary']['failed'],
+        'duration': summary['duration']
+    }
+
+
+def run_stat_points(ts: float, run: Dict) -> Dict:
+    """Точките на всички tag/suite статистики на run - {(kind, name): point}"""
+    return {
+        (kind, stat.get('name') or ''): stat_point(ts, run['run_id'], run['timestamp'], stat)
+        for kind in STAT_KINDS for stat in run.get(f'{kind}_stats') or []
+    }
+
+
+def encode_cursor(ts: float, run_id: str) -> str:
+    """Cursor за страниране на runs - позицията на последния върнат run"""
+    return f"{ts!r}:{run_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        ts, run_id = cursor.rsplit(':', 1)
+        return float(ts), run_id
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def test_query(fields: Optional[Iterable[str]] = None, sort: str = 'index') -> List[str]:
+    """Валидира fields/sort на заявка за тестове; връща списъка полета"""
+    if sort not in TEST_SORTS:
+        raise ValueError(f"Unknown sort '{sort}' (expected one of: {', '.join(TEST_SORTS)})")
+    fields = list(fields) if fields else list(TEST_FIELDS)
+    unknown = [f for f in fields if f not in TEST_FIELDS]
+    if unknown:
+        raise ValueError(
+            f"Unknown field(s): {', '.join(unknown)} (expected: {', '.join(TEST_FIELDS)})"
+        )
+    return fields
+
+
+def test_matches(test: Dict, statuses: Optional[List[str]] = None, tag: Optional[str] = None,
+                 suite: Optional[str] = None, q: Optional[str] = None) -> bool:
+    """Филтрите на /api/runs/<run_id>/tests върху един тест"""
+    if statuses and test.get('status') not in statuses:
+        return False
+    if tag and tag not in test.get('tags', []):
+        return False
+    if suite:
+        test_suite = test.get('suite') or ''
+        if test_suite != suite and not test_suite.startswith(suite + '.'):
+            return False
+    if q and q.lower() not in (test.get('name') or '').lower():
+        return False
+    return True
+
+
+def project_test(test: Dict, fields: List[str], max_message: Optional[int] = None) -> Dict:
+    projected = {field: test.get(field) for field in fields}
+    if max_message is not None and projected.get('message'):
+        projected['message'] = projected['message'][:max_message]
+    return projected
+
+
+def timestamp_to_epoch(timestamp: Optional[str]) -> float:
+    """ISO timestamp -> epoch секунди (0.0 ако не може да се парсне)"""
+    if not timestamp:
+        return 0.0
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class HistoryStore:
+    """
+    Базов клас за history backend-ите.
+
+    Runs се връщат винаги newest first. list_runs() връща само summaries,
+    get_run() - пълния run (с тестовете, ако include_tests=True).
+    """
+
+    name = 'base'
+    # True ако per-test агрегатите се обновяват при save_run (без да се чете историята)
+    incremental_aggregates = False
+
+    def __init__(self, history_dir: Path):
+        self.history_dir = Path(history_dir)
+        self.history_dir.mkdir(parents=True, exist_ok=True)
+
+    def save_run(self, metrics: Dict) -> bool:
+        """Записва run; False ако вече съществува"""
+        raise NotImplementedError
+
+    def save_runs(self, runs: List[Dict]) -> int:
+        """Записва много runs наведнъж; връща броя нови"""
+        return sum(1 for run in runs if self.save_run(run))
+
+    def has_run(self, run_id: str) -> bool:
+        raise NotImplementedError
+
+    def run_tier(self, run_id: str) -> Optional[str]:
+        """Retention нивото на run (full | summary) или None ако няма такъв run"""
+        run = self.get_run(run_id, include_tests=False)
+        return run.get('tier', TIER_FULL) if run else None
+
+    def get_run(self, run_id: str, include_tests: bool = True) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def list_runs(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        raise NotImplementedError
+
+    def count_runs(self) -> int:
+        raise NotImplementedError
+
+    def list_runs_page(self, limit: int, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Страница summaries (newest first) след cursor -> (runs, next_cursor).
+
+        Редът е (timestamp DESC, run_id), така че нови runs не изместват
+        страниците, за разлика от offset.
+        """
+        entries = sorted(
+            ((-timestamp_to_epoch(s['timestamp']), s['run_id']), s) for s in self.list_runs()
+        )
+        keys = [key for key, _ in entries]
+        start = 0
+        if cursor:
+            ts, run_id = decode_cursor(cursor)
+            start = bisect.bisect_right(keys, (-ts, run_id))
+        return self._page(entries[start:start + limit + 1], limit)
+
+    def _page(self, entries: List, limit: int) -> Tuple[List[Dict], Optional[str]]:
+        """entries са ((-ts, run_id), summary) - един повече от limit значи има още"""
+        page = entries[:limit]
+        next_cursor = None
+        if len(entries) > limit and page:
+            (neg_ts, run_id), _ = page[-1]
+            next_cursor = encode_cursor(-neg_ts, run_id)
+        return [summary for _, summary in page], next_cursor
+
+    def run_tests(self, run_id: str, offset: int = 0, limit: Optional[int] = 100,
+                  statuses: Optional[List[str]] = None, tag: Optional[str] = None,
+                  suite: Optional[str] = None, q: Optional[str] = None, sort: str = 'index',
+                  fields: Optional[List[str]] = None,
+                  max_message: Optional[int] = None) -> Optional[Dict]:
+        """Филтрирана/сортирана страница от тестовете на run (None ако няма такъв run)"""
+        fields = test_query(fields, sort)
+        run = self.get_run(run_id)
+        if run is None:
+            return None
+
+        tests = [t for t in run.get('tests', []) if test_matches(t, statuses, tag, suite, q)]
+        if sort == 'duration':
+            tests.sort(key=lambda t: t.get('duration') or 0, reverse=True)
+        elif sort == 'name':
+            tests.sort(key=lambda t: t.get('name') or '')
+
+        end = offset + limit if limit is not None else None
+        return {
+            'run_id': run_id,
+            'total': len(tests),
+            'offset': offset,
+            'limit': limit,
+            'tests': [project_test(t, fields, max_message) for t in tests[offset:end]]
+        }
+
+    def delete_run(self, run_id: str) -> bool:
+        raise NotImplementedError
+
+    def clear(self) -> int:
+        """Изтрива цялата история; връща броя изтрити runs"""
+        raise NotImplementedError
+
+    def iter_runs(self, limit: Optional[int] = None) -> Iterator[Dict]:
+        """Пълни runs (с тестовете), newest first"""
+        for summary in self.list_runs(limit=limit):
+            run = self.get_run(summary['run_id'])
+            if run:
+                yield run
+
+    def latest_run(self, include_tests: bool = False) -> Optional[Dict]:
+        """Последният run или None"""
+        latest = self.list_runs(limit=1)
+        if not latest:
+            return None
+        return self.get_run(latest[0]['run_id'], include_tests=include_tests)
+
+    def series_points(self, start: Optional[float] = None, end: Optional[float] = None) -> List[Dict]:
+        """Trend точки (summary метриките) в [start, end], oldest first"""
+        points = []
+        for summary in reversed(self.list_runs()):
+            ts = timestamp_to_epoch(summary['timestamp'])
+            if (start is None or ts >= start) and (end is None or ts <= end):
+                points.append(series_point(ts, summary))
+        return self._with_rollup_points(points, start, end)
+
+    def stat_points(self, kind: str, name: str, start: Optional[float] = None,
+                    end: Optional[float] = None) -> List[Dict]:
+        """Точките на една tag/suite статистика (kind = 'tag' | 'suite') в [start, end], oldest first"""
+        points = []
+        for summary in reversed(self.list_runs()):
+            ts = timestamp_to_epoch(summary['timestamp'])
+            if (start is None or ts >= start) and (end is None or ts <= end):
+                run = self.get_run(summary['run_id'], include_tests=False)
+                point = run_stat_points(ts, run).get((kind, name)) if run else None
+                if point is not None:
+                    points.append(point)
+        return self._with_rollup_points(points, start, end, stat=(kind, name))
+
+    def _with_rollup_points(self, points: List[Dict], start: Optional[float],
+                            end: Optional[float], stat: Optional[Tuple[str, str]] = None) -> List[Dict]:
+        """Добавя daily rollups на свитите runs (или на tag/suite статистиката stat) към точките"""
+        # Точката на rollup-а е в средата на деня (rollup_point), а store-ът филтрира по началото
+        # му - ден, започнал до половин ден преди start, има точка в прозореца
+        since = start - DAY_SECONDS / 2 if start is not None else None
+        if stat is None:
+            rollups = map(rollup_point, self.rollups('day', since, end))
+        else:
+            rollups = map(rollup_stat_point, self.rollup_stats(*stat, 'day', since, end))
+        extra = [
+            point for point in rollups
+            if (start is None or point['ts'] >= start) and (end is None or point['ts'] <= end)
+        ]
+        if not extra:
+            return points
+        return sorted(points + extra, key=lambda point: point['ts'])
+
+    # ------------------------------------------------------------------
+    # Retention - full -> summary -> rollup
+    # ------------------------------------------------------------------
+
+    def compact(self, policy: RetentionPolicy, now: Optional[float] = None,
+                batch_size: int = COMPACT_BATCH_SIZE) -> Dict:
+        """
+        Прилага retention политиката - най-старите runs първи.
+
+        Тестовете на run извън full нивото се архивират в per-test
+        агрегатите, runs по-стари от summary_days отиват в daily/weekly
+        rollups и се изтриват. Връща {'compacted': n, 'rolled_up': m}.
+        """
+        raise NotImplementedError
+
+    def rollups(self, period: str = 'day', start: Optional[float] = None,
+                end: Optional[float] = None) -> List[Dict]:
+        """Rollups на свитите runs с начало на периода в [start, end], oldest first"""
+        return []
+
+    def rollup_stats(self, kind: str, name: str, period: str = 'day',
+                     start: Optional[float] = None, end: Optional[float] = None) -> List[Dict]:
+        """Rollups на tag/suite статистиките (kind = 'tag' | 'suite')"""
+        return []
+
+    # ------------------------------------------------------------------
+    # Per-test history - базовата имплементация ги смята от runs;
+    # backend-и с index ги поддържат инкрементално при save_run()
+    # ------------------------------------------------------------------
+
+    def _archived_aggregates(self) -> Dict[str, TestAggregate]:
+        """Агрегатите на архивираните (свити) тестове - начало на rebuild-а"""
+        return {}
+
+    def _build_aggregates(self, runs: Iterable[Dict]) -> Dict[str, TestAggregate]:
+        """Изгражда агрегатите наново от архива + runs (oldest first)"""
+        aggregates = self._archived_aggregates()
+        for run in runs:
+            ts = timestamp_to_epoch(run.get('timestamp'))
+            for test in run.get('tests', []):
+                key = test_key(test)
+                agg = aggregates.get(key)
+                if agg is None:
+                    agg = aggregates[key] = TestAggregate.for_test(test)
+                agg.update(test, run['run_id'], ts)
+        return aggregates
+
+    def test_aggregates(self) -> List[TestAggregate]:
+        """Агрегатите на всички тестове"""
+        runs = list(self.iter_runs())
+        return list(self._build_aggregates(reversed(runs)).values())
+
+    def test_aggregate(self, key: str) -> Optional[TestAggregate]:
+        for agg in self.test_aggregates():
+            if agg.key == key:
+                return agg
+        return None
+
+    def slow_test_aggregates(self, run_id: Optional[str] = None) -> List[TestAggregate]:
+        """Агрегатите с флагната duration регресия (по избор - флагнати в run_id)"""
+        return [
+            agg for agg in self.test_aggregates()
+            if agg.slow_streak and (run_id is None or agg.last_run_id == run_id)
+        ]
+
+    def test_executions(self, suite: str, name: str, limit: int = 50) -> List[Dict]:
+        """Последните изпълнения на тест, newest first"""
+        executions = []
+        for run in self.iter_runs():
+            for test in run.get('tests', []):
+                if test.get('name') == name and (test.get('suite') or '') == suite:
+                    executions.append(test_execution(run, test))
+            if len(executions) >= limit:
+                break
+        return executions[:limit]
+
+    # ------------------------------------------------------------------
+    # Failure signatures - базовата имплементация ги смята от runs;
+    # backend-и с index пазят signature -> (run, test) при save_run()
+    # ------------------------------------------------------------------
+
+    def failure_clusters(self, run_id: str) -> Optional[List[Dict]]:
+        """FAIL тестовете на run, групирани по signature (None ако няма такъв run)"""
+        run = self.get_run(run_id)
+        return run_clusters(run) if run is not None else None
+
+    def failure_signatures(self, start: Optional[float] = None, end: Optional[float] = None,
+                           limit: int = 20) -> List[Dict]:
+        """Най-честите signatures в time-range - брой failures, runs и тестове"""
+        signatures, tests = {}, {}
+        for run in self.iter_runs():
+            ts = timestamp_to_epoch(run.get('timestamp'))
+            if end is not None and ts > end:
+                continue
+            if start is not None and ts < start:
+                break
+            for cluster in run_clusters(run):
+                signature = cluster['signature']
+                entry = signatures.get(signature)
+                if entry is None:
+                    entry = signatures[signature] = signature_entry(
+                        signature, cluster['message'], cluster['example'], ts)
+                    tests[signature] = set()
+                # runs са newest first - примерът остава от най-стария
+                entry['example'] = cluster['example']
+                entry['failures'] += cluster['count']
+                entry['runs'] += 1
+                entry['first_seen'] = min(entry['first_seen'], ts)
+                entry['last_seen'] = max(entry['last_seen'], ts)
+                tests[signature].update(test['key'] for test in cluster['tests'])
+
+        for signature, entry in signatures.items():
+            entry['tests'] = len(tests[signature])
+        return sorted_clusters(signatures.values())[:limit]
+
+    def signature_failures(self, signature: str, limit: int = 100) -> Optional[Dict]:
+        """Inverted index: тестовете (по runs, newest first) с този signature"""
+        found = None
+        for run in self.iter_runs():
+            for cluster in run_clusters(run):
+                if cluster['signature'] != signature:
+                    continue
+                if found is None:
+                    found = {'signature': signature, 'message': cluster['message'],
+                             'example': cluster['example'], 'failures': []}
+                for test in cluster['tests']:
+                    found['failures'].append({'run_id': run['run_id'],
+                                              'timestamp': run.get('timestamp'), **test})
+            if found and len(found['failures']) >= limit:
+                break
+        if found:
+            found['failures'] = found['failures'][:limit]
+        return found
+
+    # ------------------------------------------------------------------
+    # Keyword профили (компактни редове PROFILE_FIELDS за всеки run)
+    # ------------------------------------------------------------------
+
+    def _load_keyword_profile(self, run_id: str) -> Optional[List[list]]:
+        return None
+
+    def keyword_profile(self, run_id: str) -> Optional[List[Dict]]:
+        """Профилът на run ([] ако е парсван без профилиране, None ако няма run)"""
+        if not self.has_run(run_id):
+            return None
+        return profile_rows(self._load_keyword_profile(run_id))
+
+    def hot_keywords(self, start: Optional[float] = None, end: Optional[float] = None,
+                     sort: str = 'self_time', limit: int = 20) -> List[Dict]:
+        """Keywords с най-много време, сумирано през runs в time-range"""
+        rows = []
+        for summary in self.list_runs():
+            ts = timestamp_to_epoch(summary.get('timestamp'))
+            if end is not None and ts > end:
+                continue
+            if start is not None and ts < start:
+                break
+            rows.extend(profile_rows(self._load_keyword_profile(summary['run_id'])))
+        return hot_keywords(rows, sort=sort, limit=limit)
+
+    def keyword_trend(self, name: str, owner: str = '', start: Optional[float] = None,
+                      end: Optional[float] = None) -> List[Dict]:
+        """Времената на един keyword по runs, oldest first"""
+        points = []
+        for summary in self.list_runs():
+            ts = timestamp_to_epoch(summary.get('timestamp'))
+            if end is not None and ts > end:
+                continue
+            if start is not None and ts < start:
+                break
+            for row in profile_rows(self._load_keyword_profile(summary['run_id'])):
+                if row['name'] == name and row['owner'] == owner:
+                    points.append(keyword_point(summary['run_id'], summary['timestamp'], row))
+                    break
+        return points[::-1]
+
+
+class FileHistoryStore(HistoryStore):
+    """
+    Файлов backend - по един файл за всеки run.
+
+    Новите runs се записват в компактния формат (run_format, *.run);
+    legacy *.json файловете се четат прозрачно. Summaries на runs се
+    кешират в паметта на процеса - за тях се чете само header-ът на
+    файла. Кешът се инвалидира по mtime на history директорията и
+    множеството файлове, така че при промяна се четат само новите.
+    """
+
+    name = 'file'
+
+    # mtime на някои файлови системи е с точност до секунда - докато
+    # директорията е "прясна", файловете се сверяват при всяко четене
+    MTIME_GRACE_SECONDS = 2.0
+
+    def __init__(self, history_dir: Path):
+        super().__init__(history_dir)
+        self._lock = threading.Lock()
+        self._dir_mtime_ns = None
+        self._summaries = {}  # file name -> (epoch, summary)
+        self._sorted = []
+        self._sorted_epochs = []
+        self._sorted_keys = []
+        self._version = 0
+        self._aggregates = None
+        self._aggregates_version = None
+        # Tag/suite точките от header-ите - {(kind, name): (epochs, points)}, oldest first
+        self._stats = {}  # file name -> run_stat_points()
+        self._run_stats = {}  # run_id -> run_stat_points()
+        self._stat_index = {}
+        self._stat_index_version = None
+
+    def _run_path(self, run_id: str) -> Path:
+        return self.history_dir / f"{run_id}{RUN_SUFFIX}"
+
+    def _existing_path(self, run_id: str) -> Optional[Path]:
+        """Файлът на run - компактен или legacy JSON (None ако няма)"""
+        for suffix in (RUN_SUFFIX, LEGACY_SUFFIX):
+            path = self.history_dir / f"{run_id}{suffix}"
+            if path.exists():
+                return path
+        return None
+
+    def _load_file(self, run_file: Path, include_tests: bool = True) -> Optional[Dict]:
+        stats = {}
+        try:
+            run = read_run(run_file, include_tests=include_tests, stats=stats)
+            REGISTRY.inc('rf_metrics_history_files_read_total', backend=self.name,
+                         part='full' if include_tests else 'header')
+            REGISTRY.inc('rf_metrics_history_bytes_decoded_total', stats['bytes'], backend=self.name)
+            return run
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error loading {run_file}: {e}")
+            return None
+
+    def _refresh(self) -> List[Dict]:
+        """Синхронизира кеша със съдържанието на history директорията"""
+        with self._lock:
+            dir_mtime_ns = os.stat(self.history_dir).st_mtime_ns
+            fresh = time.time() - dir_mtime_ns / 1e9 < self.MTIME_GRACE_SECONDS
+            if dir_mtime_ns == self._dir_mtime_ns and not fresh:
+                return self._sorted
+
+            scan_started = time.perf_counter()
+            names = {
+                entry.name for entry in os.scandir(self.history_dir)
+                if entry.name.endswith((RUN_SUFFIX, LEGACY_SUFFIX)) and entry.is_file()
+            }
+            cached = set(self._summaries)
+            if names != cached:
+                for name in cached - names:
+                    del self._summaries[name]
+                    self._stats.pop(name, None)
+                for name in names - cached:
+                    run = self._load_file(self.history_dir / name, include_tests=False)
+                    if run:
+                        ts = timestamp_to_epoch(run.get('timestamp'))
+                        self._summaries[name] = (ts, run_summary(run))
+                        self._stats[name] = run_stat_points(ts, run)
+
+                # По време на конвертиране run може да има и .json, и .run
+                unique = {}
+                self._run_stats = {}
+                for name in sorted(self._summaries, key=lambda n: n.endswith(RUN_SUFFIX)):
+                    ts, summary = self._summaries[name]
+                    unique[summary['run_id']] = (ts, summary)
+                    self._run_stats[summary['run_id']] = self._stats.get(name) or {}
+
+                # Sort by timestamp descending (newest first), run_id при равенство
+                entries = sorted(unique.values(), key=lambda x: (-x[0], x[1]['run_id']))
+                self._sorted = [summary for _, summary in entries]
+                self._sorted_epochs = [ts for ts, _ in entries]
+                self._sorted_keys = [(-ts, summary['run_id']) for ts, summary in entries]
+                self._version += 1
+
+            scan_time = time.perf_counter() - scan_started
+            REGISTRY.observe('rf_metrics_history_scan_duration_seconds', scan_time,
+                             backend=self.name)
+            record_timing('history_scan', scan_time)
+            self._dir_mtime_ns = dir_mtime_ns
+            return self._sorted
+
+    def save_run(self, metrics: Dict) -> bool:
+        if self._existing_path(metrics['run_id']):
+            return False
+
+        # Профилът се записва преди run-а - видим run винаги има профила си
+        if metrics.get(KEYWORD_PROFILE_KEY):
+            self._write_keyword_profile(metrics['run_id'], metrics[KEYWORD_PROFILE_KEY])
+        write_run(self._run_path(metrics['run_id']), without_profile(metrics))
+        return True
+
+    def _keyword_profile_path(self, run_id: str) -> Path:
+        return self.history_dir / KEYWORDS_DIRNAME / f"{run_id}.json"
+
+    def _write_keyword_profile(self, run_id: str, profile: List[list]):
+        path = self._keyword_profile_path(run_id)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(profile, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def _load_keyword_profile(self, run_id: str) -> Optional[List[list]]:
+        try:
+            with open(self._keyword_profile_path(run_id), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def has_run(self, run_id: str) -> bool:
+        return self._existing_path(run_id) is not None
+
+    def get_run(self, run_id: str, include_tests: bool = True) -> Optional[Dict]:
+        file_path = self._existing_path(run_id)
+        if file_path is None:
+            return None
+        return self._load_file(file_path, include_tests=include_tests)
+
+    def list_runs(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        end = offset + limit if limit is not None else None
+        return self._refresh()[offset:end]
+
+    def count_runs(self) -> int:
+        return len(self._refresh())
+
+    def list_runs_page(self, limit: int, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        summaries = self._refresh()
+        start = 0
+        if cursor:
+            ts, run_id = decode_cursor(cursor)
+            start = bisect.bisect_right(self._sorted_keys, (-ts, run_id))
+        end = start + limit + 1
+        return self._page(list(zip(self._sorted_keys[start:end], summaries[start:end])), limit)
+
+    def series_points(self, start: Optional[float] = None, end: Optional[float] = None) -> List[Dict]:
+        summaries = self._refresh()
+        points = [
+            series_point(ts, summary)
+            for ts, summary in zip(reversed(self._sorted_epochs), reversed(summaries))
+            if (start is None or ts >= start) and (end is None or ts <= end)
+        ]
+        return self._with_rollup_points(points, start, end)
+
+    def stat_points(self, kind: str, name: str, start: Optional[float] = None,
+                    end: Optional[float] = None) -> List[Dict]:
+        # Index-ът се строи от кешираните header-и само когато множеството runs се промени
+        summaries = self._refresh()
+        if self._stat_index_version != self._version:
+            index = {}
+            for ts, summary in zip(reversed(self._sorted_epochs), reversed(summaries)):
+                for key, point in self._run_stats.get(summary['run_id'], {}).items():
+                    epochs, points = index.setdefault(key, ([], []))
+                    epochs.append(ts)
+                    points.append(point)
+            self._stat_index = index
+            self._stat_index_version = self._version
+
+        epochs, points = self._stat_index.get((kind, name), ([], []))
+        low = bisect.bisect_left(epochs, start) if start is not None else 0
+        high = bisect.bisect_right(epochs, end) if end is not None else len(epochs)
+        return self._with_rollup_points(points[low:high], start, end, stat=(kind, name))
+
+    def test_aggregates(self) -> List[TestAggregate]:
+        # Пресмятат се наново само когато множеството runs се промени
+        self._refresh()
+        if self._aggregates_version != self._version:
+            self._aggregates = super().test_aggregates()
+            self._aggregates_version = self._version
+        return self._aggregates
+
+    # ------------------------------------------------------------------
+    # Retention - архивът и rollups са JSON файлове в retention/
+    # ------------------------------------------------------------------
+
+    def _read_retention(self, filename: str, default):
+        try:
+            with open(self.history_dir / RETENTION_DIRNAME / filename, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return default
+
+    def _write_retention(self, filename: str, data):
+        retention_dir = self.history_dir / RETENTION_DIRNAME
+        retention_dir.mkdir(exist_ok=True)
+        path = retention_dir / filename
+        tmp_path = path.with_name(f".{filename}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def _archived_aggregates(self) -> Dict[str, TestAggregate]:
+        return {
+            key: TestAggregate.from_row(row)
+            for key, row in self._read_retention(ARCHIVE_FILENAME, {}).items()
+        }
+
+    def _stored_rollups(self) -> Dict:
+        return self._read_retention(ROLLUPS_FILENAME, {'rollups': [], 'stats': []})
+
+    def compact(self, policy: RetentionPolicy, now: Optional[float] = None,
+                batch_size: int = COMPACT_BATCH_SIZE) -> Dict:
+        result = {'compacted': 0, 'rolled_up': 0}
+        if not policy.enabled:
+            return result
+
+        now = time.time() if now is None else now
+        summaries = self._refresh()
+        epochs = self._sorted_epochs
+        nth_newest = None
+        if policy.full_runs and len(epochs) >= policy.full_runs:
+            nth_newest = epochs[policy.full_runs - 1]
+        keep_full_after, rollup_before = policy.cutoffs(now, nth_newest)
+
+        candidates = [
+            (ts, summary['run_id'])
+            for ts, summary in zip(reversed(epochs), reversed(summaries))
+            if ts < keep_full_after or ts < rollup_before
+        ]
+        for start in range(0, len(candidates), batch_size):
+            self._compact_batch(candidates[start:start + batch_size], rollup_before, result)
+        return result
+
+    def _compact_batch(self, batch: List[Tuple[float, str]], rollup_before: float, result: Dict):
+        archive = self._archived_aggregates()
+        stored = self._stored_rollups()
+        rollups = {(r['period'], r['start_ts']): r for r in stored['rollups']}
+        stats = {(s['period'], s['start_ts'], s['kind'], s['name']): s for s in stored['stats']}
+
+        rolled_up, compacted = [], []
+        for ts, run_id in batch:
+            path = self._existing_path(run_id)
+            run = self._load_file(path, include_tests=False) if path else None
+            if run is None:
+                continue
+            full = run.get('tier', TIER_FULL) == TIER_FULL
+            if not full and ts >= rollup_before:
+                continue
+
+            if full:
+                run = self._load_file(path) or run
+                for test in run.get('tests', []):
+                    key = test_key(test)
+                    agg = archive.get(key)
+                    if agg is None:
+                        agg = archive[key] = TestAggregate.for_test(test)
+                    agg.update(test, run_id, ts)
+
+            if ts < rollup_before:
+                rollup_run(rollups, stats, ts, run)
+                rolled_up.append(run_id)
+            else:
+                compacted.append({**run, 'tests': [], 'tier': TIER_SUMMARY})
+
+        if not rolled_up and not compacted:
+            return
+
+        # Архивът и rollups се записват преди runs да се пипнат
+        self._write_retention(ARCHIVE_FILENAME, {
+            key: dict(zip(TestAggregate.FIELDS, agg.to_row())) for key, agg in archive.items()
+        })
+        self._write_retention(ROLLUPS_FILENAME, {
+            'rollups': sorted_rollups(rollups.values()),
+            'stats': sorted_rollups(stats.values())
+        })
+
+        for run in compacted:
+            write_run(self._run_path(run['run_id']), run)
+            (self.history_dir / f"{run['run_id']}{LEGACY_SUFFIX}").unlink(missing_ok=True)
+        for run_id in rolled_up:
+            self.delete_run(run_id)
+        result['compacted'] += len(compacted)
+        result['rolled_up'] += len(rolled_up)
+
+    def rollups(self, period: str = 'day', start: Optional[float] = None,
+                end: Optional[float] = None) -> List[Dict]:
+        return [
+            rollup for rollup in self._stored_rollups()['rollups']
+            if rollup['period'] == period
+            and (start is None or rollup['start_ts'] >= start)
+            and (end is None or rollup['start_ts'] <= end)
+        ]
+
+    def rollup_stats(self, kind: str, name: str, period: str = 'day',
+                     start: Optional[float] = None, end: Optional[float] = None) -> List[Dict]:
+        return [
+            stat for stat in self._stored_rollups()['stats']
+            if stat['kind'] == kind and stat['name'] == name and stat['period'] == period
+            and (start is None or stat['start_ts'] >= start)
+            and (end is None or stat['start_ts'] <= end)
+        ]
+
+    def delete_run(self, run_id: str) -> bool:
+        deleted = False
+        for suffix in (RUN_SUFFIX, LEGACY_SUFFIX):
+            file_path = self.history_dir / f"{run_id}{suffix}"
+            if file_path.exists():
+                file_path.unlink()
+                deleted = True
+        self._keyword_profile_path(run_id).unlink(missing_ok=True)
+        return deleted
+
+    def clear(self) -> int:
+        deleted = set()
+        for suffix in (RUN_SUFFIX, LEGACY_SUFFIX):
+            for run_file in self.history_dir.glob(f'*{suffix}'):
+                try:
+                    run_file.unlink()
+                    deleted.add(run_file.stem)
+                except Exception as e:
+                    print(f"Warning: Could not delete {run_file}: {e}")
+        for filename in (ARCHIVE_FILENAME, ROLLUPS_FILENAME):
+            (self.history_dir / RETENTION_DIRNAME / filename).unlink(missing_ok=True)
+        for profile_file in (self.history_dir / KEYWORDS_DIRNAME).glob('*.json'):
+            profile_file.unlink(missing_ok=True)
+        return len(deleted)
+
+
+# Миграциите се прилагат по ред спрямо PRAGMA user_version
+SQLITE_MIGRATIONS = [
+    """
+    CREATE TABLE runs (
+        run_id      TEXT PRIMARY KEY,
+        ts          REAL NOT NULL,
+        timestamp   TEXT NOT NULL,
+        suite_name  TEXT,
+        duration    REAL,
+        total       INTEGER,
+        passed      INTEGER,
+        failed      INTEGER,
+        skipped     INTEGER,
+        pass_rate   REAL,
+        header      TEXT NOT NULL
+    );
+    CREATE INDEX idx_runs_ts ON runs (ts DESC, run_id);
+
+    CREATE TABLE tests (
+        run_id      TEXT NOT NULL,
+        idx         INTEGER NOT NULL,
+        name        TEXT,
+        status      TEXT,
+        start_time  TEXT,
+        end_time    TEXT,
+        duration    REAL,
+        message     TEXT,
+        tags        TEXT,
+        PRIMARY KEY (run_id, idx)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE run_stats (
+        run_id      TEXT NOT NULL,
+        kind        TEXT NOT NULL,
+        name        TEXT NOT NULL,
+        ts          REAL NOT NULL,
+        total       INTEGER,
+        passed      INTEGER,
+        failed      INTEGER,
+        pass_rate   REAL
+    );
+    CREATE INDEX idx_run_stats_run ON run_stats (run_id);
+    CREATE INDEX idx_run_stats_name ON run_stats (kind, name, ts);
+    """,
+    """
+    ALTER TABLE tests ADD COLUMN suite TEXT NOT NULL DEFAULT '';
+    CREATE INDEX idx_tests_key ON tests (suite, name);
+
+    CREATE TABLE test_aggregates (
+        key                 TEXT PRIMARY KEY,
+        suite               TEXT,
+        name                TEXT,
+        runs                INTEGER,
+        passed              INTEGER,
+        failed              INTEGER,
+        skipped             INTEGER,
+        flips               INTEGER,
+        last_status         TEXT,
+        history             INTEGER,
+        history_len         INTEGER,
+        duration_total      REAL,
+        duration_sq_total   REAL,
+        duration_min        REAL,
+        duration_max        REAL,
+        last_duration       REAL,
+        first_seen          REAL,
+        last_seen           REAL,
+        last_run_id         TEXT
+    );
+    """,
+    """
+    CREATE INDEX idx_runs_series ON runs (ts, run_id, timestamp, pass_rate, total, passed,
+                                          failed, duration);
+    """,
+    """
+    CREATE TABLE test_tags (
+        run_id      TEXT NOT NULL,
+        tag         TEXT NOT NULL,
+        idx         INTEGER NOT NULL,
+        PRIMARY KEY (run_id, tag, idx)
+    ) WITHOUT ROWID;
+    CREATE INDEX idx_tests_run_status ON tests (run_id, status);
+    CREATE INDEX idx_tests_run_duration ON tests (run_id, duration);
+    """,
+    """
+    ALTER TABLE runs ADD COLUMN tier TEXT NOT NULL DEFAULT 'full';
+    CREATE INDEX idx_runs_tier ON runs (tier, ts);
+
+    CREATE TABLE test_archive (
+        key                 TEXT PRIMARY KEY,
+        suite               TEXT,
+        name                TEXT,
+        runs                INTEGER,
+        passed              INTEGER,
+        failed              INTEGER,
+        skipped             INTEGER,
+        flips               INTEGER,
+        last_status         TEXT,
+        history             INTEGER,
+        history_len         INTEGER,
+        duration_total      REAL,
+        duration_sq_total   REAL,
+        duration_min        REAL,
+        duration_max        REAL,
+        last_duration       REAL,
+        first_seen          REAL,
+        last_seen           REAL,
+        last_run_id         TEXT
+    );
+
+    CREATE TABLE rollups (
+        period              TEXT NOT NULL,
+        start_ts            REAL NOT NULL,
+        runs                INTEGER,
+        total               INTEGER,
+        passed              INTEGER,
+        failed              INTEGER,
+        skipped             INTEGER,
+        duration_total      REAL,
+        duration_min        REAL,
+        duration_max        REAL,
+        pass_rate_total     REAL,
+        PRIMARY KEY (period, start_ts)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE rollup_stats (
+        period              TEXT NOT NULL,
+        start_ts            REAL NOT NULL,
+        kind                TEXT NOT NULL,
+        name                TEXT NOT NULL,
+        runs                INTEGER,
+        total               INTEGER,
+        passed              INTEGER,
+        failed              INTEGER,
+        pass_rate_total     REAL,
+        PRIMARY KEY (kind, name, period, start_ts)
+    ) WITHOUT ROWID;
+    """,
+    """
+    ALTER TABLE test_aggregates ADD COLUMN duration_ewma REAL;
+    ALTER TABLE test_aggregates ADD COLUMN duration_window TEXT NOT NULL DEFAULT '';
+    ALTER TABLE test_aggregates ADD COLUMN duration_baseline REAL;
+    ALTER TABLE test_aggregates ADD COLUMN duration_score REAL;
+    ALTER TABLE test_aggregates ADD COLUMN slow_streak INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE test_aggregates ADD COLUMN slow_since REAL;
+    ALTER TABLE test_archive ADD COLUMN duration_ewma REAL;
+    ALTER TABLE test_archive ADD COLUMN duration_window TEXT NOT NULL DEFAULT '';
+    ALTER TABLE test_archive ADD COLUMN duration_baseline REAL;
+    ALTER TABLE test_archive ADD COLUMN duration_score REAL;
+    ALTER TABLE test_archive ADD COLUMN slow_streak INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE test_archive ADD COLUMN slow_since REAL;
+    CREATE INDEX idx_test_aggregates_slow ON test_aggregates (last_run_id) WHERE slow_streak > 0;
+    """,
+    """
+    CREATE TABLE failure_signatures (
+        signature   TEXT PRIMARY KEY,
+        message     TEXT NOT NULL,
+        example     TEXT,
+        first_seen  REAL,
+        last_seen   REAL
+    );
+
+    CREATE TABLE test_failures (
+        signature   TEXT NOT NULL,
+        ts          REAL NOT NULL,
+        run_id      TEXT NOT NULL,
+        idx         INTEGER NOT NULL,
+        suite       TEXT NOT NULL,
+        name        TEXT,
+        PRIMARY KEY (signature, ts, run_id, idx)
+    ) WITHOUT ROWID;
+    CREATE INDEX idx_test_failures_run ON test_failures (run_id, idx);
+    CREATE INDEX idx_test_failures_ts ON test_failures (ts, signature);
+    """,
+    """
+    CREATE TABLE keyword_profiles (
+        run_id      TEXT NOT NULL,
+        ts          REAL NOT NULL,
+        owner       TEXT NOT NULL,
+        name        TEXT NOT NULL,
+        calls       INTEGER,
+        total       REAL,
+        self_time   REAL,
+        p50         REAL,
+        p95         REAL,
+        max         REAL,
+        PRIMARY KEY (run_id, owner, name)
+    ) WITHOUT ROWID;
+    CREATE INDEX idx_keyword_profiles_name ON keyword_profiles (owner, name, ts);
+    CREATE INDEX idx_keyword_profiles_ts ON keyword_profiles (ts);
+    """,
+    """
+    ALTER TABLE run_stats ADD COLUMN skipped INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE run_stats ADD COLUMN duration REAL NOT NULL DEFAULT 0;
+    ALTER TABLE rollup_stats ADD COLUMN skipped INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE rollup_stats ADD COLUMN duration_total REAL NOT NULL DEFAULT 0;
+    DROP INDEX idx_run_stats_name;
+    CREATE INDEX idx_run_stats_series ON run_stats (kind, name, ts, run_id, pass_rate, total, passed,
+                                                    failed, skipped, duration);
+    """,
+]
+
+# Derived таблици, които се изграждат наново след съответната миграция
+# (след като цялата схема е приложена - rebuild-ите ползват и по-новите таблици)
+SQLITE_REBUILDS = {
+    2: '_rebuild_test_aggregates',
+    4: '_rebuild_test_tags',
+    6: '_rebuild_test_aggregates',
+    7: '_rebuild_failure_signatures',
+    9: '_rebuild_stat_totals',
+}
+
+# При merge на rollups броячите се събират, min/max се сравняват
+ROLLUP_MERGE = {
+    'duration_min': 'min(duration_min, excluded.duration_min)',
+    'duration_max': 'max(duration_max, excluded.duration_max)',
+}
+
+
+def escape_like(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+SUMMARY_COLUMNS = 'run_id, timestamp, suite_name, duration, total, passed, failed, skipped, pass_rate'
+
+
+class SqliteHistoryStore(HistoryStore):
+    """
+    SQLite index в history volume-а.
+
+    Summary колоните на runs са индексирани по timestamp, така че списъци,
+    trend-ове и последният run са O(limit). Тестовете и tag/suite
+    статистиките са отделни редове, header-ът пази останалата част от run-а.
+    """
+
+    name = 'sqlite'
+    incremental_aggregates = True
+
+    def __init__(self, history_dir: Path):
+        super().__init__(history_dir)
+        self.db_path = self.history_dir / SQLITE_FILENAME
+        self._local = threading.local()
+        self._migrate()
+        self._import_legacy_json()
+
+    # ------------------------------------------------------------------
+    # Connection / schema
+    # ------------------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        """Connection за текущия thread (и процес - след fork се отваря нова)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA foreign_keys=OFF')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _migrate(self):
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            rebuilds = []
+            for number, script in enumerate(SQLITE_MIGRATIONS[version:], start=version + 1):
+                for statement in script.split(';'):
+                    if statement.strip():
+                        conn.execute(statement)
+                if number in SQLITE_REBUILDS and SQLITE_REBUILDS[number] not in rebuilds:
+                    rebuilds.append(SQLITE_REBUILDS[number])
+                conn.execute(f'PRAGMA user_version = {number}')
+            for rebuild in rebuilds:
+                getattr(self, rebuild)(conn)
+
+    def _import_legacy_json(self):
+        """Мигрира run файловете (*.json, *.run) в индекса и ги мести в legacy/"""
+        json_files = sorted(self.history_dir.glob(f'*{LEGACY_SUFFIX}'))
+        json_files += sorted(self.history_dir.glob(f'*{RUN_SUFFIX}'))
+        if not json_files:
+            return
+
+        legacy_dir = self.history_dir / LEGACY_DIRNAME
+        legacy_dir.mkdir(exist_ok=True)
+        imported = 0
+
+        conn = self._connect()
+        with conn:
+            for json_file in json_files:
+                try:
+                    run = read_run(json_file)
+                    if self._insert_run(conn, run, update_aggregates=False):
+                        imported += 1
+                    json_file.rename(legacy_dir / json_file.name)
+                except FileNotFoundError:
+                    # Друг worker вече го е мигрирал
+                    continue
+                except Exception as e:
+                    print(f"Warning: Could not migrate {json_file}: {e}")
+
+            if imported:
+                self._rebuild_test_aggregates(conn)
+
+        if imported:
+            print(f"✓ Migrated {imported} legacy run file(s) into {self.db_path.name}")
+
+    # ------------------------------------------------------------------
+    # Rows -> dicts
+    # ------------------------------------------------------------------
+
+    def _row_to_summary(self, row: sqlite3.Row) -> Dict:
+        return {
+            'run_id': row['run_id'],
+            'timestamp': row['timestamp'],
+            'suite_name': row['suite_name'],
+            'duration': row['duration'],
+            'summary': {
+                'total': row['total'],
+                'passed': row['passed'],
+                'failed': row['failed'],
+                'skipped': row['skipped'],
+                'pass_rate': row['pass_rate']
+            }
+        }
+
+    def _rebuild_test_tags(self, conn: sqlite3.Connection):
+        """Попълва test_tags от JSON колоната tags (миграция към v4)"""
+        conn.execute('DELETE FROM test_tags')
+        rows = conn.execute('SELECT run_id, idx, tags FROM tests').fetchall()
+        conn.executemany(
+            'INSERT OR IGNORE INTO test_tags (run_id, tag, idx) VALUES (?, ?, ?)',
+            [(row['run_id'], tag, row['idx'])
+             for row in rows if row['tags'] for tag in json.loads(row['tags'])]
+        )
+
+    def _row_to_test(self, row: sqlite3.Row) -> Dict:
+        return {
+            'name': row['name'],
+            'suite': row['suite'],
+            'status': row['status'],
+            'start_time': row['start_time'],
+            'end_time': row['end_time'],
+            'duration': row['duration'],
+            'message': row['message'],
+            'tags': json.loads(row['tags']) if row['tags'] else []
+        }
+
+    def _load_tests(self, conn: sqlite3.Connection, run_id: str) -> List[Dict]:
+        rows = conn.execute(
+            'SELECT * FROM tests WHERE run_id = ? ORDER BY idx', (run_id,)
+        )
+        return [self._row_to_test(row) for row in rows]
+
+    # ------------------------------------------------------------------
+    # HistoryStore API
+    # ------------------------------------------------------------------
+
+    def _insert_run(self, conn: sqlite3.Connection, metrics: Dict,
+                    update_aggregates: bool = True) -> bool:
+        run_id = metrics['run_id']
+        summary = metrics['summary']
+        ts = timestamp_to_epoch(metrics.get('timestamp'))
+
+        # header пази реда на ключовете; tests е само placeholder
+        header = json.dumps({**without_profile(metrics), 'tests': None})
+
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO runs (run_id, ts, timestamp, suite_name, duration, '
+            'total, passed, failed, skipped, pass_rate, header) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (run_id, ts, metrics['timestamp'], metrics.get('suite_name', 'Unknown'),
+             metrics.get('duration', 0), summary.get('total', 0), summary.get('passed', 0),
+             summary.get('failed', 0), summary.get('skipped', 0), summary.get('pass_rate', 0),
+             header)
+        )
+        if cursor.rowcount == 0:
+            return False
+
+        tests = metrics.get('tests', [])
+        conn.executemany(
+            'INSERT INTO tests (run_id, idx, name, suite, status, start_time, end_time, '
+            'duration, message, tags) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [
+                (run_id, idx, test.get('name'), test.get('suite') or '', test.get('status'),
+                 test.get('start_time'), test.get('end_time'), test.get('duration', 0),
+                 test.get('message', ''), json.dumps(test.get('tags', [])))
+                for idx, test in enumerate(tests)
+            ]
+        )
+
+        conn.executemany(
+            'INSERT OR IGNORE INTO test_tags (run_id, tag, idx) VALUES (?, ?, ?)',
+            [(run_id, tag, idx) for idx, test in enumerate(tests) for tag in test.get('tags', [])]
+        )
+
+        stats_rows = []
+        for kind, key in (('tag', 'tag_stats'), ('suite', 'suite_stats')):
+            for stat in metrics.get(key, []):
+                stats_rows.append((run_id, kind, stat.get('name') or '', ts, stat.get('total', 0),
+                                   stat.get('passed', 0), stat.get('failed', 0),
+                                   stat.get('skipped', 0), stat.get('pass_rate', 0),
+                                   stat.get('duration', 0)))
+        conn.executemany(
+            'INSERT INTO run_stats (run_id, kind, name, ts, total, passed, failed, skipped, '
+            'pass_rate, duration) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            stats_rows
+        )
+
+        self._insert_failures(conn, run_id, ts, tests)
+        conn.executemany(
+            'INSERT OR IGNORE INTO keyword_profiles (run_id, ts, name, owner, calls, total, '
+            'self_time, p50, p95, max) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(run_id, ts, *row) for row in metrics.get(KEYWORD_PROFILE_KEY) or []]
+        )
+
+        if not update_aggregates:
+            return True
+
+        # Агрегатите очакват runs в хронологичен ред - по-стар run
+        # (backfill) преизгражда засегнатите тестове
+        newer = conn.execute(
+            'SELECT 1 FROM runs WHERE ts > ? AND run_id != ? LIMIT 1', (ts, run_id)
+        ).fetchone()
+        if newer:
+            self._rebuild_test_aggregates(
+                conn, {(test.get('suite') or '', test.get('name')) for test in tests}
+            )
+        else:
+            self._update_test_aggregates(conn, run_id, ts, tests)
+        return True
+
+    # ------------------------------------------------------------------
+    # Failure signatures
+    # ------------------------------------------------------------------
+
+    def _insert_failures(self, conn: sqlite3.Connection, run_id: str, ts: float,
+                         tests: Iterable[Dict]):
+        """Signatures на FAIL тестовете + inverted index signature -> (run, test)"""
+        signatures, rows = {}, []
+        for idx, signature, normalized, test in test_failures(tests):
+            signatures.setdefault(signature, (signature, normalized, test.get('message'), ts, ts))
+            rows.append((signature, ts, run_id, idx, test.get('suite') or '', test.get('name')))
+        if not rows:
+            return
+
+        conn.executemany(
+            'INSERT INTO failure_signatures (signature, message, example, first_seen, last_seen) '
+            'VALUES (?, ?, ?, ?, ?) ON CONFLICT (signature) DO UPDATE SET '
+            'first_seen = min(first_seen, excluded.first_seen), '
+            'last_seen = max(last_seen, excluded.last_seen)',
+            list(signatures.values())
+        )
+        conn.executemany(
+            'INSERT OR IGNORE INTO test_failures (signature, ts, run_id, idx, suite, name) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            rows
+        )
+
+    def _rebuild_failure_signatures(self, conn: sqlite3.Connection):
+        conn.execute('DELETE FROM failure_signatures')
+        conn.execute('DELETE FROM test_failures')
+        rows = conn.execute(
+            "SELECT t.run_id, t.idx, t.suite, t.name, t.status, t.message, r.ts AS run_ts "
+            "FROM tests t JOIN runs r ON r.run_id = t.run_id WHERE t.status = 'FAIL' "
+            "ORDER BY r.ts, t.run_id, t.idx"
+        )
+        run_id, ts, tests = None, None, []
+        for row in rows:
+            if row['run_id'] != run_id:
+                if tests:
+                    self._insert_failures(conn, run_id, ts, tests)
+                run_id, ts, tests = row['run_id'], row['run_ts'], []
+            # idx трябва да съвпада с tests.idx - празни места до него
+            tests.extend({} for _ in range(row['idx'] - len(tests)))
+            tests.append(dict(row))
+        if tests:
+            self._insert_failures(conn, run_id, ts, tests)
+
+    def _rebuild_stat_totals(self, conn: sqlite3.Connection):
+        """skipped/duration на tag/suite статистиките отпреди v9 - от тестовете на run-а"""
+        rows = conn.execute('SELECT run_id, suite, status, duration, tags FROM tests ORDER BY run_id')
+        run_id, tests = None, []
+        for row in rows:
+            if row['run_id'] != run_id:
+                if tests:
+                    self._update_stat_totals(conn, run_id, tests)
+                run_id, tests = row['run_id'], []
+            tests.append({**dict(row), 'tags': json.loads(row['tags'] or '[]')})
+        if tests:
+            self._update_stat_totals(conn, run_id, tests)
+
+    def _update_stat_totals(self, conn: sqlite3.Connection, run_id: str, tests: List[Dict]):
+        totals = test_stat_totals(tests)
+        updates = []
+        for row in conn.execute('SELECT rowid, kind, name FROM run_stats WHERE run_id = ?', (run_id,)):
+            duration, skipped = stat_totals(totals, row['kind'], row['name'])
+            updates.append((skipped, round(duration, 2), row['rowid']))
+        conn.executemany('UPDATE run_stats SET skipped = ?, duration = ? WHERE rowid = ?', updates)
+
+    # ------------------------------------------------------------------
+    # Per-test агрегати
+    # ------------------------------------------------------------------
+
+    def _load_aggregates(self, conn: sqlite3.Connection, keys: Iterable[str],
+                         table: str = 'test_aggregates') -> Dict[str, TestAggregate]:
+        keys = list(keys)
+        aggregates = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = conn.execute(
+                f'SELECT * FROM {table} WHERE key IN ({",".join("?" * len(chunk))})',
+                chunk
+            )
+            for row in rows:
+                aggregates[row['key']] = TestAggregate.from_row(row)
+        return aggregates
+
+    def _write_aggregates(self, conn: sqlite3.Connection, aggregates: Iterable[TestAggregate],
+                          table: str = 'test_aggregates'):
+        columns = TestAggregate.FIELDS
+        conn.executemany(
+            f'INSERT OR REPLACE INTO {table} ({", ".join(columns)}) '
+            f'VALUES ({", ".join("?" * len(columns))})',
+            [agg.to_row() for agg in aggregates]
+        )
+
+    def _update_test_aggregates(self, conn: sqlite3.Connection, run_id: str, ts: float,
+                                tests: List[Dict]):
+        aggregates = self._load_aggregates(conn, {test_key(test) for test in tests})
+        for test in tests:
+            key = test_key(test)
+            agg = aggregates.get(key)
+            if agg is None:
+                agg = aggregates[key] = TestAggregate.for_test(test)
+            agg.update(test, run_id, ts)
+        self._write_aggregates(conn, aggregates.values())
+
+    def _rebuild_test_aggregates(self, conn: sqlite3.Connection, tests: Optional[set] = None):
+        """
+        Преизгражда агрегатите от tests - на всички или само на (suite, name)
+        от `tests`. Свитите runs нямат редове в tests - началото е test_archive.
+        """
+        query = ('SELECT t.*, r.ts AS run_ts FROM tests t JOIN runs r ON r.run_id = t.run_id '
+                 '{where} ORDER BY r.ts, r.run_id, t.idx')
+
+        if tests is None:
+            conn.execute('DELETE FROM test_aggregates')
+            aggregates = {
+                row['key']: TestAggregate.from_row(row)
+                for row in conn.execute('SELECT * FROM test_archive')
+            }
+            batches = [conn.execute(query.format(where=''))]
+        else:
+            keys = [test_key({'suite': suite, 'name': name}) for suite, name in tests]
+            aggregates = self._load_aggregates(conn, keys, table='test_archive')
+            batches = []
+            for (suite, name), key in zip(tests, keys):
+                conn.execute('DELETE FROM test_aggregates WHERE key = ?', (key,))
+                batches.append(conn.execute(
+                    query.format(where='WHERE t.suite = ? AND t.name = ?'), (suite, name)
+                ).fetchall())
+
+        for rows in batches:
+            for row in rows:
+                test = self._row_to_test(row)
+                key = test_key(test)
+                agg = aggregates.get(key)
+                if agg is None:
+                    agg = aggregates[key] = TestAggregate.for_test(test)
+                agg.update(test, row['run_id'], row['run_ts'])
+        self._write_aggregates(conn, aggregates.values())
+
+    def save_run(self, metrics: Dict) -> bool:
+        conn = self._connect()
+        with conn:
+            return self._insert_run(conn, metrics)
+
+    def save_runs(self, runs: List[Dict]) -> int:
+        """Bulk insert в една транзакция"""
+        runs = sorted(runs, key=lambda run: timestamp_to_epoch(run.get('timestamp')))
+        if not runs:
+            return 0
+
+        conn = self._connect()
+        with conn:
+            latest = conn.execute('SELECT MAX(ts) FROM runs').fetchone()[0]
+            if latest is None or timestamp_to_epoch(runs[0].get('timestamp')) >= latest:
+                # Само по-нови runs - агрегатите се обновяват инкрементално
+                return sum(1 for run in runs if self._insert_run(conn, run))
+
+            # Backfill - агрегатите на засегнатите тестове се преизграждат веднъж
+            created = 0
+            tests = set()
+            for run in runs:
+                if self._insert_run(conn, run, update_aggregates=False):
+                    created += 1
+                    tests.update((t.get('suite') or '', t.get('name')) for t in run.get('tests', []))
+            self._rebuild_test_aggregates(conn, tests)
+        return created
+
+    def has_run(self, run_id: str) -> bool:
+        row = self._connect().execute(
+            'SELECT 1 FROM runs WHERE run_id = ?', (run_id,)
+        ).fetchone()
+        return row is not None
+
+    def run_tier(self, run_id: str) -> Optional[str]:
+        row = self._connect().execute('SELECT tier FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+        return row['tier'] if row else None
+
+    def get_run(self, run_id: str, include_tests: bool = True) -> Optional[Dict]:
+        conn = self._connect()
+        row = conn.execute('SELECT header, tier FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+        if row is None:
+            return None
+
+        run = json.loads(row['header'])
+        if row['tier'] != TIER_FULL:
+            # Тестовете са архивирани от compactor-а
+            run['tier'] = row['tier']
+            run['tests'] = []
+        elif include_tests:
+            run['tests'] = self._load_tests(conn, run_id)
+        else:
+            run.pop('tests', None)
+        return run
+
+    def list_runs(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        rows = self._connect().execute(
+            f'SELECT {SUMMARY_COLUMNS} FROM runs ORDER BY ts DESC, run_id LIMIT ? OFFSET ?',
+            (limit if limit is not None else -1, offset)
+        )
+        return [self._row_to_summary(row) for row in rows]
+
+    def count_runs(self) -> int:
+        return self._connect().execute('SELECT COUNT(*) FROM runs').fetchone()[0]
+
+    def list_runs_page(self, limit: int, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        # Keyset pagination по idx_runs_ts (ts DESC, run_id)
+        where, params = '', []
+        if cursor:
+            ts, run_id = decode_cursor(cursor)
+            where = 'WHERE ts < ? OR (ts = ? AND run_id > ?)'
+            params = [ts, ts, run_id]
+        rows = self._connect().execute(
+            f'SELECT ts, {SUMMARY_COLUMNS} FROM runs {where} ORDER BY ts DESC, run_id LIMIT ?',
+            params + [limit + 1]
+        ).fetchall()
+        return self._page([((-row['ts'], row['run_id']), self._row_to_summary(row))
+                           for row in rows], limit)
+
+    def run_tests(self, run_id: str, offset: int = 0, limit: Optional[int] = 100,
+                  statuses: Optional[List[str]] = None, tag: Optional[str] = None,
+                  suite: Optional[str] = None, q: Optional[str] = None, sort: str = 'index',
+                  fields: Optional[List[str]] = None,
+                  max_message: Optional[int] = None) -> Optional[Dict]:
+        fields = test_query(fields, sort)
+        if not self.has_run(run_id):
+            return None
+
+        where, params = ['t.run_id = ?'], [run_id]
+        if statuses:
+            where.append(f"t.status IN ({', '.join('?' * len(statuses))})")
+            params.extend(statuses)
+        if tag:
+            where.append('t.idx IN (SELECT idx FROM test_tags WHERE run_id = ? AND tag = ?)')
+            params.extend([run_id, tag])
+        if suite:
+            where.append("(t.suite = ? OR t.suite LIKE ? ESCAPE '\\')")
+            params.extend([suite, escape_like(suite) + '.%'])
+        if q:
+            where.append("t.name LIKE ? ESCAPE '\\'")
+            params.append('%' + escape_like(q) + '%')
+        where = ' AND '.join(where)
+
+        conn = self._connect()
+        total = conn.execute(f'SELECT COUNT(*) FROM tests t WHERE {where}', params).fetchone()[0]
+
+        columns, column_params = [], []
+        for field in fields:
+            if field == 'message' and max_message is not None:
+                columns.append('substr(t.message, 1, ?) AS message')
+                column_params.append(max_message)
+            else:
+                columns.append(f't.{field}')
+        order = {
+            'index': 't.idx',
+            'duration': 't.duration DESC, t.idx',
+            'name': 't.name, t.idx',
+        }[sort]
+        rows = conn.execute(
+            f"SELECT {', '.join(columns)} FROM tests t WHERE {where} ORDER BY {order} "
+            'LIMIT ? OFFSET ?',
+            column_params + params + [limit if limit is not None else -1, offset]
+        )
+
+        tests = []
+        for row in rows:
+            test = dict(row)
+            if 'tags' in test:
+                test['tags'] = json.loads(test['tags']) if test['tags'] else []
+            tests.append(test)
+
+        return {
+            'run_id': run_id,
+            'total': total,
+            'offset': offset,
+            'limit': limit,
+            'tests': tests
+        }
+
+    def series_points(self, start: Optional[float] = None, end: Optional[float] = None) -> List[Dict]:
+        # idx_runs_series е covering index - header-ите не се четат
+        rows = self._connect().execute(
+            'SELECT ts, run_id, timestamp, pass_rate, total, passed, failed, duration '
+            'FROM runs INDEXED BY idx_runs_series WHERE ts >= ? AND ts <= ? ORDER BY ts',
+            (start if start is not None else float('-inf'),
+             end if end is not None else float('inf'))
+        )
+        return self._with_rollup_points([dict(row) for row in rows], start, end)
+
+    def stat_points(self, kind: str, name: str, start: Optional[float] = None,
+                    end: Optional[float] = None) -> List[Dict]:
+        # Range scan по covering index-а - цената е по броя върнати точки, не по историята
+        rows = self._connect().execute(
+            'SELECT s.ts, s.run_id, r.timestamp, s.pass_rate, s.total, s.passed, s.failed, '
+            's.skipped, s.duration FROM run_stats AS s INDEXED BY idx_run_stats_series '
+            'JOIN runs AS r ON r.run_id = s.run_id '
+            'WHERE s.kind = ? AND s.name = ? AND s.ts >= ? AND s.ts <= ? ORDER BY s.ts, s.run_id',
+            (kind, name, start if start is not None else float('-inf'),
+             end if end is not None else float('inf'))
+        )
+        return self._with_rollup_points([dict(row) for row in rows], start, end, stat=(kind, name))
+
+    def delete_run(self, run_id: str) -> bool:
+        conn = self._connect()
+        with conn:
+            tests = {
+                (row['suite'], row['name'])
+                for row in conn.execute('SELECT suite, name FROM tests WHERE run_id = ?', (run_id,))
+            }
+            cursor = conn.execute('DELETE FROM runs WHERE run_id = ?', (run_id,))
+            conn.execute('DELETE FROM tests WHERE run_id = ?', (run_id,))
+            conn.execute('DELETE FROM test_tags WHERE run_id = ?', (run_id,))
+            conn.execute('DELETE FROM run_stats WHERE run_id = ?', (run_id,))
+            conn.execute('DELETE FROM test_failures WHERE run_id = ?', (run_id,))
+            conn.execute('DELETE FROM keyword_profiles WHERE run_id = ?', (run_id,))
+            self._rebuild_test_aggregates(conn, tests)
+        return cursor.rowcount > 0
+
+    def clear(self) -> int:
+        conn = self._connect()
+        with conn:
+            deleted_count = conn.execute('SELECT COUNT(*) FROM runs').fetchone()[0]
+            conn.execute('DELETE FROM runs')
+            conn.execute('DELETE FROM tests')
+            conn.execute('DELETE FROM test_tags')
+            conn.execute('DELETE FROM run_stats')
+            conn.execute('DELETE FROM test_aggregates')
+            conn.execute('DELETE FROM test_archive')
+            conn.execute('DELETE FROM rollups')
+            conn.execute('DELETE FROM rollup_stats')
+            conn.execute('DELETE FROM failure_signatures')
+            conn.execute('DELETE FROM test_failures')
+            conn.execute('DELETE FROM keyword_profiles')
+        return deleted_count
+
+    # ------------------------------------------------------------------
+    # Retention
+    # ------------------------------------------------------------------
+
+    def compact(self, policy: RetentionPolicy, now: Optional[float] = None,
+                batch_size: int = COMPACT_BATCH_SIZE) -> Dict:
+        result = {'compacted': 0, 'rolled_up': 0}
+        if not policy.enabled:
+            return result
+
+        now = time.time() if now is None else now
+        conn = self._connect()
+        nth_newest = None
+        if policy.full_runs:
+            row = conn.execute(
+                'SELECT ts FROM runs ORDER BY ts DESC, run_id LIMIT 1 OFFSET ?',
+                (policy.full_runs - 1,)
+            ).fetchone()
+            nth_newest = row['ts'] if row else None
+        keep_full_after, rollup_before = policy.cutoffs(now, nth_newest)
+
+        while True:
+            # Кратки транзакции - ingest-ът не чака целия compaction
+            with conn:
+                rows = conn.execute(
+                    'SELECT run_id, ts, tier, header FROM runs '
+                    'WHERE (tier = ? AND ts < ?) OR ts < ? ORDER BY ts, run_id LIMIT ?',
+                    (TIER_FULL, keep_full_after, rollup_before, batch_size)
+                ).fetchall()
+                for row in rows:
+                    if row['tier'] == TIER_FULL:
+                        self._archive_tests(conn, row['run_id'], row['ts'])
+
+                rolled_up = [row for row in rows if row['ts'] < rollup_before]
+                compacted = [row['run_id'] for row in rows if row['ts'] >= rollup_before]
+                if rolled_up:
+                    self._rollup_runs(conn, rolled_up)
+                conn.executemany('UPDATE runs SET tier = ? WHERE run_id = ?',
+                                 [(TIER_SUMMARY, run_id) for run_id in compacted])
+
+            result['compacted'] += len(compacted)
+            result['rolled_up'] += len(rolled_up)
+            if len(rows) < batch_size:
+                return result
+
+    def _archive_tests(self, conn: sqlite3.Connection, run_id: str, ts: float):
+        """Мести тестовете на run в test_archive (test_aggregates вече ги съдържат)"""
+        tests = self._load_tests(conn, run_id)
+        archive = self._load_aggregates(conn, {test_key(test) for test in tests},
+                                        table='test_archive')
+        for test in tests:
+            key = test_key(test)
+            agg = archive.get(key)
+            if agg is None:
+                agg = archive[key] = TestAggregate.for_test(test)
+            agg.update(test, run_id, ts)
+        self._write_aggregates(conn, archive.values(), table='test_archive')
+        conn.execute('DELETE FROM tests WHERE run_id = ?', (run_id,))
+        conn.execute('DELETE FROM test_tags WHERE run_id = ?', (run_id,))
+
+    def _rollup_runs(self, conn: sqlite3.Connection, rows: List[sqlite3.Row]):
+        """Добавя runs към rollups/rollup_stats и ги изтрива"""
+        rollups, stats = {}, {}
+        for row in rows:
+            rollup_run(rollups, stats, row['ts'], json.loads(row['header']))
+
+        for table, fields, keys, values in (
+            ('rollups', ROLLUP_FIELDS, ('period', 'start_ts'), rollups.values()),
+            ('rollup_stats', ROLLUP_STAT_FIELDS, ('kind', 'name', 'period', 'start_ts'),
+             stats.values()),
+        ):
+            updates = ', '.join(
+                f"{field} = {ROLLUP_MERGE.get(field, f'{field} + excluded.{field}')}"
+                for field in fields if field not in keys
+            )
+            conn.executemany(
+                f'INSERT INTO {table} ({", ".join(fields)}) VALUES ({", ".join("?" * len(fields))}) '
+                f'ON CONFLICT ({", ".join(keys)}) DO UPDATE SET {updates}',
+                [tuple(value[field] for field in fields) for value in values]
+            )
+
+        run_ids = [(row['run_id'],) for row in rows]
+        for table in ('runs', 'tests', 'test_tags', 'run_stats', 'test_failures', 'keyword_profiles'):
+            conn.executemany(f'DELETE FROM {table} WHERE run_id = ?', run_ids)
+
+    def rollups(self, period: str = 'day', start: Optional[float] = None,
+                end: Optional[float] = None) -> List[Dict]:
+        rows = self._connect().execute(
+            'SELECT * FROM rollups WHERE period = ? AND start_ts >= ? AND start_ts <= ? '
+            'ORDER BY start_ts',
+            (period, start if start is not None else float('-inf'),
+             end if end is not None else float('inf'))
+        )
+        return [dict(row) for row in rows]
+
+    def rollup_stats(self, kind: str, name: str, period: str = 'day',
+                     start: Optional[float] = None, end: Optional[float] = None) -> List[Dict]:
+        rows = self._connect().execute(
+            'SELECT * FROM rollup_stats WHERE kind = ? AND name = ? AND period = ? '
+            'AND start_ts >= ? AND start_ts <= ? ORDER BY start_ts',
+            (kind, name, period, start if start is not None else float('-inf'),
+             end if end is not None else float('inf'))
+        )
+        return [dict(row) for row in rows]
+
+    def _load_keyword_profile(self, run_id: str) -> Optional[List[list]]:
+        rows = self._connect().execute(
+            f'SELECT {", ".join(PROFILE_FIELDS)} FROM keyword_profiles WHERE run_id = ? '
+            'ORDER BY self_time DESC, name, owner',
+            (run_id,)
+        )
+        return [list(row) for row in rows]
+
+    def hot_keywords(self, start: Optional[float] = None, end: Optional[float] = None,
+                     sort: str = 'self_time', limit: int = 20) -> List[Dict]:
+        if sort not in HOT_SORTS:
+            raise ValueError(f"Invalid sort: {sort} (expected: {', '.join(HOT_SORTS)})")
+        rows = self._connect().execute(
+            'SELECT name, owner, COUNT(*) AS runs, SUM(calls) AS calls, '
+            'ROUND(SUM(total), 3) AS total, ROUND(SUM(self_time), 3) AS self_time, '
+            'MAX(p95) AS p95, MAX(max) AS max FROM keyword_profiles '
+            'WHERE ts >= ? AND ts <= ? GROUP BY owner, name '
+            f'ORDER BY {sort} DESC, owner, name LIMIT ?',
+            (start if start is not None else float('-inf'),
+             end if end is not None else float('inf'), limit)
+        )
+        keywords = []
+        for row in rows:
+            keyword = {'keyword': keyword_key(row['name'], row['owner']), **dict(row)}
+            keyword['avg'] = round(row['total'] / row['calls'], 4) if row['calls'] else 0
+            keywords.append(keyword)
+        return keywords
+
+    def keyword_trend(self, name: str, owner: str = '', start: Optional[float] = None,
+                      end: Optional[float] = None) -> List[Dict]:
+        rows = self._connect().execute(
+            'SELECT k.*, r.timestamp FROM keyword_profiles k JOIN runs r ON r.run_id = k.run_id '
+            'WHERE k.owner = ? AND k.name = ? AND k.ts >= ? AND k.ts <= ? ORDER BY k.ts, k.run_id',
+            (owner, name, start if start is not None else float('-inf'),
+             end if end is not None else float('inf'))
+        )
+        return [keyword_point(row['run_id'], row['timestamp'], row) for row in rows]
+
+    def failure_clusters(self, run_id: str) -> Optional[List[Dict]]:
+        conn = self._connect()
+        if not conn.execute('SELECT 1 FROM runs WHERE run_id = ?', (run_id,)).fetchone():
+            return None
+        rows = conn.execute(
+            'SELECT f.signature, f.idx, f.suite, f.name, s.message, '
+            'COALESCE(t.message, s.example) AS example '
+            'FROM test_failures f JOIN failure_signatures s ON s.signature = f.signature '
+            'LEFT JOIN tests t ON t.run_id = f.run_id AND t.idx = f.idx '
+            'WHERE f.run_id = ? ORDER BY f.idx',
+            (run_id,)
+        )
+        clusters = {}
+        for row in rows:
+            cluster = clusters.get(row['signature'])
+            if cluster is None:
+                cluster = clusters[row['signature']] = cluster_entry(
+                    row['signature'], row['message'], row['example'])
+            cluster['count'] += 1
+            cluster['tests'].append({
+                'idx': row['idx'],
+                'key': test_key({'suite': row['suite'], 'name': row['name']}),
+                'suite': row['suite'],
+                'name': row['name']
+            })
+        return sorted_clusters(clusters.values())
+
+    def failure_signatures(self, start: Optional[float] = None, end: Optional[float] = None,
+                           limit: int = 20) -> List[Dict]:
+        rows = self._connect().execute(
+            'SELECT f.signature, s.message, s.example, COUNT(*) AS failures, '
+            'COUNT(DISTINCT f.run_id) AS runs, COUNT(DISTINCT f.suite || char(0) || f.name) AS tests, '
+            'MIN(f.ts) AS first_seen, MAX(f.ts) AS last_seen '
+            'FROM test_failures f JOIN failure_signatures s ON s.signature = f.signature '
+            'WHERE f.ts >= ? AND f.ts <= ? GROUP BY f.signature '
+            'ORDER BY failures DESC, f.signature LIMIT ?',
+            (start if start is not None else float('-inf'),
+             end if end is not None else float('inf'), limit)
+        )
+        return [dict(row) for row in rows]
+
+    def signature_failures(self, signature: str, limit: int = 100) -> Optional[Dict]:
+        conn = self._connect()
+        row = conn.execute('SELECT signature, message, example FROM failure_signatures '
+                           'WHERE signature = ?', (signature,)).fetchone()
+        if row is None:
+            return None
+        rows = conn.execute(
+            'SELECT f.run_id, r.timestamp, f.idx, f.suite, f.name FROM test_failures f '
+            'LEFT JOIN runs r ON r.run_id = f.run_id WHERE f.signature = ? '
+            'ORDER BY f.ts DESC, f.run_id, f.idx LIMIT ?',
+            (signature, limit)
+        )
+        failures = [{**dict(r), 'key': test_key({'suite': r['suite'], 'name': r['name']})}
+                    for r in rows]
+        return {**dict(row), 'failures': failures}
+
+    def test_aggregates(self) -> List[TestAggregate]:
+        rows = self._connect().execute('SELECT * FROM test_aggregates')
+        return [TestAggregate.from_row(row) for row in rows]
+
+    def test_aggregate(self, key: str) -> Optional[TestAggregate]:
+        row = self._connect().execute(
+            'SELECT * FROM test_aggregates WHERE key = ?', (key,)
+        ).fetchone()
+        return TestAggregate.from_row(row) if row else None
+
+    def slow_test_aggregates(self, run_id: Optional[str] = None) -> List[TestAggregate]:
+        query = 'SELECT * FROM test_aggregates WHERE slow_streak > 0'
+        params = ()
+        if run_id is not None:
+            query += ' AND last_run_id = ?'
+            params = (run_id,)
+        return [TestAggregate.from_row(row) for row in self._connect().execute(query, params)]
+
+    def test_executions(self, suite: str, name: str, limit: int = 50) -> List[Dict]:
+        rows = self._connect().execute(
+            'SELECT r.run_id, r.timestamp, t.status, t.duration, t.message '
+            'FROM tests t JOIN runs r ON r.run_id = t.run_id '
+            'WHERE t.suite = ? AND t.name = ? ORDER BY r.ts DESC LIMIT ?',
+            (suite, name, limit)
+        )
+        return [dict(row) for row in rows]
+
+
+class HistoryGeneration:
+    """
+    Брояч на промените в историята, общ за всички процеси.
+
+    Всеки ingest/delete/clear го увеличава. Стойността е във файл в
+    history_dir (gunicorn workers и ingest service-ът го виждат веднага),
+    а mtime-ът на файла е Last-Modified на API отговорите.
+    """
+
+    def __init__(self, history_dir):
+        self.path = Path(history_dir) / GENERATION_FILENAME
+        self._lock_path = self.path.with_name(f".{GENERATION_FILENAME}.lock")
+        self._stat_key = None
+        self._value = (0, 0.0)
+
+    def current(self):
+        """(generation, mtime) - файлът се чете само ако stat-ът се е сменил"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return 0, 0.0
+
+        stat_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if stat_key != self._stat_key:
+            try:
+                with open(self.path, 'r') as f:
+                    value = int(f.read().strip() or 0)
+            except (FileNotFoundError, ValueError):
+                return 0, 0.0
+            self._value = (value, stat.st_mtime)
+            self._stat_key = stat_key
+        return self._value
+
+    def bump(self) -> int:
+        """Увеличава generation-а (atomic rename под flock)"""
+        with open(self._lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(self.path, 'r') as f:
+                    value = int(f.read().strip() or 0) + 1
+            except (FileNotFoundError, ValueError):
+                value = 1
+
+            tmp_path = self.path.with_name(f".{GENERATION_FILENAME}.{os.getpid()}.tmp")
+            with open(tmp_path, 'w') as f:
+                f.write(str(value))
+            os.replace(tmp_path, self.path)
+        return value
+
+
+HISTORY_BACKENDS = {
+    FileHistoryStore.name: FileHistoryStore,
+    # Старото име на файловия backend
+    'json': FileHistoryStore,
+    SqliteHistoryStore.name: SqliteHistoryStore,
+}
+
+
+def create_history_store(history_dir, backend: Optional[str] = None) -> HistoryStore:
+    """Създава history backend според METRICS_HISTORY_BACKEND (default: sqlite)"""
+    backend = backend or os.getenv('METRICS_HISTORY_BACKEND', DEFAULT_BACKEND)
+
+    store_class = HISTORY_BACKENDS.get(backend.lower())
+    if store_class is None:
+        raise ValueError(
+            f"Unknown history backend '{backend}' (expected one of: {', '.join(HISTORY_BACKENDS)})"
+        )
+    return store_class(Path(history_dir))
@@ -0,0 +1,326 @@
+"""
+Robot Framework Metrics Ingest Service
+Следи results директорията и парсва нови output.xml файлове
+"""
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
+
+from instrumentation import REGISTRY
+from metrics_parser import MetricsParser
+from namespaces import DEFAULT_NAMESPACE, NamespaceRegistry, validate_namespace
+from retention import RetentionPolicy
+
+
+# Status файлът е в поддиректория - *.json в history_dir са runs
+INGEST_DIRNAME = 'ingest'
+STATUS_FILENAME = 'status.json'
+
+
+def write_json_atomic(path: Path, data: Dict):
+    """Записва JSON през временен файл + rename (читателите не виждат половин файл)"""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_ingest_status(history_dir) -> Optional[Dict]:
+    """Последният статус, записан от ingest service-а (или None)"""
+    status_path = Path(history_dir) / INGEST_DIRNAME / STATUS_FILENAME
+    try:
+        with open(status_path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+class OutputXmlHandler(FileSystemEventHandler):
+    """Препраща събитията за output.xml към service-а"""
+
+    def __init__(self, service: 'IngestService'):
+        self.service = service
+
+    def _handle(self, path: str):
+        path = Path(path)
+        if path.name != 'output.xml' or 'pabot_results' in path.parts:
+            return
+        self.service.schedule(path)
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._handle(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._handle(event.src_path)
+
+    def on_closed(self, event):
+        if not event.is_directory:
+            self._handle(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self._handle(event.dest_path)
+
+
+class IngestService:
+    """
+    Event-driven ingest на output.xml.
+
+    Събитията от watchdog само маркират файла като pending. Worker
+    thread-ът го парсва, когато е спрял да се променя поне `debounce`
+    секунди и завършва с </robot>. Run ID-то е sha256 на файла, така че
+    run, който вече е в историята на namespace-а (и след рестарт), струва
+    само hash pass.
+
+    Файловете от results директорията отиват в `namespace`; compactor-ът
+    прилага retention политиката на всеки namespace поотделно.
+    """
+
+    def __init__(self, results_dir: str, history_dir: str, debounce: float = 2.0,
+                 polling: bool = False, retention: Optional[RetentionPolicy] = None,
+                 compact_interval: float = 3600, namespace: str = DEFAULT_NAMESPACE):
+        self.results_dir = Path(results_dir)
+        self.history_dir = Path(history_dir)
+        self.debounce = debounce
+        self.polling = polling
+        self.retention = retention or RetentionPolicy()
+        self.compact_interval = compact_interval
+        self.namespace = namespace
+
+        self.namespaces = NamespaceRegistry(history_dir, lambda path: MetricsParser(results_dir, path))
+        self.parser = self.namespaces.get(namespace, create=True)
+        ingest_dir = self.history_dir / INGEST_DIRNAME
+        ingest_dir.mkdir(parents=True, exist_ok=True)
+        self.status_path = ingest_dir / STATUS_FILENAME
+
+        self._pending = {}  # path -> (last event time, last seen (size, mtime))
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._observer = None
+
+        self.status = {
+            'pid': os.getpid(),
+            'started_at': datetime.now().isoformat(),
+            'updated_at': None,
+            'watching': str(self.results_dir),
+            'namespace': namespace,
+            'observer': 'polling' if polling else 'inotify',
+            'queue_depth': 0,
+            'processed_total': 0,
+            'skipped_total': 0,
+            'errors_total': 0,
+            'last_ingest': None,
+            'retention': self.retention.to_dict() if self.retention.enabled else None,
+            'last_compaction': None
+        }
+
+    # ------------------------------------------------------------------
+    # Status
+    # ------------------------------------------------------------------
+
+    def _publish_status(self, **changes):
+        with self._condition:
+            self.status.update(changes)
+            self.status['queue_depth'] = len(self._pending)
+            self.status['updated_at'] = datetime.now().isoformat()
+            status = dict(self.status)
+        REGISTRY.set('rf_metrics_ingest_queue_depth', status['queue_depth'])
+        REGISTRY.flush(force=True)
+        try:
+            write_json_atomic(self.status_path, status)
+        except OSError as e:
+            print(f"Warning: Could not write ingest status: {e}")
+
+    # ------------------------------------------------------------------
+    # Queue
+    # ------------------------------------------------------------------
+
+    def schedule(self, path: Path):
+        """Маркира файла за ingest (повторните събития само отлагат парсването)"""
+        signature = self._file_signature(path)
+        with self._condition:
+            self._pending[path] = (time.monotonic(), signature)
+            self._condition.notify()
+
+    def _file_signature(self, path: Path):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _is_complete(self, path: Path) -> bool:
+        """output.xml е затворен, когато завършва с </robot>"""
+        try:
+            with open(path, 'rb') as f:
+                f.seek(max(path.stat().st_size - 64, 0))
+                return b'</robot>' in f.read()
+        except OSError:
+            return False
+
+    def _next_ready(self) -> Optional[Path]:
+        """Чака, докато някой pending файл стане стабилен"""
+        with self._condition:
+            while not self._stopped.is_set():
+                now = time.monotonic()
+                wait = None
+                for path, (last_event, last_signature) in list(self._pending.items()):
+                    remaining = self.debounce - (now - last_event)
+                    if remaining > 0:
+                        wait = remaining if wait is None else min(wait, remaining)
+                        continue
+
+                    signature = self._file_signature(path)
+                    if signature is None:
+                        del self._pending[path]
+                        continue
+                    if signature != last_signature or not self._is_complete(path):
+                        # Все още се пише - проверяваме пак след debounce
+                        self._pending[path] = (now, signature)
+                        wait = self.debounce if wait is None else min(wait, self.debounce)
+                        continue
+
+                    del self._pending[path]
+                    return path
+
+                self._condition.wait(timeout=wait)
+        return None
+
+    # ------------------------------------------------------------------
+    # Ingest
+    # ------------------------------------------------------------------
+
+    def ingest(self, path: Path) -> Optional[str]:
+        """Парсва и записва един output.xml; връща run_id (или None)"""
+        try:
+            file_mtime = path.stat().st_mtime
+            content_hash = self.parser.content_hash(path)
+        except FileNotFoundError:
+            return None
+
+        print(f"\n🔄 New output.xml detected, parsing {path}...")
+        parse_started = time.time()
+        run_id, created = self.parser.ingest_output_xml(path, content_hash=content_hash)
+        if not run_id:
+            self._publish_status(errors_total=self.status['errors_total'] + 1)
+            return None
+
+        finished = time.time()
+        if not created:
+            # Вече е в историята (предишен ingest или /api/parse)
+            self._publish_status(skipped_total=self.status['skipped_total'] + 1)
+            return run_id
+
+        self._publish_status(
+            processed_total=self.status['processed_total'] + 1,
+            last_ingest={
+                'path': str(path),
+                'run_id': run_id,
+                'file_mtime': datetime.fromtimestamp(file_mtime).isoformat(),
+                'parse_seconds': round(finished - parse_started, 3),
+                'latency_seconds': round(finished - file_mtime, 3),
+                'finished_at': datetime.fromtimestamp(finished).isoformat()
+            }
+        )
+        return run_id
+
+    def _worker(self):
+        while not self._stopped.is_set():
+            path = self._next_ready()
+            if path is None:
+                continue
+            try:
+                self.ingest(path)
+            except Exception as e:
+                print(f"❌ Error ingesting {path}: {e}")
+                self._publish_status(errors_total=self.status['errors_total'] + 1)
+
+    def _compactor(self):
+        """Прилага retention политиките на всеки compact_interval секунди"""
+        while not self._stopped.wait(self.compact_interval):
+            started = time.time()
+            results = {}
+            for namespace in self.namespaces.names():
+                # Namespace без собствена политика (namespace.json) наследява тази на service-а
+                policy = self.namespaces.retention(namespace, self.retention)
+                if not policy.enabled:
+                    continue
+                try:
+                    results[namespace] = self.namespaces.get(namespace).compact_history(policy)
+                except Exception as e:
+                    print(f"❌ Error compacting history of {namespace}: {e}")
+                    self._publish_status(errors_total=self.status['errors_total'] + 1)
+            if not results:
+                continue
+            self._publish_status(last_compaction={
+                'compacted': sum(r['compacted'] for r in results.values()),
+                'rolled_up': sum(r['rolled_up'] for r in results.values()),
+                'namespaces': results,
+                'seconds': round(time.time() - started, 3),
+                'finished_at': datetime.now().isoformat()
+            })
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self):
+        self.results_dir.mkdir(parents=True, exist_ok=True)
+
+        observer_class = PollingObserver if self.polling else Observer
+        self._observer = observer_class()
+        self._observer.schedule(OutputXmlHandler(self), str(self.results_dir), recursive=False)
+        self._observer.start()
+
+        threading.Thread(target=self._worker, name='ingest-worker', daemon=True).start()
+        threading.Thread(target=self._compactor, name='history-compactor', daemon=True).start()
+
+        # Файл, записан докато service-ът не е работил
+        output_file = self.results_dir / 'output.xml'
+        if output_file.exists():
+            self.schedule(output_file)
+
+        self._publish_status()
+        print(f"Watching: {self.results_dir} ({self.status['observer']}) -> namespace {self.namespace}")
+        print("✓ Ingest service started")
+
+    def stop(self):
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._observer:
+            self._observer.stop()
+            self._observer.join()
+
+    def run_forever(self):
+        self.start()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+if __name__ == '__main__':
+    service = IngestService(
+        os.getenv('ROBOT_RESULTS_DIR', '/robot_results'),
+        os.path.join(os.getenv('METRICS_DATA_DIR', '/app/data'), 'history'),
+        debounce=float(os.getenv('METRICS_INGEST_DEBOUNCE', '2')),
+        polling=os.getenv('METRICS_INGEST_POLLING', 'false').lower() == 'true',
+        retention=RetentionPolicy.from_env(),
+        compact_interval=float(os.getenv('METRICS_COMPACT_INTERVAL', '3600')),
+        namespace=validate_namespace(os.getenv('METRICS_NAMESPACE'))
+    )
+    service.run_forever()
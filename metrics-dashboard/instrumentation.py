@@ -0,0 +1,414 @@
+"""
+Robot Framework Metrics - Instrumentation
+Метрики на hot path-а (Prometheus text format), Server-Timing и профилиране на бавни заявки
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+# Всеки процес (gunicorn workers, ingest service) пише snapshot на своите
+# метрики тук; /metrics ги събира. Директорията е локална за контейнера.
+INSTRUMENTATION_DIR = os.getenv(
+    'METRICS_INSTRUMENTATION_DIR',
+    os.path.join(tempfile.gettempdir(), 'rf-metrics-instrumentation')
+)
+FLUSH_INTERVAL = 5.0
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PARSE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+LAG_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'rf_metrics_http_requests_total': (
+        'counter', 'HTTP requests by route, method and status', None),
+    'rf_metrics_http_request_duration_seconds': (
+        'histogram', 'HTTP request latency by route and method', LATENCY_BUCKETS),
+    'rf_metrics_parse_duration_seconds': (
+        'histogram', 'output.xml parse time by phase (xml_load, test_extraction, total)',
+        PARSE_BUCKETS),
+    'rf_metrics_parse_bytes_total': (
+        'counter', 'Bytes of output.xml parsed', None),
+    'rf_metrics_parse_errors_total': (
+        'counter', 'output.xml files that could not be parsed', None),
+    'rf_metrics_history_scan_duration_seconds': (
+        'histogram', 'Time spent rescanning the history directory', LATENCY_BUCKETS),
+    'rf_metrics_history_files_read_total': (
+        'counter', 'Run files read from the history directory (part = header | full)', None),
+    'rf_metrics_history_bytes_decoded_total': (
+        'counter', 'Bytes of run files decoded from the history directory', None),
+    'rf_metrics_cache_requests_total': (
+        'counter', 'Cache lookups by cache (response | run) and result', None),
+    'rf_metrics_ingest_lag_seconds': (
+        'histogram', 'Time from output.xml mtime to the persisted run', LAG_BUCKETS),
+    'rf_metrics_ingest_last_lag_seconds': (
+        'gauge', 'Ingest lag of the last persisted run', None),
+    'rf_metrics_ingest_requests_total': (
+        'counter', 'Pushed output.xml uploads by result (created | duplicate | rejected | error)', None),
+    'rf_metrics_ingest_queue_depth': (
+        'gauge', 'output.xml files waiting in the ingest service queue', None),
+    'rf_metrics_history_runs': (
+        'gauge', 'Runs in the history', None),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def pid_alive(pid: int) -> bool:
+    """Дали процесът с този pid още съществува (signal 0)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Registry:
+    """
+    Counters, histograms и gauges на текущия процес.
+
+    flush() записва snapshot в INSTRUMENTATION_DIR/<pid>.json (най-много
+    веднъж на FLUSH_INTERVAL); collect() събира snapshot-ите на всички
+    процеси - counters и histograms се сумират (и на спрели процеси),
+    gauges са последната стойност от живите процеси.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = Path(directory or INSTRUMENTATION_DIR)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._histograms: Dict[Tuple[str, LabelKey], List] = {}
+        self._gauges: Dict[Tuple[str, LabelKey], Tuple[float, float]] = {}
+        self._last_flush = 0.0
+
+    def _check_fork(self):
+        # След fork детето започва с празни метрики (родителят си пише своите)
+        if self._pid != os.getpid():
+            self._reset()
+
+    def inc(self, name: str, amount: float = 1.0, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._check_fork()
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        buckets = METRICS[name][2]
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._check_fork()
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+            index = len(buckets)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    index = i
+                    break
+            histogram[0][index] += 1
+            histogram[1] += value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._check_fork()
+            self._gauges[(name, _label_key(labels))] = (value, time.time())
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            self._check_fork()
+            return {
+                'pid': self._pid,
+                'updated': time.time(),
+                'counters': [[name, dict(labels), value]
+                             for (name, labels), value in self._counters.items()],
+                'histograms': [[name, dict(labels), list(counts), total]
+                               for (name, labels), (counts, total) in self._histograms.items()],
+                'gauges': [[name, dict(labels), value, updated]
+                           for (name, labels), (value, updated) in self._gauges.items()]
+            }
+
+    def flush(self, force: bool = False):
+        """Записва snapshot-а на процеса (atomic), ако е минал FLUSH_INTERVAL"""
+        now = time.monotonic()
+        if not force and now - self._last_flush < FLUSH_INTERVAL:
+            return
+        # Друг thread вече записва - следващата заявка ще опита пак
+        if not self._flush_lock.acquire(blocking=force):
+            return
+        try:
+            self._last_flush = now
+            snapshot = self.snapshot()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f"{snapshot['pid']}.json"
+            tmp_path = path.with_name(f".{path.name}.tmp")
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Could not write instrumentation snapshot: {e}")
+        finally:
+            self._flush_lock.release()
+
+    def _snapshots(self) -> List[Dict]:
+        own = self.snapshot()
+        snapshots = [own]
+        try:
+            files = list(self.directory.glob('*.json'))
+        except OSError:
+            files = []
+        for path in files:
+            if path.stem == str(own['pid']):
+                continue
+            try:
+                with open(path, 'r') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            snapshot['alive'] = pid_alive(snapshot.get('pid', 0))
+            snapshots.append(snapshot)
+        return snapshots
+
+    def collect(self) -> Dict:
+        """Метриките на всички процеси, слети"""
+        counters: Dict[Tuple[str, LabelKey], float] = {}
+        histograms: Dict[Tuple[str, LabelKey], List] = {}
+        gauges: Dict[Tuple[str, LabelKey], Tuple[float, float]] = {}
+
+        for snapshot in self._snapshots():
+            for name, labels, value in snapshot.get('counters', []):
+                key = (name, _label_key(labels))
+                counters[key] = counters.get(key, 0.0) + value
+            for name, labels, counts, total in snapshot.get('histograms', []):
+                key = (name, _label_key(labels))
+                merged = histograms.get(key)
+                if merged is None or len(merged[0]) != len(counts):
+                    histograms[key] = [list(counts), total]
+                else:
+                    merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                    merged[1] += total
+            if not snapshot.get('alive', True):
+                continue
+            for name, labels, value, updated in snapshot.get('gauges', []):
+                key = (name, _label_key(labels))
+                if key not in gauges or updated > gauges[key][1]:
+                    gauges[key] = (value, updated)
+
+        return {'counters': counters, 'histograms': histograms, 'gauges': gauges}
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)"""
+        collected = self.collect()
+        series: Dict[str, List[str]] = {name: [] for name in METRICS}
+
+        for (name, labels), value in sorted(collected['counters'].items()):
+            series.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_number(value)}")
+        for (name, labels), (value, _) in sorted(collected['gauges'].items()):
+            series.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_number(value)}")
+        for (name, labels), (counts, total) in sorted(collected['histograms'].items()):
+            buckets = METRICS[name][2] if name in METRICS else ()
+            lines = series.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+        output = []
+        for name, lines in series.items():
+            if not lines:
+                continue
+            metric_type, help_text = METRICS[name][:2] if name in METRICS else ('untyped', name)
+            output.append(f"# HELP {name} {help_text}")
+            output.append(f"# TYPE {name} {metric_type}")
+            output.extend(lines)
+        return '\n'.join(output) + '\n'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: LabelKey) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+REGISTRY = Registry()
+
+
+# ----------------------------------------------------------------------
+# Server-Timing - фазите на текущата заявка (по thread)
+# ----------------------------------------------------------------------
+
+_local = threading.local()
+
+
+def start_request_timings():
+    _local.timings = []
+
+
+def record_timing(name: str, seconds: float):
+    """Добавя фаза към Server-Timing на текущата заявка (ако има такава)"""
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+def pop_request_timings() -> List[Tuple[str, float]]:
+    timings = getattr(_local, 'timings', None) or []
+    _local.timings = None
+    return timings
+
+
+@contextmanager
+def timed(metric: str, timing: Optional[str] = None, **labels):
+    """Мери блока в histogram `metric` (и като Server-Timing фаза `timing`)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        REGISTRY.observe(metric, elapsed, **labels)
+        if timing:
+            record_timing(timing, elapsed)
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total: float) -> str:
+    merged: Dict[str, float] = {}
+    for name, seconds in timings:
+        merged[name] = merged.get(name, 0.0) + seconds
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in merged.items()]
+    parts.append(f"app;dur={total * 1000:.2f}")
+    return ', '.join(parts)
+
+
+# ----------------------------------------------------------------------
+# Sampling profiler за бавни заявки
+# ----------------------------------------------------------------------
+
+class SlowRequestProfiler:
+    """
+    Sampling profiler, включен с METRICS_PROFILE_SLOW_MS.
+
+    Докато има активни заявки, фонов thread взема стека на техните
+    threads на всеки `interval` секунди. Ако заявката е по-бавна от
+    threshold, стековете се записват в collapsed формат (flamegraph.pl,
+    speedscope) в `directory`; пазят се последните `keep` профила.
+    """
+
+    def __init__(self, threshold: float, directory, interval: float = 0.005, keep: int = 50):
+        self.threshold = threshold
+        self.directory = Path(directory)
+        self.interval = interval
+        self.keep = keep
+        self._active: Dict[int, Counter] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._sample_loop, name='slow-request-profiler',
+                                            daemon=True)
+            self._thread.start()
+
+    def begin(self) -> Counter:
+        samples = Counter()
+        with self._lock:
+            self._active[threading.get_ident()] = samples
+            self._ensure_thread()
+        self._wakeup.set()
+        return samples
+
+    def end(self, samples: Counter, duration: float, label: str) -> Optional[Path]:
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+        if duration < self.threshold or not samples:
+            return None
+        return self._write(samples, duration, label)
+
+    def _sample_loop(self):
+        while True:
+            with self._lock:
+                active = dict(self._active)
+            if not active:
+                self._wakeup.clear()
+                self._wakeup.wait()
+                continue
+
+            frames = sys._current_frames()
+            for thread_id, samples in active.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[_collapse(frame)] += 1
+            time.sleep(self.interval)
+
+    def _write(self, samples: Counter, duration: float, label: str) -> Optional[Path]:
+        safe_label = ''.join(c if c.isalnum() else '_' for c in label).strip('_')[:60]
+        path = self.directory / f"{datetime.now():%Y%m%d-%H%M%S-%f}-{safe_label}.collapsed"
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(f"# {label} {duration * 1000:.1f}ms, {sum(samples.values())} samples "
+                        f"every {self.interval * 1000:.0f}ms\n")
+                for stack, count in samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            for old in sorted(self.directory.glob('*.collapsed'))[:-self.keep]:
+                old.unlink(missing_ok=True)
+        except OSError as e:
+            print(f"Warning: Could not write profile: {e}")
+            return None
+        return path
+
+
+def _collapse(frame) -> str:
+    """Стек (root first) като 'file:function;file:function;...'"""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+def profiler_from_env() -> Optional[SlowRequestProfiler]:
+    """SlowRequestProfiler според METRICS_PROFILE_SLOW_MS (None ако не е зададен)"""
+    threshold_ms = float(os.getenv('METRICS_PROFILE_SLOW_MS', '0'))
+    if threshold_ms <= 0:
+        return None
+    return SlowRequestProfiler(
+        threshold_ms / 1000,
+        os.getenv('METRICS_PROFILE_DIR', os.path.join(INSTRUMENTATION_DIR, 'profiles')),
+        interval=float(os.getenv('METRICS_PROFILE_INTERVAL_MS', '5')) / 1000
+    )
@@ -0,0 +1,287 @@
+"""
+Robot Framework Metrics - Parse jobs
+Асинхронно парсване на output.xml (POST /api/parse) в отделни процеси
+
+Web worker-ът само записва job и го подава на process pool - голям файл
+не държи gunicorn worker (и GIL-а му) за цялото парсване. Състоянието на
+всеки job е JSON файл в history_dir/jobs, общ за всички процеси: така
+/api/jobs/<id> отговаря от който и да е worker, а повторно подаване на
+същия файл (същия namespace, път, размер и mtime) намира вече пуснатия job -
+докато той е активен или run-ът му е още в историята.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from instrumentation import REGISTRY, pid_alive
+from metrics_parser import MetricsParser
+
+
+JOBS_DIRNAME = 'jobs'
+JOB_ID_LENGTH = 16
+
+# Колко приключени jobs да се пазят
+JOBS_MAX_FINISHED = 200
+
+# Колко често (секунди) worker-ът записва прогреса
+PROGRESS_INTERVAL = 0.5
+
+# Частта от прогреса за hash pass-а - той е много по-бърз от парсването
+HASH_PROGRESS = 0.1
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+
+def job_id_for(namespace: str, path: Path, size: int, mtime_ns: int) -> str:
+    """Еднакъв файл (path + размер + mtime) в един namespace дава един job"""
+    key = f"{namespace}\0{path}\0{size}\0{mtime_ns}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:JOB_ID_LENGTH]
+
+
+def job_progress(phase: str, done: int, size: int) -> Optional[float]:
+    """Общ прогрес 0..1 - hashing е първите HASH_PROGRESS, parsing - останалото"""
+    if not size:
+        return None
+    fraction = min(done / size, 1.0)
+    if phase == 'hashing':
+        return round(fraction * HASH_PROGRESS, 3)
+    return round(HASH_PROGRESS + fraction * (1 - HASH_PROGRESS), 3)
+
+
+def _write_json(path: Path, data: Dict):
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: Path) -> Optional[Dict]:
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _mtime(path: Path) -> Optional[float]:
+    """mtime на файла или None, ако междувременно е изтрит (_prune на друг worker)"""
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def throttled(callback):
+    """callback(phase, bytes_read), извикван най-много веднъж на PROGRESS_INTERVAL"""
+    reported = [time.monotonic()]
+
+    def report(phase: str, done: int):
+        now = time.monotonic()
+        if now - reported[0] >= PROGRESS_INTERVAL:
+            reported[0] = now
+            callback(phase, done)
+    return report
+
+
+# ----------------------------------------------------------------------
+# Worker process
+# ----------------------------------------------------------------------
+
+# Parser-ите на worker процеса по history директория
+_job_parsers = {}
+
+
+def _run_job(job_path: str, xml_path: str, results_dir: str, history_dir: str):
+    """Парсва и записва един output.xml в worker process; състоянието отива в job файла"""
+    path = Path(job_path)
+    job = _read_json(path)
+
+    def update(**changes):
+        job.update(changes)
+        _write_json(path, job)
+
+    update(state=RUNNING, pid=os.getpid(), started_at=datetime.now().isoformat())
+    try:
+        parser = _job_parsers.get(history_dir)
+        if parser is None:
+            parser = _job_parsers[history_dir] = MetricsParser(results_dir, history_dir)
+
+        # Hash-first: файл, който вече е в историята, струва само hash pass-а
+        run_id, created = parser.ingest_output_xml(xml_path, progress=throttled(
+            lambda phase, done: update(phase=phase, bytes_read=done,
+                                       progress=job_progress(phase, done, job['size']))
+        ))
+
+        if not run_id:
+            update(state=FAILED, error='Failed to parse XML', finished_at=datetime.now().isoformat())
+            return
+        update(state=DONE, run_id=run_id, created=created, progress=1.0, bytes_read=job['size'],
+               finished_at=datetime.now().isoformat())
+    except Exception as e:
+        update(state=FAILED, error=str(e), finished_at=datetime.now().isoformat())
+    finally:
+        REGISTRY.flush(force=True)
+
+
+# ----------------------------------------------------------------------
+# Web process
+# ----------------------------------------------------------------------
+
+class JobManager:
+    """
+    Jobs на един web worker. Pool-ът е с най-много `workers` процеса
+    (spawn - web worker-ът е multi-threaded и fork не е безопасен) и се
+    създава при първия job.
+    """
+
+    def __init__(self, history_dir, results_dir, workers: int = 1):
+        self.jobs_dir = Path(history_dir) / JOBS_DIRNAME
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self.results_dir = str(results_dir)
+        self.workers = max(workers, 1)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _job_path(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}.json"
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _reset_pool(self):
+        with self._lock:
+            self._pool = None
+
+    def submit(self, xml_path: Path, namespace: str, store) -> Dict:
+        """
+        Нов job за xml_path в history store-а на namespace (или вече
+        пуснатият за същия файл - coalesced). FileNotFoundError ако файлът липсва.
+        """
+        stat = Path(xml_path).stat()
+        job_id = job_id_for(namespace, Path(xml_path).resolve(), stat.st_size, stat.st_mtime_ns)
+        path = self._job_path(job_id)
+
+        existing = self.get(job_id)
+        if existing is not None and self._reusable(existing, store):
+            return {**existing, 'coalesced': True}
+
+        job = {
+            'job_id': job_id,
+            'namespace': namespace,
+            'path': str(xml_path),
+            'size': stat.st_size,
+            'state': QUEUED,
+            'phase': None,
+            'progress': 0.0,
+            'bytes_read': 0,
+            'run_id': None,
+            'created': None,
+            'error': None,
+            'owner_pid': os.getpid(),
+            'pid': None,
+            'submitted_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None
+        }
+        if existing is None:
+            # link() не презаписва - при едновременно подаване от два workers печели един
+            tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'w') as f:
+                json.dump(job, f)
+            try:
+                os.link(tmp_path, path)
+            except FileExistsError:
+                existing = self.get(job_id)
+                if existing is not None and self._reusable(existing, store):
+                    return {**existing, 'coalesced': True}
+                _write_json(path, job)
+            finally:
+                tmp_path.unlink()
+        else:
+            _write_json(path, job)
+
+        try:
+            future = self._get_pool().submit(_run_job, str(path), str(xml_path), self.results_dir,
+                                             str(store.history_dir))
+        except Exception as e:
+            # Счупен pool (напр. убит worker process) - следващият job създава нов
+            self._reset_pool()
+            self._fail(job_id, f'Could not start job: {e}')
+            raise
+        future.add_done_callback(lambda f: self._finished(job_id, f))
+        self._prune()
+        return {**job, 'coalesced': False}
+
+    @staticmethod
+    def _reusable(job: Dict, store) -> bool:
+        """
+        Активен job, или приключил, чийто run е още в историята - след
+        /api/clear или /api/delete същият файл трябва да се парсне отново.
+        """
+        if job['state'] in ACTIVE_STATES:
+            return True
+        return job['state'] == DONE and bool(job['run_id']) and store.has_run(job['run_id'])
+
+    def _finished(self, job_id: str, future):
+        """Worker процесът е умрял без да запише резултата"""
+        if future.exception() is not None:
+            self._reset_pool()
+            self._fail(job_id, f'Worker process failed: {future.exception()}')
+
+    def _fail(self, job_id: str, error: str):
+        job = _read_json(self._job_path(job_id))
+        if job and job['state'] in ACTIVE_STATES:
+            job.update(state=FAILED, error=error, finished_at=datetime.now().isoformat())
+            _write_json(self._job_path(job_id), job)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Състоянието на job - активен job на умрял процес се маркира като failed"""
+        if not job_id.isalnum():
+            return None
+        job = _read_json(self._job_path(job_id))
+        if job is None:
+            return None
+
+        pid = job['pid'] if job['state'] == RUNNING else job['owner_pid']
+        if job['state'] in ACTIVE_STATES and not pid_alive(pid):
+            self._fail(job_id, 'Job process exited before finishing')
+            job = _read_json(self._job_path(job_id))
+        return job
+
+    def recent(self, limit: int = 20) -> List[Dict]:
+        """Последните jobs, newest first"""
+        stamped = [(_mtime(path), path) for path in self.jobs_dir.glob('*.json')]
+        stamped = sorted(((mtime, path) for mtime, path in stamped if mtime is not None), reverse=True)
+        jobs = []
+        for _, path in stamped[:limit]:
+            job = self.get(path.stem)
+            if job is not None:
+                jobs.append(job)
+        return jobs
+
+    def _prune(self):
+        """Пази последните JOBS_MAX_FINISHED приключени jobs"""
+        finished = []
+        for path in self.jobs_dir.glob('*.json'):
+            job = _read_json(path)
+            mtime = _mtime(path)
+            if job and mtime is not None and job['state'] not in ACTIVE_STATES:
+                finished.append((mtime, path))
+        finished.sort(reverse=True)
+        for _, path in finished[JOBS_MAX_FINISHED:]:
+            path.unlink(missing_ok=True)
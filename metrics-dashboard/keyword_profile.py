@@ -0,0 +1,156 @@
+"""
+Robot Framework Metrics - Keyword profiling
+Време по keyword (извиквания, total/self time, percentiles) от output.xml
+
+Профилът се събира по време на streaming парсването: за всеки отворен
+<kw> се пази само рамка в стека (име, elapsed, време на под-keywords), а
+времената на извикванията отиват в log-скала хистограма - паметта зависи
+от броя различни keywords, не от броя извиквания.
+"""
+import math
+from typing import Dict, Iterable, List, Optional
+
+
+# Ред на колоните в компактния профил (metrics['keyword_profile'] е списък от редове)
+PROFILE_FIELDS = ('name', 'owner', 'calls', 'total', 'self_time', 'p50', 'p95', 'max')
+
+# Хистограмата е с граници през 10% - percentiles са с грешка до ~10%
+BUCKET_GROWTH = 1.1
+BUCKET_BASE_MS = 1.0
+
+HOT_SORTS = ('self_time', 'total', 'calls', 'p95')
+
+
+def keyword_key(name: str, owner: Optional[str]) -> str:
+    """Пълно име на keyword - library/resource + име"""
+    return f"{owner}.{name}" if owner else name
+
+
+def _bucket(seconds: float) -> int:
+    return max(0, math.ceil(math.log(max(seconds * 1000, BUCKET_BASE_MS) / BUCKET_BASE_MS,
+                                     BUCKET_GROWTH)))
+
+
+def _bucket_seconds(bucket: int) -> float:
+    """Горната граница на bucket"""
+    return BUCKET_BASE_MS * BUCKET_GROWTH ** bucket / 1000
+
+
+class KeywordProfiler:
+    """Натрупва статистиките по keyword докато iterparse минава през <kw> елементите"""
+
+    def __init__(self):
+        self.stack = []
+        self.stats = {}  # (name, owner) -> [calls, total, self_time, max, {bucket: count}]
+
+    def enter(self, kw):
+        """<kw> start - име и owner (RF 7) / library (по-стари версии)"""
+        owner = kw.get('owner') or kw.get('library') or ''
+        self.stack.append([kw.get('name', 'Unknown'), owner, 0.0, 0.0])
+
+    def status(self, status):
+        """<status> на текущия keyword"""
+        if self.stack:
+            self.stack[-1][2] = float(status.get('elapsed', 0))
+
+    def exit(self):
+        """</kw> - self time = elapsed минус времето на под-keywords"""
+        name, owner, elapsed, children = self.stack.pop()
+        if self.stack:
+            self.stack[-1][3] += elapsed
+
+        stat = self.stats.get((name, owner))
+        if stat is None:
+            stat = self.stats[(name, owner)] = [0, 0.0, 0.0, 0.0, {}]
+        stat[0] += 1
+        stat[1] += elapsed
+        stat[2] += max(elapsed - children, 0.0)
+        stat[3] = max(stat[3], elapsed)
+        bucket = _bucket(elapsed)
+        stat[4][bucket] = stat[4].get(bucket, 0) + 1
+
+    def profile(self) -> List[list]:
+        """Компактният профил - по един ред (PROFILE_FIELDS) на keyword, най-бавните първи"""
+        rows = []
+        for (name, owner), (calls, total, self_time, longest, buckets) in self.stats.items():
+            rows.append([
+                name, owner, calls, round(total, 3), round(self_time, 3),
+                min(_percentile(buckets, calls, 0.50), round(longest, 3)),
+                min(_percentile(buckets, calls, 0.95), round(longest, 3)),
+                round(longest, 3)
+            ])
+        return sorted(rows, key=lambda row: (-row[4], row[0], row[1]))
+
+
+def _percentile(buckets: Dict[int, int], count: int, fraction: float) -> float:
+    rank = max(1, math.ceil(fraction * count))
+    seen = 0
+    for bucket in sorted(buckets):
+        seen += buckets[bucket]
+        if seen >= rank:
+            return round(_bucket_seconds(bucket), 3)
+    return 0.0
+
+
+def profile_rows(profile: Optional[Iterable[list]]) -> List[Dict]:
+    """Компактен профил -> list от dicts"""
+    return [
+        {'keyword': keyword_key(row[0], row[1]), **dict(zip(PROFILE_FIELDS, row))}
+        for row in profile or []
+    ]
+
+
+def merge_profiles(profiles: Iterable[Optional[List[list]]]) -> List[list]:
+    """
+    Обединява профилите на shards (pabot). Броячите и времената се
+    събират; p50 е среднопретеглена по извикванията, p95 и max - най-големите.
+    """
+    merged = {}
+    for profile in profiles:
+        for name, owner, calls, total, self_time, p50, p95, longest in profile or []:
+            row = merged.get((name, owner))
+            if row is None:
+                merged[(name, owner)] = [name, owner, calls, total, self_time, p50, p95, longest]
+                continue
+            row[5] = round((row[5] * row[2] + p50 * calls) / (row[2] + calls), 3) if calls else row[5]
+            row[2] += calls
+            row[3] = round(row[3] + total, 3)
+            row[4] = round(row[4] + self_time, 3)
+            row[6] = max(row[6], p95)
+            row[7] = max(row[7], longest)
+    return sorted(merged.values(), key=lambda row: (-row[4], row[0], row[1]))
+
+
+def hot_keywords(rows: Iterable[Dict], sort: str = 'self_time', limit: int = 20) -> List[Dict]:
+    """Сумира редовете на профили (от един или много runs) по keyword"""
+    if sort not in HOT_SORTS:
+        raise ValueError(f"Invalid sort: {sort} (expected: {', '.join(HOT_SORTS)})")
+
+    keywords = {}
+    for row in rows:
+        key = (row['name'], row['owner'])
+        entry = keywords.get(key)
+        if entry is None:
+            entry = keywords[key] = {
+                'keyword': keyword_key(row['name'], row['owner']),
+                'name': row['name'],
+                'owner': row['owner'],
+                'runs': 0,
+                'calls': 0,
+                'total': 0.0,
+                'self_time': 0.0,
+                'p95': 0.0,
+                'max': 0.0
+            }
+        entry['runs'] += 1
+        entry['calls'] += row['calls']
+        entry['total'] += row['total']
+        entry['self_time'] += row['self_time']
+        entry['p95'] = max(entry['p95'], row['p95'])
+        entry['max'] = max(entry['max'], row['max'])
+
+    for entry in keywords.values():
+        entry['total'] = round(entry['total'], 3)
+        entry['self_time'] = round(entry['self_time'], 3)
+        entry['avg'] = round(entry['total'] / entry['calls'], 4) if entry['calls'] else 0
+    return sorted(keywords.values(), key=lambda e: (-e[sort], e['keyword']))[:limit]
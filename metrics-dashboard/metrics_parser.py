@@ -3,20 +3,143 @@ Robot Framework Metrics Parser
 Парсва output.xml и генерира метрики
 """
 import os
+import sys
+import glob
 import json
 import hashlib
 import time
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
-from typing import Dict, List, Optional
-from xml.etree import ElementTree as ET
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+try:
+    # lxml е в requirements.txt - по-бърз iterparse и поддръжка на големи text nodes
+    from lxml import etree as ET
+    ITERPARSE_OPTIONS = {'huge_tree': True}
+except ImportError:
+    from xml.etree import ElementTree as ET
+    ITERPARSE_OPTIONS = {}
+
+from history_store import HistoryGeneration, create_history_store, run_summary
+from failure_signatures import run_clusters
+from namespaces import NamespaceRegistry, validate_namespace
+from keyword_profile import KeywordProfiler, hot_keywords, merge_profiles, profile_rows
+from instrumentation import REGISTRY, record_timing
+from history_events import (EventJournal, HISTORY_CLEARED, HISTORY_COMPACTED, RUN_DELETED,
+                            RUN_INGESTED, RUNS_INGESTED)
+from retention import ROLLUP_PERIODS, TIER_FULL, RetentionPolicy, rollup_to_dict
+from testcase_history import duration_regressions, flaky_tests, test_key
+from trend_series import STAT_KINDS, STAT_SERIES_METRICS, add_stat_durations, downsample
+
+
+RUN_ID_LENGTH = 12
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class HashingReader:
+    """File wrapper, който смята sha256 на прочетеното (hash + parse в един pass)"""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self.digest.update(data)
+        self.size += len(data)
+        return data
+
+    def hexdigest(self) -> str:
+        return self.digest.hexdigest()
+
+
+class ProgressReader:
+    """File wrapper, който подава на callback колко байта са прочетени досега"""
+
+    def __init__(self, fileobj, callback: Callable[[int], None]):
+        self.fileobj = fileobj
+        self.callback = callback
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self.bytes_read += len(data)
+        self.callback(self.bytes_read)
+        return data
+
+
+def run_id_from_hash(content_hash: str) -> str:
+    """Run ID е префикс от sha256 на output.xml - един и същ файл дава един и същ run"""
+    return content_hash[:RUN_ID_LENGTH]
+
+
+# Parser-ът на всеки process от batch pool-а
+_batch_parser = None
+
+
+def _init_batch_worker(results_dir: str, history_dir: str, backend: Optional[str]):
+    global _batch_parser
+    _batch_parser = MetricsParser(results_dir, history_dir, backend)
+
+
+def _hash_worker(xml_path: str) -> str:
+    return _batch_parser.content_hash(Path(xml_path))
+
+
+def _parse_worker(xml_path: str, dedup: bool = True):
+    """Hash + dedup + parse на един файл в worker process -> (status, path, payload)"""
+    path = Path(xml_path)
+    try:
+        run_id = run_id_from_hash(_batch_parser.content_hash(path))
+        if dedup and _batch_parser.store.has_run(run_id):
+            return 'skipped', xml_path, run_id
+
+        metrics = _batch_parser.parse_output_xml(path, run_id=run_id)
+        if not metrics:
+            return 'failed', xml_path, None
+        return 'parsed', xml_path, metrics
+    except Exception as e:
+        print(f"✗ Error parsing {xml_path}: {e}")
+        return 'failed', xml_path, None
+    finally:
+        # Worker процесите не живеят дълго - parse метриките се записват веднага
+        REGISTRY.flush(force=True)
+
+
+def find_output_files(source: Union[str, Path]) -> List[Path]:
+    """Директория (рекурсивно output*.xml) или glob pattern -> сортиран списък файлове"""
+    source = Path(source)
+    if source.is_dir():
+        files = source.rglob('output*.xml')
+    elif source.is_file():
+        files = [source]
+    else:
+        files = (Path(p) for p in glob.glob(str(source), recursive=True))
+    return sorted(p for p in files if p.is_file())
 
 
 class MetricsParser:
-    def __init__(self, results_dir: str, history_dir: str):
+    def __init__(self, results_dir: str, history_dir: str, backend: Optional[str] = None):
         self.results_dir = Path(results_dir)
         self.history_dir = Path(history_dir)
         self.history_dir.mkdir(parents=True, exist_ok=True)
+        self.store = create_history_store(self.history_dir, backend)
+        self.generation = HistoryGeneration(self.history_dir)
+        self.events = EventJournal(self.history_dir, self.generation)
+
+        # LRU за пълните runs - съдържанието на run се променя само от
+        # compactor-а, затова при всяко четене се сверява retention нивото
+        self._run_cache = OrderedDict()
+        self._run_cache_size = int(os.getenv('METRICS_RUN_CACHE_SIZE', '32'))
+        self._run_cache_lock = threading.Lock()
+
+        # Keyword профилиране при парсването - изключено по подразбиране
+        self.keyword_profile = os.getenv('METRICS_KEYWORD_PROFILE', 'false').lower() == 'true'
 
     def _get_local_timezone(self) -> timezone:
         """Auto-detect system timezone"""
@@ -27,23 +150,120 @@ class MetricsParser:
         offset_hours = utc_offset / 3600
         return timezone(timedelta(hours=offset_hours))
 
-    def parse_output_xml(self, xml_path: Path) -> Optional[Dict]:
-        """Парсва Robot Framework output.xml файл"""
+    def content_hash(self, xml_path: Path, progress: Optional[Callable[[int], None]] = None) -> str:
+        """Streaming sha256 на output.xml (progress получава прочетените байтове)"""
+        digest = hashlib.sha256()
+        with open(xml_path, 'rb') as f:
+            source = ProgressReader(f, progress) if progress else f
+            for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def ingest_output_xml(self, xml_path: Path, content_hash: Optional[str] = None,
+                          progress: Optional[Callable[[str, int], None]] = None):
+        """
+        Парсва и записва output.xml, освен ако вече е в историята.
+
+        Run ID-то е content-addressed, така че повторен ingest на същия
+        файл струва един hash pass - без парсване и без запис.
+        progress(phase, bytes_read) се вика при четене ('hashing', после 'parsing').
+        Връща (run_id, created); run_id е None при грешка в парсването.
+        """
+        if not content_hash:
+            content_hash = self.content_hash(
+                xml_path, progress=(lambda done: progress('hashing', done)) if progress else None)
+        run_id = run_id_from_hash(content_hash)
+
+        if self.store.has_run(run_id):
+            print(f"⏭️  Run {run_id} already exists, skipping...")
+            return run_id, False
+
         try:
-            tree = ET.parse(xml_path)
-            root = tree.getroot()
+            file_mtime = Path(xml_path).stat().st_mtime
+        except OSError:
+            file_mtime = None
+
+        metrics = self.parse_output_xml(
+            xml_path, run_id=run_id,
+            progress=(lambda done: progress('parsing', done)) if progress else None)
+        if not metrics:
+            return None, False
+        created = self.save_metrics(metrics)
+
+        if created and file_mtime is not None:
+            # Ingest lag - от записа на output.xml до run-а в историята
+            lag = max(time.time() - file_mtime, 0.0)
+            REGISTRY.observe('rf_metrics_ingest_lag_seconds', lag)
+            REGISTRY.set('rf_metrics_ingest_last_lag_seconds', lag)
+        return run_id, created
+
+    def ingest_stream(self, fileobj):
+        """
+        Парсва и записва output.xml от поток (напр. HTTP upload) докато
+        байтовете пристигат. Run ID-то се знае едва в края на потока, така
+        че дубликатът се разпознава след парсването. Връща (run_id, created).
+        """
+        metrics = self.parse_stream(fileobj)
+        if not metrics:
+            return None, False
+        return metrics['run_id'], self.save_metrics(metrics)
+
+    def parse_output_xml(self, xml_path: Path, run_id: Optional[str] = None,
+                         progress: Optional[Callable[[int], None]] = None) -> Optional[Dict]:
+        """Парсва Robot Framework output.xml файл (streaming, с един pass)"""
+        if run_id and not progress:
+            return self._parse(xml_path, run_id)
 
-            # Основна информация
-            suite = root.find('.//suite')
-            stats = root.find('.//statistics')
+        try:
+            f = open(xml_path, 'rb')
+        except OSError as e:
+            REGISTRY.inc('rf_metrics_parse_errors_total')
+            print(f"Error parsing XML: {e}")
+            return None
+        with f:
+            source = ProgressReader(f, progress) if progress else f
+            if run_id:
+                return self._parse(source, run_id, size=os.fstat(f.fileno()).st_size)
+            return self.parse_stream(source)
+
+    def parse_stream(self, fileobj) -> Optional[Dict]:
+        """Парсва output.xml от file-like обект; run ID = sha256 на съдържанието"""
+        return self._parse(HashingReader(fileobj))
+
+    def _parse(self, source, run_id: Optional[str] = None,
+               size: Optional[int] = None) -> Optional[Dict]:
+        """source е път или файл (с известен run_id) или HashingReader"""
+        started = time.perf_counter()
+        try:
+            parsed = self._stream_output_xml(source)
+            if run_id:
+                size = size if size is not None else Path(source).stat().st_size
+            else:
+                # iterparse може да спре преди EOF
+                for _ in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+                    pass
+                run_id = run_id_from_hash(source.hexdigest())
+                size = source.size
+
+            # XML load = всичко извън извличането на тестовете/статистиките
+            total_time = time.perf_counter() - started
+            extraction = parsed['extraction_seconds']
+            REGISTRY.observe('rf_metrics_parse_duration_seconds', total_time, phase='total')
+            REGISTRY.observe('rf_metrics_parse_duration_seconds', total_time - extraction,
+                             phase='xml_load')
+            REGISTRY.observe('rf_metrics_parse_duration_seconds', extraction,
+                             phase='test_extraction')
+            REGISTRY.inc('rf_metrics_parse_bytes_total', size)
+            record_timing('parse', total_time)
 
-            if not suite or not stats:
+            # Основна информация
+            if parsed['suite_name'] is None or not parsed['has_statistics']:
+                REGISTRY.inc('rf_metrics_parse_errors_total')
                 return None
 
             # Timestamp от root suite status
-            suite_status = suite.find('status')
-            start_time = suite_status.get('start') if suite_status is not None else None
-            elapsed = float(suite_status.get('elapsed', 0)) if suite_status is not None else 0.0
+            start_time = parsed['start_time']
+            elapsed = parsed['elapsed']
 
             # FIXED: Add timezone - AUTO-DETECT from system
             if start_time and 'Z' not in start_time and '+' not in start_time:
@@ -52,25 +272,11 @@ class MetricsParser:
                 dt = dt.replace(tzinfo=local_tz)
                 start_time = dt.isoformat()
 
-            # Парсване на статистиките
-            total_stats = stats.find('.//total/stat')
-            passed = int(total_stats.get('pass', 0)) if total_stats is not None else 0
-            failed = int(total_stats.get('fail', 0)) if total_stats is not None else 0
-            skipped = int(total_stats.get('skip', 0)) if total_stats is not None else 0
+            # Статистиките са събрани по време на парсването
+            passed, failed, skipped = parsed['total']
             total = passed + failed + skipped
-
-            # Парсване на тестовете
-            tests = self._parse_tests(suite)
-
-            # Парсване на tags
-            tag_stats = self._parse_tag_stats(stats)
-
-            # Парсване на suites
-            suite_stats = self._parse_suite_stats(stats)
-
-            # Генериране на уникален ID
-            file_mtime = xml_path.stat().st_mtime
-            run_id = self._generate_run_id(start_time, total, passed, failed, file_mtime)
+            tests = parsed['tests']
+            add_stat_durations(parsed['tag_stats'], parsed['suite_stats'], tests)
 
             metrics = {
                 'run_id': run_id,
@@ -86,92 +292,164 @@ class MetricsParser:
                     'pass_rate': round((passed / total * 100), 2) if total > 0 else 0
                 },
                 'tests': tests,
-                'tag_stats': tag_stats,
-                'suite_stats': suite_stats,
-                'suite_name': suite.get('name', 'Unknown')
+                'tag_stats': parsed['tag_stats'],
+                'suite_stats': parsed['suite_stats'],
+                'suite_name': parsed['suite_name']
             }
+            if parsed['keyword_profile'] is not None:
+                metrics['keyword_profile'] = parsed['keyword_profile']
 
             return metrics
 
         except Exception as e:
+            REGISTRY.inc('rf_metrics_parse_errors_total')
             print(f"Error parsing XML: {e}")
             import traceback
             traceback.print_exc()
             return None
 
-    def _parse_tests(self, suite_element) -> List[Dict]:
-        """Извлича информация за всички тестове"""
-        tests = []
+    def _stream_output_xml(self, source) -> Dict:
+        """
+        Един pass през output.xml с iterparse.
+
+        Всеки приключен елемент се маха от родителя си веднага след като
+        е обработен, така че в паметта остава само текущият път
+        (robot -> suite -> test -> kw -> ...), а не цялото дърво.
+
+        С keyword профилиране <kw> елементите минават и през KeywordProfiler -
+        той пази само стека на отворените keywords.
+        """
+        parsed = {
+            'suite_name': None,
+            'start_time': None,
+            'elapsed': 0.0,
+            'tests': [],
+            'total': (0, 0, 0),
+            'tag_stats': [],
+            'suite_stats': [],
+            'has_statistics': False,
+            'extraction_seconds': 0.0,
+            'keyword_profile': None
+        }
+        profiler = KeywordProfiler() if self.keyword_profile else None
         local_tz = self._get_local_timezone()
+        stack = []
+        suite_names = []
+        in_statistics = False
+
+        for event, elem in ET.iterparse(source, events=('start', 'end'), **ITERPARSE_OPTIONS):
+            tag = elem.tag
+
+            if event == 'start':
+                if tag == 'statistics':
+                    in_statistics = True
+                    parsed['has_statistics'] = True
+                elif tag == 'suite' and not in_statistics:
+                    suite_names.append(elem.get('name', 'Unknown'))
+                    if parsed['suite_name'] is None:
+                        parsed['suite_name'] = suite_names[0]
+                elif tag == 'kw' and profiler is not None:
+                    profiler.enter(elem)
+                stack.append(elem)
+                continue
 
-        for test in suite_element.findall('.//test'):
-            status = test.find('status')
-            if status is None:
+            stack.pop()
+            if not stack:
+                break
+            parent = stack[-1]
+
+            if in_statistics:
+                if tag == 'stat':
+                    extraction_started = time.perf_counter()
+                    category = parent.tag
+                    if category == 'total':
+                        parsed['total'] = (
+                            int(elem.get('pass', 0)),
+                            int(elem.get('fail', 0)),
+                            int(elem.get('skip', 0))
+                        )
+                    elif category == 'tag':
+                        parsed['tag_stats'].append(self._parse_stat(elem))
+                    elif category == 'suite':
+                        parsed['suite_stats'].append(self._parse_stat(elem))
+                    parsed['extraction_seconds'] += time.perf_counter() - extraction_started
+                elif tag == 'statistics':
+                    in_statistics = False
+
+            elif tag == 'test':
+                extraction_started = time.perf_counter()
+                test_info = self._parse_test(elem, local_tz, '.'.join(suite_names))
+                if test_info is not None:
+                    parsed['tests'].append(test_info)
+                parsed['extraction_seconds'] += time.perf_counter() - extraction_started
+
+            elif tag == 'suite':
+                suite_names.pop()
+                # Root suite е пряко под <robot>
+                if len(stack) == 1:
+                    status = elem.find('status')
+                    if status is not None:
+                        parsed['start_time'] = status.get('start')
+                        parsed['elapsed'] = float(status.get('elapsed', 0))
+
+            elif tag in ('status', 'tag') and parent.tag in ('test', 'suite'):
+                # Трябват ни при края на родителя
                 continue
 
-            start_time = status.get('start')
-            elapsed = float(status.get('elapsed', 0))
+            elif profiler is not None and (tag == 'kw' or (tag == 'status' and parent.tag == 'kw')):
+                extraction_started = time.perf_counter()
+                if tag == 'kw':
+                    profiler.exit()
+                else:
+                    profiler.status(elem)
+                parsed['extraction_seconds'] += time.perf_counter() - extraction_started
 
-            # Add timezone to test start_time
-            if start_time and 'Z' not in start_time and '+' not in start_time:
-                dt = datetime.fromisoformat(start_time)
-                dt = dt.replace(tzinfo=local_tz)
-                start_time = dt.isoformat()
+            parent.remove(elem)
 
-            test_info = {
-                'name': test.get('name', 'Unknown'),
-                'status': status.get('status', 'UNKNOWN'),
-                'start_time': start_time,
-                'end_time': self._calculate_end_time(start_time, elapsed),
-                'duration': round(elapsed, 2),
-                'message': status.text.strip() if status.text else '',
-                'tags': [tag.text for tag in test.findall('.//tag')]
-            }
-            tests.append(test_info)
-
-        return tests
-
-    def _parse_tag_stats(self, stats_element) -> List[Dict]:
-        """Парсва статистики по тагове"""
-        tag_stats = []
-
-        tags = stats_element.findall('.//tag/stat')
-        for tag in tags:
-            tag_info = {
-                'name': tag.text,
-                'total': int(tag.get('pass', 0)) + int(tag.get('fail', 0)),
-                'passed': int(tag.get('pass', 0)),
-                'failed': int(tag.get('fail', 0)),
-                'pass_rate': round(
-                    (int(tag.get('pass', 0)) /
-                     (int(tag.get('pass', 0)) + int(tag.get('fail', 0))) * 100),
-                    2
-                ) if (int(tag.get('pass', 0)) + int(tag.get('fail', 0))) > 0 else 0
-            }
-            tag_stats.append(tag_info)
-
-        return tag_stats
-
-    def _parse_suite_stats(self, stats_element) -> List[Dict]:
-        """Парсва статистики по suites"""
-        suite_stats = []
-
-        suites = stats_element.findall('.//suite/stat')
-        for suite in suites:
-            suite_info = {
-                'name': suite.text,
-                'total': int(suite.get('pass', 0)) + int(suite.get('fail', 0)),
-                'passed': int(suite.get('pass', 0)),
-                'failed': int(suite.get('fail', 0)),
-                'pass_rate': round(
-                    (int(suite.get('pass', 0)) /
-                     (int(suite.get('pass', 0)) + int(suite.get('fail', 0))) * 100),
-                    2
-                ) if (int(suite.get('pass', 0)) + int(suite.get('fail', 0))) > 0 else 0
-            }
-            suite_stats.append(suite_info)
+        if profiler is not None:
+            parsed['keyword_profile'] = profiler.profile()
+        return parsed
+
+    def _parse_test(self, test, local_tz: timezone, suite_path: str = '') -> Optional[Dict]:
+        """Извлича информация за един тест"""
+        status = test.find('status')
+        if status is None:
+            return None
 
-        return suite_stats
+        start_time = status.get('start')
+        elapsed = float(status.get('elapsed', 0))
+
+        # Add timezone to test start_time
+        if start_time and 'Z' not in start_time and '+' not in start_time:
+            dt = datetime.fromisoformat(start_time)
+            dt = dt.replace(tzinfo=local_tz)
+            start_time = dt.isoformat()
+
+        return {
+            'name': test.get('name', 'Unknown'),
+            'suite': suite_path,
+            'status': status.get('status', 'UNKNOWN'),
+            'start_time': start_time,
+            'end_time': self._calculate_end_time(start_time, elapsed),
+            'duration': round(elapsed, 2),
+            'message': status.text.strip() if status.text else '',
+            'tags': [tag.text for tag in test.findall('tag')]
+        }
+
+    def _parse_stat(self, stat) -> Dict:
+        """Парсва един <stat> ред от статистиките по тагове / suites"""
+        passed = int(stat.get('pass', 0))
+        failed = int(stat.get('fail', 0))
+        total = passed + failed
+
+        return {
+            'name': stat.text,
+            'total': total,
+            'passed': passed,
+            'failed': failed,
+            'skipped': int(stat.get('skip', 0)),
+            'pass_rate': round((passed / total * 100), 2) if total > 0 else 0
+        }
 
     def _calculate_end_time(self, start_time: str, elapsed: float) -> str:
         """Изчислява end time от start time + elapsed"""
@@ -186,66 +464,316 @@ class MetricsParser:
         except:
             return None
 
-    def _generate_run_id(self, timestamp: str, total: int, passed: int, failed: int, file_mtime: float = None) -> str:
-        """Генерира уникален ID за run"""
-        current_time = datetime.now().isoformat()
-        data = f"{timestamp}-{total}-{passed}-{failed}-{current_time}-{file_mtime}"
-        return hashlib.md5(data.encode()).hexdigest()[:12]
-
     def save_metrics(self, metrics: Dict) -> bool:
         """Записва метриките в history"""
         try:
-            run_id = metrics['run_id']
-            file_path = self.history_dir / f"{run_id}.json"
-
-            if file_path.exists():
-                print(f"⏭️  Run {run_id} already exists, skipping...")
+            if not self.store.save_run(metrics):
+                print(f"⏭️  Run {metrics['run_id']} already exists, skipping...")
                 return False  # Don't create duplicate
 
-            with open(file_path, 'w') as f:
-                json.dump(metrics, f, indent=2)
-
+            self.events.publish(RUN_INGESTED, {'run': run_summary(metrics)})
             print(f"✓ Metrics saved: {metrics['run_id']}")
+            self._report_duration_regressions(metrics['run_id'])
+            self._report_failure_clusters(metrics)
+            self._report_hot_keywords(metrics)
             return True
 
         except Exception as e:
             print(f"✗ Error saving metrics: {e}")
             return False
 
+    def _report_failure_clusters(self, metrics: Dict):
+        """Отпечатва колко различни причини имат FAIL тестовете на run"""
+        if not metrics['summary'].get('failed'):
+            return
+        clusters = run_clusters(metrics)
+        print(f"🧩 {metrics['summary']['failed']} failure(s) in {len(clusters)} cluster(s)")
+        for cluster in clusters[:3]:
+            print(f"   {cluster['count']:>4} × [{cluster['signature']}] {cluster['message'][:120]}")
+
+    def _report_hot_keywords(self, metrics: Dict):
+        """Отпечатва keywords с най-много self time в run (само с профилиране)"""
+        profile = metrics.get('keyword_profile')
+        if not profile:
+            return
+        print(f"📊 Keyword profile: {len(profile)} keyword(s)")
+        for row in profile_rows(profile[:3]):
+            print(f"   {row['self_time']:>9.2f}s self, {row['calls']:>6} call(s)  {row['keyword']}")
+
+    def _report_duration_regressions(self, run_id: str):
+        """Отпечатва тестовете, флагнати като по-бавни в току-що записания run"""
+        # Файловият backend смята агрегатите от цялата история - не при всеки ingest
+        if not self.store.incremental_aggregates:
+            return
+        for regression in duration_regressions(self.store.slow_test_aggregates(run_id=run_id)):
+            print(f"🐢 Duration regression: {regression['key']} "
+                  f"{regression['duration']:.2f}s vs {regression['baseline']:.2f}s median "
+                  f"(x{regression['ratio']}, z={regression['score']})")
+
+    # ------------------------------------------------------------------
+    # Batch ingest (pabot shards, архиви, backfill)
+    # ------------------------------------------------------------------
+
+    def ingest_batch(self, source: Union[str, Path, Iterable], merge_shards: bool = False,
+                     workers: Optional[int] = None, batch_size: int = 100) -> Dict:
+        """
+        Парсва много output.xml файла в process pool.
+
+        source е директория, glob pattern или списък с файлове. С
+        merge_shards=True файловете са shards на един run (pabot_results)
+        и се записват като един логически run; иначе всеки файл е отделен
+        run и резултатите се записват на batch-ове в една транзакция.
+        """
+        if isinstance(source, (str, Path)):
+            files = find_output_files(source)
+        else:
+            files = sorted(Path(p) for p in source)
+
+        result = {'files': len(files), 'created': 0, 'skipped': 0, 'failed': 0, 'run_ids': []}
+        if not files:
+            return result
+
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(files)),
+            initializer=_init_batch_worker,
+            initargs=(str(self.results_dir), str(self.history_dir), self.store.name)
+        ) as pool:
+            if merge_shards:
+                self._ingest_shards(pool, files, result)
+            else:
+                self._ingest_files(pool, files, batch_size, result)
+
+        print(f"✓ Batch ingest: {result['created']} created, {result['skipped']} skipped, "
+              f"{result['failed']} failed ({result['files']} file(s))")
+        return result
+
+    def _ingest_files(self, pool, files: List[Path], batch_size: int, result: Dict):
+        pending = []
+        for status, xml_path, payload in pool.map(_parse_worker, map(str, files)):
+            if status == 'parsed':
+                pending.append(payload)
+                if len(pending) >= batch_size:
+                    self._save_batch(pending, result)
+                    pending = []
+            elif status == 'skipped':
+                result['skipped'] += 1
+                result['run_ids'].append(payload)
+            else:
+                result['failed'] += 1
+        self._save_batch(pending, result)
+
+    def _ingest_shards(self, pool, files: List[Path], result: Dict):
+        # Run ID на merged run-а зависи от съдържанието на всички shards
+        hashes = sorted(pool.map(_hash_worker, map(str, files)))
+        run_id = run_id_from_hash(hashlib.sha256(''.join(hashes).encode()).hexdigest())
+        if self.store.has_run(run_id):
+            print(f"⏭️  Run {run_id} already exists, skipping...")
+            result['skipped'] = len(files)
+            result['run_ids'].append(run_id)
+            return
+
+        shards = []
+        for status, xml_path, payload in pool.map(_parse_worker, map(str, files),
+                                                  [False] * len(files)):
+            if status == 'parsed':
+                shards.append(payload)
+            else:
+                result['failed'] += 1
+
+        if shards:
+            self._save_batch([self.merge_runs(shards, run_id)], result)
+
+    def _save_batch(self, runs: List[Dict], result: Dict):
+        if not runs:
+            return
+        created = self.store.save_runs(runs)
+        if created:
+            self.events.publish(RUNS_INGESTED, {
+                'count': created,
+                'run_ids': [run['run_id'] for run in runs]
+            })
+        result['created'] += created
+        result['skipped'] += len(runs) - created
+        result['run_ids'].extend(run['run_id'] for run in runs)
+
+    def merge_runs(self, shards: List[Dict], run_id: str) -> Dict:
+        """Обединява резултатите от shards (напр. pabot процеси) в един run"""
+        tests = sorted(
+            (test for shard in shards for test in shard['tests']),
+            key=lambda t: t.get('start_time') or ''
+        )
+        passed = sum(shard['summary']['passed'] for shard in shards)
+        failed = sum(shard['summary']['failed'] for shard in shards)
+        skipped = sum(shard['summary']['skipped'] for shard in shards)
+        total = passed + failed + skipped
+
+        starts = [datetime.fromisoformat(s['start_time']) for s in shards if s.get('start_time')]
+        ends = [datetime.fromisoformat(s['end_time']) for s in shards if s.get('end_time')]
+        start_time = min(starts).isoformat() if starts else None
+        end_time = max(ends).isoformat() if ends else None
+        if starts and ends:
+            duration = (max(ends) - min(starts)).total_seconds()
+        else:
+            duration = max(shard['duration'] for shard in shards)
+
+        merged = {
+            'run_id': run_id,
+            'timestamp': start_time or shards[0]['timestamp'],
+            'start_time': start_time,
+            'end_time': end_time,
+            'duration': round(duration, 2),
+            'summary': {
+                'total': total,
+                'passed': passed,
+                'failed': failed,
+                'skipped': skipped,
+                'pass_rate': round((passed / total * 100), 2) if total > 0 else 0
+            },
+            'tests': tests,
+            'tag_stats': self._merge_stats(shard['tag_stats'] for shard in shards),
+            'suite_stats': self._merge_stats(shard['suite_stats'] for shard in shards),
+            'suite_name': shards[0]['suite_name']
+        }
+        if any(shard.get('keyword_profile') for shard in shards):
+            merged['keyword_profile'] = merge_profiles(shard.get('keyword_profile') for shard in shards)
+        return merged
+
+    def _merge_stats(self, stats_lists: Iterable[List[Dict]]) -> List[Dict]:
+        merged = OrderedDict()
+        for stats in stats_lists:
+            for stat in stats:
+                entry = merged.setdefault(stat['name'], {'passed': 0, 'failed': 0, 'skipped': 0,
+                                                         'duration': 0.0})
+                entry['passed'] += stat['passed']
+                entry['failed'] += stat['failed']
+                entry['skipped'] += stat.get('skipped', 0)
+                entry['duration'] += stat.get('duration', 0)
+
+        return [{
+            'name': name,
+            'total': entry['passed'] + entry['failed'],
+            'passed': entry['passed'],
+            'failed': entry['failed'],
+            'skipped': entry['skipped'],
+            'pass_rate': round(entry['passed'] / (entry['passed'] + entry['failed']) * 100, 2)
+            if (entry['passed'] + entry['failed']) > 0 else 0,
+            'duration': round(entry['duration'], 2)
+        } for name, entry in merged.items()]
+
     def get_all_runs(self) -> List[Dict]:
-        """Връща всички runs от историята - SORTED BY TIMESTAMP"""
-        runs = []
+        """Връща всички runs от историята (с тестовете) - SORTED BY TIMESTAMP"""
+        return list(self._iter_runs())
 
-        for json_file in self.history_dir.glob('*.json'):
-            try:
-                with open(json_file, 'r') as f:
-                    metrics = json.load(f)
-                    runs.append(metrics)
-            except Exception as e:
-                print(f"Error loading {json_file}: {e}")
+    def _iter_runs(self, limit: Optional[int] = None):
+        """Пълни runs newest first - summaries от store-а, телата през LRU кеша"""
+        for summary in self.list_runs(limit=limit):
+            run = self.get_run_by_id(summary['run_id'])
+            if run:
+                yield run
 
-        # Sort by timestamp descending (newest first)
-        runs.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
+    def list_runs(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+        """Summaries на runs (без тестовете), newest first"""
+        return self.store.list_runs(limit=limit, offset=offset)
 
-        return runs
+    def list_runs_page(self, limit: int = 50, cursor: Optional[str] = None):
+        """Страница summaries след cursor -> (runs, next_cursor)"""
+        return self.store.list_runs_page(limit, cursor)
 
-    def get_run_by_id(self, run_id: str) -> Optional[Dict]:
-        """Връща конкретен run по ID"""
-        file_path = self.history_dir / f"{run_id}.json"
+    def count_runs(self) -> int:
+        """Брой runs в историята"""
+        return self.store.count_runs()
 
-        if not file_path.exists():
-            return None
+    def get_latest_run(self, include_tests: bool = False) -> Optional[Dict]:
+        """Последният run"""
+        return self.store.latest_run(include_tests=include_tests)
 
+    def get_run_by_id(self, run_id: str) -> Optional[Dict]:
+        """Връща конкретен run по ID (от LRU кеша, ако е там) - read-only!"""
         try:
-            with open(file_path, 'r') as f:
-                return json.load(f)
+            with self._run_cache_lock:
+                run = self._run_cache.get(run_id)
+                if run is not None:
+                    self._run_cache.move_to_end(run_id)
+            REGISTRY.inc('rf_metrics_cache_requests_total', cache='run',
+                         result='miss' if run is None else 'hit')
+
+            if run is not None:
+                # Може да е изтрит или свит от друг процес
+                tier = self.store.run_tier(run_id)
+                if tier == run.get('tier', TIER_FULL):
+                    return run
+                self._evict_run(run_id)
+                if tier is None:
+                    return None
+
+            run = self.store.get_run(run_id)
+            if run is not None and self._run_cache_size > 0:
+                with self._run_cache_lock:
+                    self._run_cache[run_id] = run
+                    while len(self._run_cache) > self._run_cache_size:
+                        self._run_cache.popitem(last=False)
+            return run
         except Exception as e:
             print(f"Error loading run {run_id}: {e}")
             return None
 
+    def get_run_header(self, run_id: str) -> Optional[Dict]:
+        """Run без тестовете (summary, tag/suite статистики)"""
+        return self.store.get_run(run_id, include_tests=False)
+
+    def get_run_tests(self, run_id: str, **query) -> Optional[Dict]:
+        """
+        Страница от тестовете на run - offset/limit, филтри statuses/tag/
+        suite/q, sort (index|duration|name), fields и max_message.
+        """
+        return self.store.run_tests(run_id, **query)
+
+    def _evict_run(self, run_id: Optional[str] = None):
+        """Маха run (или всички при run_id=None) от LRU кеша"""
+        with self._run_cache_lock:
+            if run_id is None:
+                self._run_cache.clear()
+            else:
+                self._run_cache.pop(run_id, None)
+
+    def delete_run(self, run_id: str) -> bool:
+        """Изтрива run от историята"""
+        self._evict_run(run_id)
+        if not self.store.delete_run(run_id):
+            return False
+        self.events.publish(RUN_DELETED, {'run_id': run_id})
+        return True
+
+    def clear_history(self) -> int:
+        """Изтрива цялата история; връща броя изтрити runs"""
+        self._evict_run()
+        deleted_count = self.store.clear()
+        self.events.publish(HISTORY_CLEARED, {'deleted': deleted_count})
+        return deleted_count
+
+    def compact_history(self, policy: Optional[RetentionPolicy] = None) -> Dict:
+        """Прилага retention политиката (default: от METRICS_RETENTION_*)"""
+        policy = policy or RetentionPolicy.from_env()
+        result = self.store.compact(policy)
+        if result['compacted'] or result['rolled_up']:
+            # Кешираните runs може вече да са без тестове
+            self._evict_run()
+            self.events.publish(HISTORY_COMPACTED, result)
+            print(f"✓ Compacted {result['compacted']} run(s), "
+                  f"rolled up {result['rolled_up']} run(s)")
+        return result
+
+    def get_rollups(self, period: str = 'day', start: Optional[float] = None,
+                    end: Optional[float] = None) -> List[Dict]:
+        """Daily/weekly rollups на свитите runs"""
+        if period not in ROLLUP_PERIODS:
+            raise ValueError(f"Unknown period '{period}' (expected one of: {', '.join(ROLLUP_PERIODS)})")
+        return [rollup_to_dict(rollup) for rollup in self.store.rollups(period, start, end)]
+
     def get_trend_data(self, limit: int = 20) -> Dict:
         """Генерира trend данни за графиките"""
-        runs = self.get_all_runs()[:limit]
+        runs = self.list_runs(limit=limit)
 
         trend = {
             'timestamps': [],
@@ -266,61 +794,222 @@ class MetricsParser:
 
         return trend
 
-    def get_flaky_tests(self, runs_count: int = 10) -> List[Dict]:
-        """Открива flaky тестове"""
-        runs = self.get_all_runs()[:runs_count]
-        test_results = {}
+    def get_trend_series(self, start: Optional[float] = None, end: Optional[float] = None,
+                         buckets: int = 100, mode: str = 'avg') -> Dict:
+        """Trend серия за time-range, downsample-ната до `buckets` точки"""
+        points = self.store.series_points(start=start, end=end)
+        return downsample(points, buckets, mode=mode, start=start, end=end)
+
+    def get_stat_series(self, kind: str, name: str, start: Optional[float] = None,
+                        end: Optional[float] = None, buckets: int = 100, mode: str = 'avg') -> Dict:
+        """
+        Серия на един tag или suite (kind = 'tag' | 'suite') - pass/fail/skip
+        и време по runs, downsample-ната до `buckets` точки.
+        """
+        if kind not in STAT_KINDS:
+            raise ValueError(f"Invalid kind: {kind} (expected: {', '.join(STAT_KINDS)})")
+        points = self.store.stat_points(kind, name, start=start, end=end)
+        series = downsample(points, buckets, mode=mode, start=start, end=end,
+                            metrics=STAT_SERIES_METRICS)
+        return {'kind': kind, 'name': name, **series}
+
+    def get_flaky_tests(self, runs_count: int = 10, min_flakiness: float = 0.2) -> List[Dict]:
+        """
+        Открива flaky тестове от per-test агрегатите.
+
+        runs_count е прозорецът от последните изпълнения на всеки тест
+        (до HISTORY_BITS), тестовете се различават по suite + име.
+        """
+        return flaky_tests(self.store.test_aggregates(), window=runs_count,
+                           min_flakiness=min_flakiness)
+
+    def get_duration_regressions(self, run_id: Optional[str] = None, min_ratio: Optional[float] = None,
+                                 min_score: Optional[float] = None,
+                                 limit: Optional[int] = None) -> List[Dict]:
+        """
+        Тестове, чието последно време е значимо над медианата на прозореца им.
+
+        run_id ограничава до тестове, флагнати в този run; min_ratio и
+        min_score затягат праговете по подразбиране (REGRESSION_*).
+        """
+        options = {}
+        if min_ratio is not None:
+            options['min_ratio'] = min_ratio
+        if min_score is not None:
+            options['min_score'] = min_score
+        return duration_regressions(self.store.slow_test_aggregates(run_id=run_id),
+                                    **options)[:limit]
+
+    def get_test_aggregates(self, window: int = 10, query: Optional[str] = None,
+                            sort: str = 'failed', limit: Optional[int] = None) -> List[Dict]:
+        """Per-test агрегати (за /api/tests)"""
+        aggregates = self.store.test_aggregates()
+        if query:
+            query = query.lower()
+            aggregates = [agg for agg in aggregates if query in agg.key.lower()]
+
+        tests = [agg.to_dict(window=window) for agg in aggregates]
+        sort_keys = {
+            'failed': lambda x: (x['window']['failed'], x['failed']),
+            'flips': lambda x: (x['window']['flips'], x['flips']),
+            'duration': lambda x: x['duration']['mean'],
+            'runs': lambda x: x['runs'],
+            'name': lambda x: x['key'].lower()
+        }
+        tests.sort(key=sort_keys.get(sort, sort_keys['failed']), reverse=sort != 'name')
+        return tests[:limit]
+
+    def get_expected_durations(self, tag: Optional[str] = None, window: int = 10) -> List[Dict]:
+        """
+        Очакваното време и последните резултати на всеки тест (за планиране
+        и подбор на тестове в test_runner.py).
+
+        С tag - само тестовете с този tag в последния run (агрегатите не
+        пазят tags). failed/total/flakiness са за последните `window` изпълнения.
+        """
+        aggregates = self.store.test_aggregates()
+        if tag:
+            latest = self.store.list_runs(limit=1)
+            page = self.store.run_tests(latest[0]['run_id'], limit=None, tag=tag,
+                                        fields=['suite', 'name']) if latest else None
+            keys = {test_key(test) for test in page['tests']} if page else set()
+            aggregates = [agg for agg in aggregates if agg.key in keys]
 
-        for run in runs:
-            for test in run.get('tests', []):
-                name = test['name']
-                if name not in test_results:
-                    test_results[name] = {'passed': 0, 'failed': 0, 'total': 0}
+        tests = []
+        for agg in aggregates:
+            recent = agg.window(window)
+            tests.append({
+                'suite': agg.suite,
+                'name': agg.name,
+                'duration': round(agg.expected_duration, 3),
+                'runs': agg.runs,
+                'last_status': agg.last_status,
+                'failed': recent['failed'],
+                'total': recent['total'],
+                'flakiness': recent['flakiness']
+            })
+        return sorted(tests, key=lambda x: (x['suite'], x['name']))
+
+    def get_failure_clusters(self, run_id: str) -> Optional[Dict]:
+        """FAIL тестовете на run, групирани по нормализираното съобщение"""
+        clusters = self.store.failure_clusters(run_id)
+        if clusters is None:
+            return None
+        return {
+            'run_id': run_id,
+            'failures': sum(cluster['count'] for cluster in clusters),
+            'total': len(clusters),
+            'clusters': clusters
+        }
 
-                test_results[name]['total'] += 1
-                if test['status'] == 'PASS':
-                    test_results[name]['passed'] += 1
-                else:
-                    test_results[name]['failed'] += 1
-
-        flaky = []
-        for name, results in test_results.items():
-            if results['total'] >= 3:
-                fail_rate = (results['failed'] / results['total']) * 100
-                if 20 <= fail_rate <= 80:
-                    flaky.append({
-                        'name': name,
-                        'fail_rate': round(fail_rate, 2),
-                        'passed': results['passed'],
-                        'failed': results['failed'],
-                        'total': results['total']
-                    })
-
-        return sorted(flaky, key=lambda x: x['fail_rate'], reverse=True)
+    def get_failure_signatures(self, start: Optional[float] = None, end: Optional[float] = None,
+                               limit: int = 20) -> List[Dict]:
+        """Най-честите failure signatures в time-range"""
+        return self.store.failure_signatures(start=start, end=end, limit=limit)
+
+    def get_signature_failures(self, signature: str, limit: int = 100) -> Optional[Dict]:
+        """Всички (run, test) с този failure signature, newest first"""
+        return self.store.signature_failures(signature, limit=limit)
+
+    def get_keyword_profile(self, run_id: str) -> Optional[Dict]:
+        """Keyword профилът на run (празен ако е парсван без METRICS_KEYWORD_PROFILE)"""
+        keywords = self.store.keyword_profile(run_id)
+        if keywords is None:
+            return None
+        return {
+            'run_id': run_id,
+            'total': len(keywords),
+            'keywords': keywords
+        }
+
+    def get_hot_keywords(self, start: Optional[float] = None, end: Optional[float] = None,
+                         sort: str = 'self_time', limit: int = 20,
+                         run_id: Optional[str] = None) -> Optional[List[Dict]]:
+        """
+        Keywords с най-много време в time-range или в един run (None ако
+        няма такъв run). ValueError при невалиден sort.
+        """
+        if run_id:
+            keywords = self.store.keyword_profile(run_id)
+            if keywords is None:
+                return None
+            return hot_keywords(keywords, sort=sort, limit=limit)
+        return self.store.hot_keywords(start=start, end=end, sort=sort, limit=limit)
+
+    def get_keyword_trend(self, name: str, owner: str = '', start: Optional[float] = None,
+                          end: Optional[float] = None) -> List[Dict]:
+        """Времената на един keyword по runs, oldest first"""
+        return self.store.keyword_trend(name, owner=owner, start=start, end=end)
+
+    def get_test_history(self, key: str, limit: int = 50) -> Optional[Dict]:
+        """Агрегат + последните изпълнения на един тест"""
+        aggregate = self.store.test_aggregate(key)
+        if aggregate is None:
+            return None
+
+        history = aggregate.to_dict(window=limit)
+        history['executions'] = self.store.test_executions(aggregate.suite, aggregate.name,
+                                                           limit=limit)
+        return history
 
     def get_slowest_tests(self, run_id: Optional[str] = None) -> List[Dict]:
         """Връща най-бавните тестове"""
         if run_id:
             run = self.get_run_by_id(run_id)
-            runs = [run] if run else []
         else:
-            runs = self.get_all_runs()[:1]
-
-        all_tests = []
-        for run in runs:
-            all_tests.extend(run.get('tests', []))
+            latest = self.list_runs(limit=1)
+            run = self.get_run_by_id(latest[0]['run_id']) if latest else None
 
+        all_tests = run.get('tests', []) if run else []
         slowest = sorted(all_tests, key=lambda x: x['duration'], reverse=True)[:10]
 
         return slowest
 
 
-if __name__ == '__main__':
-    parser = MetricsParser('/robot_results', '/app/data/history')
-
-    xml_path = Path('/robot_results/output.xml')
+def main():
+    cli = argparse.ArgumentParser(description='Robot Framework Metrics Parser')
+    cli.add_argument('--results-dir', default=os.getenv('ROBOT_RESULTS_DIR', '/robot_results'))
+    cli.add_argument('--history-dir',
+                     default=os.path.join(os.getenv('METRICS_DATA_DIR', '/app/data'), 'history'))
+    cli.add_argument('--batch', metavar='DIR_OR_GLOB',
+                     help='Ingest many output.xml files (directory or glob) in parallel')
+    cli.add_argument('--merge-shards', action='store_true',
+                     help='Treat the batch as shards of one run (e.g. pabot_results)')
+    cli.add_argument('--workers', type=int, help='Number of parser processes')
+    cli.add_argument('--compact', action='store_true',
+                     help='Apply the METRICS_RETENTION_* policy to the history and exit')
+    cli.add_argument('--namespace', default=os.getenv('METRICS_NAMESPACE'),
+                     help='History namespace (project[/branch[/environment]])')
+    args = cli.parse_args()
+
+    try:
+        namespace = validate_namespace(args.namespace)
+    except ValueError as e:
+        cli.error(str(e))
+    namespaces = NamespaceRegistry(args.history_dir,
+                                   lambda history_dir: MetricsParser(args.results_dir, str(history_dir)))
+    parser = namespaces.get(namespace, create=True)
+
+    if args.compact:
+        policy = namespaces.retention(namespace)
+        if not policy.enabled:
+            print("⏭️  No retention policy configured (METRICS_RETENTION_*), nothing to do")
+            return 0
+        parser.compact_history(policy)
+        return 0
+
+    if args.batch:
+        result = parser.ingest_batch(args.batch, merge_shards=args.merge_shards,
+                                     workers=args.workers)
+        return 0 if not result['failed'] else 1
+
+    xml_path = Path(args.results_dir) / 'output.xml'
     if xml_path.exists():
-        metrics = parser.parse_output_xml(xml_path)
-        if metrics:
-            parser.save_metrics(metrics)
-            print(json.dumps(metrics, indent=2))
\ No newline at end of file
+        run_id, created = parser.ingest_output_xml(xml_path)
+        if created:
+            print(json.dumps(parser.get_run_by_id(run_id), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
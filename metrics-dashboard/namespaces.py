@@ -0,0 +1,172 @@
+"""
+Robot Framework Metrics - Namespaces
+Отделна история за всеки project/branch/environment в една инстанция
+
+Namespace е до три сегмента, разделени с '/' (напр. 'shop/main/staging').
+Всеки namespace има своя history директория - свой store/index, generation,
+event journal, кеш и retention - така че голямата история на един проект
+не забавя заявките към останалите. Namespace 'default' е самата history
+директория (съвместимо с инстанциите отпреди namespaces).
+"""
+import os
+import re
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from retention import RetentionPolicy
+
+
+DEFAULT_NAMESPACE = 'default'
+NAMESPACES_DIRNAME = 'namespaces'
+
+# Конфигурацията е в поддиректория - *.json в history_dir са runs
+CONFIG_DIRNAME = 'config'
+NAMESPACE_FILENAME = 'namespace.json'
+
+NAMESPACE_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]{0,63}(?:/[A-Za-z0-9][A-Za-z0-9._-]{0,63}){0,2}$')
+NAMESPACE_PARTS = ('project', 'branch', 'environment')
+
+# '/' не е валиден в име на директория - сегментите се свързват с '+'
+DIRNAME_SEPARATOR = '+'
+
+
+def validate_namespace(namespace: Optional[str]) -> str:
+    """Нормализиран namespace (празен -> default); ValueError при невалидно име"""
+    namespace = (namespace or '').strip().strip('/')
+    if not namespace:
+        return DEFAULT_NAMESPACE
+    if not NAMESPACE_PATTERN.match(namespace):
+        raise ValueError(f"Invalid namespace: {namespace} (expected: project[/branch[/environment]])")
+    return namespace
+
+
+def namespace_parts(namespace: str) -> Dict:
+    """project/branch/environment на namespace (None за липсващите сегменти)"""
+    segments = namespace.split('/')
+    return {part: segments[i] if i < len(segments) else None for i, part in enumerate(NAMESPACE_PARTS)}
+
+
+def namespace_dir(history_dir, namespace: str) -> Path:
+    """History директорията на namespace"""
+    if namespace == DEFAULT_NAMESPACE:
+        return Path(history_dir)
+    return Path(history_dir) / NAMESPACES_DIRNAME / namespace.replace('/', DIRNAME_SEPARATOR)
+
+
+def config_path(directory) -> Path:
+    return Path(directory) / CONFIG_DIRNAME / NAMESPACE_FILENAME
+
+
+def read_namespace_config(directory) -> Optional[Dict]:
+    try:
+        with open(config_path(directory), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def namespace_retention(directory: Path, default: Optional[RetentionPolicy] = None) -> RetentionPolicy:
+    """
+    Retention на namespace - ключът 'retention' в config/namespace.json
+    (full_runs, full_days, summary_days) е с предимство пред default
+    (METRICS_RETENTION_*).
+    """
+    policy = default or RetentionPolicy.from_env()
+    overrides = (read_namespace_config(directory) or {}).get('retention') or {}
+    return RetentionPolicy(
+        full_runs=int(overrides.get('full_runs', policy.full_runs)),
+        full_days=float(overrides.get('full_days', policy.full_days)),
+        summary_days=float(overrides.get('summary_days', policy.summary_days))
+    )
+
+
+class NamespaceRegistry:
+    """
+    Parser-ите (MetricsParser) на namespaces, отваряни при първо използване.
+
+    factory(history_dir) създава parser за директорията на namespace. Нов
+    namespace се създава само с create=True (ingest) - GET заявка към
+    непознат namespace не оставя празна директория след себе си.
+    """
+
+    def __init__(self, history_dir, factory: Callable):
+        self.history_dir = Path(history_dir)
+        self.factory = factory
+        self._parsers = {}
+        self._lock = threading.Lock()
+
+    def exists(self, namespace: str) -> bool:
+        if namespace == DEFAULT_NAMESPACE:
+            return True
+        return config_path(namespace_dir(self.history_dir, namespace)).exists()
+
+    def get(self, namespace: str, create: bool = False):
+        """Parser-ът на namespace (None ако не съществува и create=False)"""
+        parser = self._parsers.get(namespace)
+        if parser is not None:
+            return parser
+
+        with self._lock:
+            parser = self._parsers.get(namespace)
+            if parser is not None:
+                return parser
+            if not self.exists(namespace):
+                if not create:
+                    return None
+                self._create(namespace)
+            parser = self._parsers[namespace] = self.factory(namespace_dir(self.history_dir, namespace))
+            return parser
+
+    def _create(self, namespace: str):
+        path = config_path(namespace_dir(self.history_dir, namespace))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        config = {
+            'namespace': namespace,
+            **namespace_parts(namespace),
+            'created_at': datetime.now().isoformat()
+        }
+        tmp_path = path.with_name(f".{NAMESPACE_FILENAME}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(config, f, indent=2)
+        os.replace(tmp_path, path)
+        print(f"✓ Namespace created: {namespace}")
+
+    def names(self) -> List[str]:
+        """Всички namespaces на диска (default първи)"""
+        names = []
+        root = self.history_dir / NAMESPACES_DIRNAME
+        if root.is_dir():
+            for entry in os.scandir(root):
+                config = read_namespace_config(entry.path) if entry.is_dir() else None
+                if config and config.get('namespace'):
+                    names.append(config['namespace'])
+        return [DEFAULT_NAMESPACE] + sorted(names)
+
+    def retention(self, namespace: str, default: Optional[RetentionPolicy] = None) -> RetentionPolicy:
+        return namespace_retention(namespace_dir(self.history_dir, namespace), default)
+
+    def summary(self, namespace: str) -> Optional[Dict]:
+        """Ред на /api/namespaces - броят runs и последният run на namespace"""
+        parser = self.get(namespace)
+        if parser is None:
+            return None
+        latest = parser.list_runs(limit=1)
+        latest = latest[0] if latest else None
+        retention = self.retention(namespace)
+        return {
+            'namespace': namespace,
+            **namespace_parts(namespace),
+            'history_backend': parser.store.name,
+            'total_runs': parser.count_runs(),
+            'latest_run': {
+                'run_id': latest['run_id'],
+                'timestamp': latest['timestamp'],
+                'total': latest['summary']['total'],
+                'failed': latest['summary']['failed'],
+                'pass_rate': latest['summary']['pass_rate']
+            } if latest else None,
+            'retention': retention.to_dict() if retention.enabled else None
+        }
@@ -0,0 +1,204 @@
+"""
+Robot Framework Metrics - Retention
+Политика за съхранение на историята и daily/weekly rollups
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+
+# Нива на run в историята:
+#   full    - run с всички тестове
+#   summary - само summary и tag/suite статистики (тестовете са
+#             архивирани в per-test агрегатите)
+#   rollup  - run-ът е изтрит, остава само в daily/weekly rollups
+TIER_FULL = 'full'
+TIER_SUMMARY = 'summary'
+
+ROLLUP_PERIODS = ('day', 'week')
+
+ROLLUP_FIELDS = (
+    'period', 'start_ts', 'runs', 'total', 'passed', 'failed', 'skipped',
+    'duration_total', 'duration_min', 'duration_max', 'pass_rate_total'
+)
+ROLLUP_STAT_FIELDS = (
+    'period', 'start_ts', 'kind', 'name', 'runs', 'total', 'passed', 'failed',
+    'skipped', 'duration_total', 'pass_rate_total'
+)
+
+# Колко runs се обработват в една транзакция на compactor-а
+COMPACT_BATCH_SIZE = 200
+
+DAY_SECONDS = 24 * 3600
+
+
+class RetentionPolicy:
+    """
+    Колко дълго се пази всяко ниво (0 = без ограничение).
+
+    full_runs/full_days - последните N runs или дни остават с тестовете
+    (run, който отговаря на кое да е от двете, се пази). summary_days -
+    след толкова дни run-ът се свива до rollups; последните full_runs
+    runs никога не се свиват.
+    """
+
+    def __init__(self, full_runs: int = 0, full_days: float = 0, summary_days: float = 0):
+        self.full_runs = full_runs
+        self.full_days = full_days
+        self.summary_days = summary_days
+
+    @classmethod
+    def from_env(cls) -> 'RetentionPolicy':
+        return cls(
+            full_runs=int(os.getenv('METRICS_RETENTION_FULL_RUNS', '0')),
+            full_days=float(os.getenv('METRICS_RETENTION_FULL_DAYS', '0')),
+            summary_days=float(os.getenv('METRICS_RETENTION_SUMMARY_DAYS', '0'))
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.full_runs or self.full_days or self.summary_days)
+
+    def may_compact(self, tier: str) -> bool:
+        """Може ли run на това ниво още да бъде свит (full -> summary/rollup, summary -> rollup)"""
+        if tier == TIER_FULL:
+            return self.enabled
+        return bool(self.summary_days)
+
+    def cutoffs(self, now: float, nth_newest_ts: Optional[float]) -> Tuple[float, float]:
+        """
+        (keep_full_after, rollup_before) - runs с ts < keep_full_after губят
+        тестовете, runs с ts < rollup_before отиват в rollups.
+
+        nth_newest_ts е ts на full_runs-тия най-нов run (None ако са по-малко).
+        """
+        keep_full = []
+        if self.full_runs:
+            keep_full.append(nth_newest_ts if nth_newest_ts is not None else float('-inf'))
+        if self.full_days:
+            keep_full.append(now - self.full_days * DAY_SECONDS)
+        keep_full_after = min(keep_full) if keep_full else float('-inf')
+
+        rollup_before = float('-inf')
+        if self.summary_days:
+            rollup_before = now - self.summary_days * DAY_SECONDS
+            # full нивото е с предимство пред summary_days
+            if keep_full:
+                rollup_before = min(rollup_before, keep_full_after)
+        return keep_full_after, rollup_before
+
+    def to_dict(self) -> Dict:
+        return {
+            'full_runs': self.full_runs,
+            'full_days': self.full_days,
+            'summary_days': self.summary_days
+        }
+
+
+def period_start(ts: float, period: str) -> float:
+    """Начало на деня/седмицата (понеделник) в локалната timezone"""
+    day = datetime.fromtimestamp(ts).replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'week':
+        day -= timedelta(days=day.weekday())
+    return day.timestamp()
+
+
+def empty_rollup(period: str, start_ts: float) -> Dict:
+    rollup = dict.fromkeys(ROLLUP_FIELDS, 0)
+    rollup.update({'period': period, 'start_ts': start_ts,
+                   'duration_min': None, 'duration_max': None})
+    return rollup
+
+
+def add_run(rollup: Dict, summary: Dict):
+    """Добавя summary на run (run_summary) към rollup"""
+    counts = summary['summary']
+    duration = summary.get('duration') or 0
+    rollup['runs'] += 1
+    for field in ('total', 'passed', 'failed', 'skipped'):
+        rollup[field] += counts.get(field, 0) or 0
+    rollup['pass_rate_total'] += counts.get('pass_rate', 0) or 0
+    rollup['duration_total'] += duration
+    if rollup['duration_min'] is None or duration < rollup['duration_min']:
+        rollup['duration_min'] = duration
+    if rollup['duration_max'] is None or duration > rollup['duration_max']:
+        rollup['duration_max'] = duration
+
+
+def empty_rollup_stat(period: str, start_ts: float, kind: str, name: str) -> Dict:
+    stat = dict.fromkeys(ROLLUP_STAT_FIELDS, 0)
+    stat.update({'period': period, 'start_ts': start_ts, 'kind': kind, 'name': name})
+    return stat
+
+
+def add_stat(rollup_stat: Dict, stat: Dict):
+    rollup_stat['runs'] += 1
+    for field in ('total', 'passed', 'failed', 'skipped'):
+        # Rollups отпреди skipped/duration нямат тези полета
+        rollup_stat[field] = rollup_stat.get(field, 0) + (stat.get(field, 0) or 0)
+    rollup_stat['pass_rate_total'] += stat.get('pass_rate', 0) or 0
+    rollup_stat['duration_total'] = rollup_stat.get('duration_total', 0) + (stat.get('duration', 0) or 0)
+
+
+def rollup_run(rollups: Dict, stats: Dict, ts: float, run: Dict):
+    """
+    Добавя run (с tag_stats/suite_stats) към всички периоди.
+
+    rollups е {(period, start_ts): rollup}, stats е
+    {(period, start_ts, kind, name): rollup_stat}.
+    """
+    for period in ROLLUP_PERIODS:
+        start = period_start(ts, period)
+        rollup = rollups.get((period, start))
+        if rollup is None:
+            rollup = rollups[(period, start)] = empty_rollup(period, start)
+        add_run(rollup, run)
+
+        for kind, key in (('tag', 'tag_stats'), ('suite', 'suite_stats')):
+            for stat in run.get(key) or []:
+                stat_key = (period, start, kind, stat.get('name') or '')
+                rollup_stat = stats.get(stat_key)
+                if rollup_stat is None:
+                    rollup_stat = stats[stat_key] = empty_rollup_stat(*stat_key)
+                add_stat(rollup_stat, stat)
+
+
+def rollup_point(rollup: Dict) -> Dict:
+    """Rollup -> точка от trend серията (средни стойности, тежест = брой runs)"""
+    runs = rollup['runs'] or 1
+    # Точката е в средата на периода
+    length = DAY_SECONDS if rollup['period'] == 'day' else 7 * DAY_SECONDS
+    ts = rollup['start_ts'] + length / 2
+    return {
+        'ts': ts,
+        'run_id': None,
+        'timestamp': datetime.fromtimestamp(ts).astimezone().isoformat(),
+        'pass_rate': round(rollup['pass_rate_total'] / runs, 2),
+        'total': round(rollup['total'] / runs, 2),
+        'passed': round(rollup['passed'] / runs, 2),
+        'failed': round(rollup['failed'] / runs, 2),
+        'duration': round(rollup['duration_total'] / runs, 2),
+        'runs': rollup['runs']
+    }
+
+
+def rollup_stat_point(rollup_stat: Dict) -> Dict:
+    """Rollup на tag/suite статистика -> точка от серията й"""
+    point = rollup_point({**rollup_stat, 'duration_total': rollup_stat.get('duration_total') or 0})
+    point['skipped'] = round((rollup_stat.get('skipped') or 0) / (rollup_stat['runs'] or 1), 2)
+    return point
+
+
+def rollup_to_dict(rollup: Dict) -> Dict:
+    """Rollup за API-то - с периода като ISO и средните стойности"""
+    runs = rollup['runs'] or 1
+    data = dict(rollup)
+    data['start'] = datetime.fromtimestamp(rollup['start_ts']).astimezone().isoformat()
+    data['pass_rate'] = round(rollup['pass_rate_total'] / runs, 2)
+    if 'duration_total' in rollup:
+        data['avg_duration'] = round(rollup['duration_total'] / runs, 2)
+    return data
+
+
+def sorted_rollups(rollups: List[Dict]) -> List[Dict]:
+    return sorted(rollups, key=lambda r: r['start_ts'])
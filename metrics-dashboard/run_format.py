@@ -0,0 +1,264 @@
+"""
+Robot Framework Metrics - Compact run format
+Версиониран компактен формат на run файловете в history_dir
+"""
+import os
+import sys
+import json
+import zlib
+import struct
+import argparse
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+# Файл: MAGIC + версия (1 байт) + дължини на секциите + header + tests
+#   header - JSON на run-а без тестовете (за списъци и trend-ове)
+#   tests  - zlib на колонен JSON (interned suites/tags/messages, epoch µs)
+RUN_SUFFIX = '.run'
+LEGACY_SUFFIX = '.json'
+MAGIC = b'RFRUN'
+FORMAT_VERSION = 1
+SECTIONS = struct.Struct('>II')
+PREAMBLE_SIZE = len(MAGIC) + 1 + SECTIONS.size
+
+# Полетата на тест в реда от парсера; останалите отиват в extra
+TEST_COLUMNS = ('name', 'suite', 'status', 'start_time', 'end_time', 'duration', 'message', 'tags')
+TIME_COLUMNS = ('start_time', 'end_time')
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class RunFormatError(ValueError):
+    pass
+
+
+class _Interned:
+    """Речник стойност -> индекс (за suites, tags, messages, ...)"""
+
+    def __init__(self):
+        self.values = []
+        self._index = {}
+
+    def __call__(self, value) -> int:
+        key = json.dumps(value) if isinstance(value, (list, dict)) else value
+        index = self._index.get(key)
+        if index is None:
+            index = self._index[key] = len(self.values)
+            self.values.append(value)
+        return index
+
+
+class _TimeFormat:
+    """
+    [epoch µs, offset index] -> ISO timestamp.
+
+    datetime.isoformat() е по-скъп от самото JSON декодиране, затова
+    префиксът до секундата се кешира - тестовете на един run са в
+    сравнително малко на брой секунди.
+    """
+
+    def __init__(self, offsets: List[int]):
+        self.offsets = offsets
+        self._zones = {}
+        self._seconds = {}
+
+    def __call__(self, value):
+        if not isinstance(value, list):
+            return value
+        micros, zone = value
+        seconds, fraction = divmod(micros, 1000000)
+        text = self._seconds.get((seconds, zone))
+        if text is None:
+            tz = self._zones.get(zone)
+            if tz is None:
+                tz = self._zones[zone] = timezone(timedelta(seconds=self.offsets[zone]))
+            text = (_EPOCH + timedelta(seconds=seconds)).astimezone(tz).isoformat()
+            self._seconds[(seconds, zone)] = text
+        if not fraction:
+            return text
+        return f"{text[:19]}.{fraction:06d}{text[19:]}"
+
+
+def _encode_time(value: Optional[str], offsets: _Interned, time_format: _TimeFormat):
+    """ISO timestamp -> [epoch µs, offset index]; низът остава, ако не се възстановява точно"""
+    if not value:
+        return value
+    try:
+        dt = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return value
+    if dt.tzinfo is None:
+        return value
+
+    delta = dt - _EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    encoded = [micros, offsets(int(dt.utcoffset().total_seconds()))]
+    if time_format(encoded) != value:
+        return value
+    return encoded
+
+
+def encode_tests(tests: List[Dict]) -> Dict:
+    """Списък тестове -> колонна структура"""
+    suites, statuses, messages, tags, layouts, offsets = (_Interned() for _ in range(6))
+    time_format = _TimeFormat(offsets.values)
+    columns = {
+        'name': [], 'suite': [], 'status': [], 'start_time': [], 'end_time': [],
+        'duration': [], 'message': [], 'tags': [], 'layout': [], 'extra': []
+    }
+
+    for test in tests:
+        columns['layout'].append(layouts(list(test.keys())))
+        columns['name'].append(test.get('name'))
+        columns['suite'].append(suites(test.get('suite')))
+        columns['status'].append(statuses(test.get('status')))
+        for column in TIME_COLUMNS:
+            columns[column].append(_encode_time(test.get(column), offsets, time_format))
+        columns['duration'].append(test.get('duration'))
+        columns['message'].append(messages(test.get('message')))
+        columns['tags'].append([tags(tag) for tag in test.get('tags') or []])
+        extra = {key: value for key, value in test.items() if key not in TEST_COLUMNS}
+        columns['extra'].append(extra or None)
+
+    columns.update({
+        'count': len(tests),
+        'suites': suites.values,
+        'statuses': statuses.values,
+        'messages': messages.values,
+        'tag_names': tags.values,
+        'layouts': layouts.values,
+        'offsets': offsets.values
+    })
+    return columns
+
+
+def decode_tests(columns: Dict) -> List[Dict]:
+    """Колонна структура -> списък тестове (с оригиналния ред на ключовете)"""
+    suites, statuses = columns['suites'], columns['statuses']
+    messages, tag_names = columns['messages'], columns['tag_names']
+    layouts = columns['layouts']
+    time_format = _TimeFormat(columns['offsets'])
+    # Layout-ът на парсера се сглобява директно, останалите - по ключове
+    standard = [tuple(layout) == TEST_COLUMNS for layout in layouts]
+
+    tests = []
+    rows = zip(columns['layout'], columns['name'], columns['suite'], columns['status'],
+               columns['start_time'], columns['end_time'], columns['duration'],
+               columns['message'], columns['tags'], columns['extra'])
+    for layout, name, suite, status, start, end, duration, message, tags, extra in rows:
+        test = {
+            'name': name,
+            'suite': suites[suite],
+            'status': statuses[status],
+            'start_time': time_format(start),
+            'end_time': time_format(end),
+            'duration': duration,
+            'message': messages[message],
+            'tags': [tag_names[t] for t in tags]
+        }
+        if not standard[layout]:
+            extra = extra or {}
+            test = {key: test[key] if key in TEST_COLUMNS else extra.get(key)
+                    for key in layouts[layout]}
+        tests.append(test)
+    return tests
+
+
+def dumps_run(run: Dict) -> bytes:
+    # header пази реда на ключовете; tests е само placeholder
+    header = json.dumps({**run, 'tests': None}, separators=(',', ':')).encode('utf-8')
+    tests = zlib.compress(
+        json.dumps(encode_tests(run.get('tests') or []), separators=(',', ':')).encode('utf-8'), 6
+    )
+    return MAGIC + bytes([FORMAT_VERSION]) + SECTIONS.pack(len(header), len(tests)) + header + tests
+
+
+def _read_header(f, path) -> Tuple[Dict, int]:
+    preamble = f.read(PREAMBLE_SIZE)
+    if len(preamble) < PREAMBLE_SIZE or not preamble.startswith(MAGIC):
+        raise RunFormatError(f"{path} is not a run file")
+    version = preamble[len(MAGIC)]
+    if version != FORMAT_VERSION:
+        raise RunFormatError(f"{path}: unsupported run format version {version}")
+    header_size, tests_size = SECTIONS.unpack(preamble[len(MAGIC) + 1:])
+    return json.loads(f.read(header_size)), tests_size
+
+
+def read_run(path, include_tests: bool = True, stats: Optional[Dict] = None) -> Dict:
+    """
+    Чете run файл - компактен (.run) или legacy JSON (.json).
+
+    Без include_tests от компактния файл се чете само header-ът. Ако е
+    подаден stats, към stats['bytes'] се добавят прочетените байтове.
+    """
+    path = Path(path)
+    if path.suffix == LEGACY_SUFFIX:
+        with open(path, 'rb') as f:
+            data = f.read()
+        run = json.loads(data)
+        if not include_tests:
+            run.pop('tests', None)
+        if stats is not None:
+            stats['bytes'] = stats.get('bytes', 0) + len(data)
+        return run
+
+    with open(path, 'rb') as f:
+        run, tests_size = _read_header(f, path)
+        if include_tests:
+            run['tests'] = decode_tests(json.loads(zlib.decompress(f.read(tests_size))))
+        else:
+            run.pop('tests', None)
+        if stats is not None:
+            stats['bytes'] = stats.get('bytes', 0) + f.tell()
+    return run
+
+
+def write_run(path, run: Dict):
+    """Atomic запис (temp + rename) на run в компактния формат"""
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(dumps_run(run))
+    os.replace(tmp_path, path)
+
+
+def convert_history(history_dir, keep_legacy: bool = False) -> Dict:
+    """Конвертира всички legacy *.json runs в history_dir към компактния формат"""
+    history_dir = Path(history_dir)
+    result = {'converted': 0, 'failed': 0, 'bytes_before': 0, 'bytes_after': 0}
+
+    for json_file in sorted(history_dir.glob(f'*{LEGACY_SUFFIX}')):
+        run_path = json_file.with_suffix(RUN_SUFFIX)
+        try:
+            run = read_run(json_file)
+            write_run(run_path, run)
+            if read_run(run_path) != run:
+                raise RunFormatError('round-trip mismatch')
+        except Exception as e:
+            print(f"✗ Could not convert {json_file.name}: {e}")
+            run_path.unlink(missing_ok=True)
+            result['failed'] += 1
+            continue
+
+        result['bytes_before'] += json_file.stat().st_size
+        result['bytes_after'] += run_path.stat().st_size
+        if not keep_legacy:
+            json_file.unlink()
+        result['converted'] += 1
+
+    return result
+
+
+if __name__ == '__main__':
+    cli = argparse.ArgumentParser(description='Convert legacy JSON runs to the compact run format')
+    cli.add_argument('history_dir', nargs='?',
+                     default=os.path.join(os.getenv('METRICS_DATA_DIR', '/app/data'), 'history'))
+    cli.add_argument('--keep-legacy', action='store_true', help='Keep the original .json files')
+    args = cli.parse_args()
+
+    result = convert_history(args.history_dir, keep_legacy=args.keep_legacy)
+    print(f"✓ Converted {result['converted']} run(s), {result['failed']} failed: "
+          f"{result['bytes_before']} -> {result['bytes_after']} bytes")
+    sys.exit(1 if result['failed'] else 0)
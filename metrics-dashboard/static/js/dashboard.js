@@ -16,6 +16,50 @@ const CONFIG = {
     }
 };
 
+// Namespace (project/branch/environment) от ?ns= на страницата -
+// добавя се към всички API заявки и линкове
+const NAMESPACE = new URLSearchParams(window.location.search).get('ns');
+
+function withNamespace(url) {
+    if (!NAMESPACE) {
+        return url;
+    }
+    return url + (url.includes('?') ? '&' : '?') + 'ns=' + encodeURIComponent(NAMESPACE);
+}
+
+// Namespace selector в navbar-а - показва се само ако има повече от един namespace
+async function initNamespaceSelector() {
+    const select = document.getElementById('namespace-select');
+    if (!select) {
+        return;
+    }
+    try {
+        const response = await fetch(CONFIG.apiBaseUrl + '/api/namespaces');
+        if (!response.ok) {
+            return;
+        }
+        const data = await response.json();
+        if (data.namespaces.length < 2) {
+            return;
+        }
+        const current = NAMESPACE || data.default;
+        select.innerHTML = data.namespaces.map(ns =>
+            `<option value="${ns.namespace}" ${ns.namespace === current ? 'selected' : ''}>` +
+            `${ns.namespace} (${ns.total_runs})</option>`
+        ).join('');
+        select.hidden = false;
+        select.addEventListener('change', () => {
+            const params = new URLSearchParams(window.location.search);
+            params.set('ns', select.value);
+            window.location.href = '/?' + params.toString();
+        });
+    } catch (error) {
+        console.error('Error loading namespaces:', error);
+    }
+}
+
+document.addEventListener('DOMContentLoaded', initNamespaceSelector);
+
 // Auto-refresh functionality
 let autoRefreshInterval = null;
 
@@ -33,10 +77,57 @@ function stopAutoRefresh() {
     }
 }
 
+// Server-sent events от /api/events (run_ingested, runs_ingested, run_deleted, history_cleared)
+let historyEventSource = null;
+let historyEventsRetry = null;
+
+// При 503 (сървърът е на лимита за streams) браузърът не се reconnect-ва сам
+const EVENTS_RETRY_MS = 30000;
+
+function subscribeHistoryEvents(handlers) {
+    if (!window.EventSource) {
+        console.warn('EventSource not supported - use Refresh');
+        return null;
+    }
+
+    unsubscribeHistoryEvents();
+    historyEventSource = new EventSource(CONFIG.apiBaseUrl + withNamespace('/api/events'));
+
+    Object.entries(handlers).forEach(([type, handler]) => {
+        historyEventSource.addEventListener(type, event => {
+            try {
+                handler(JSON.parse(event.data));
+            } catch (error) {
+                console.error(`Error handling ${type} event:`, error);
+            }
+        });
+    });
+
+    historyEventSource.onerror = () => {
+        if (historyEventSource.readyState === EventSource.CLOSED) {
+            console.log(`Event stream rejected, retrying in ${EVENTS_RETRY_MS / 1000}s...`);
+            historyEventsRetry = setTimeout(() => subscribeHistoryEvents(handlers), EVENTS_RETRY_MS);
+            return;
+        }
+        // Браузърът се reconnect-ва сам с Last-Event-ID
+        console.log('Event stream disconnected, reconnecting...');
+    };
+    return historyEventSource;
+}
+
+function unsubscribeHistoryEvents() {
+    clearTimeout(historyEventsRetry);
+    historyEventsRetry = null;
+    if (historyEventSource) {
+        historyEventSource.close();
+        historyEventSource = null;
+    }
+}
+
 // API helper functions
 async function apiGet(endpoint) {
     try {
-        const response = await fetch(CONFIG.apiBaseUrl + endpoint);
+        const response = await fetch(CONFIG.apiBaseUrl + withNamespace(endpoint));
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
@@ -49,7 +140,7 @@ async function apiGet(endpoint) {
 
 async function apiPost(endpoint, data = {}) {
     try {
-        const response = await fetch(CONFIG.apiBaseUrl + endpoint, {
+        const response = await fetch(CONFIG.apiBaseUrl + withNamespace(endpoint), {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -68,7 +159,7 @@ async function apiPost(endpoint, data = {}) {
 
 async function apiDelete(endpoint) {
     try {
-        const response = await fetch(CONFIG.apiBaseUrl + endpoint, {
+        const response = await fetch(CONFIG.apiBaseUrl + withNamespace(endpoint), {
             method: 'DELETE'
         });
         if (!response.ok) {
@@ -261,6 +352,8 @@ window.DashboardUtils = {
     hideLoading,
     startAutoRefresh,
     stopAutoRefresh,
+    subscribeHistoryEvents,
+    unsubscribeHistoryEvents,
     saveToLocalStorage,
     loadFromLocalStorage
 };
@@ -0,0 +1,331 @@
+"""
+Robot Framework Metrics - Per-test history
+Инкрементални агрегати за всеки тест (flaky detection, duration regressions, история)
+"""
+import math
+from typing import Dict, Iterable, List, Optional
+
+
+# Последните N PASS/FAIL резултата се пазят като bitmap (1 = FAIL).
+# SQLite INTEGER е signed 64-bit, затова 63 бита.
+HISTORY_BITS = 63
+HISTORY_MASK = (1 << HISTORY_BITS) - 1
+
+OUTCOME_STATUSES = ('PASS', 'FAIL')
+
+# Duration статистика: EWMA + прозорец от последните N времена на
+# PASS/FAIL изпълнения (median и p95 се смятат от прозореца)
+DURATION_WINDOW = 20
+DURATION_EWMA_ALPHA = 0.2
+
+# Ново време е регресия, ако спрямо медианата на прозореца (преди него) е
+# поне REGRESSION_MIN_RATIO пъти и REGRESSION_MIN_SECONDS по-бавно, и robust
+# z-score-ът ((d - median) / (1.4826 * MAD)) е >= REGRESSION_Z
+REGRESSION_MIN_SAMPLES = 5
+REGRESSION_MIN_RATIO = 1.5
+REGRESSION_MIN_SECONDS = 0.5
+REGRESSION_Z = 3.5
+MAD_SCALE = 1.4826
+# Долна граница на разсейването (дял от медианата), за да не е всяко
+# отклонение "значимо" при тест с почти константно време
+MIN_SPREAD = 0.05
+
+
+def test_key(test: Dict) -> str:
+    """Уникален ключ на тест - пълният път на suite-а + името"""
+    suite = test.get('suite') or ''
+    return f"{suite}.{test['name']}" if suite else test['name']
+
+
+def _popcount(value: int) -> int:
+    return bin(value).count('1')
+
+
+def _median(values: List[float]) -> float:
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def _p95(values: List[float]) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+
+
+class TestAggregate:
+    """Rolling статистика за един тест през всички runs"""
+
+    FIELDS = (
+        'key', 'suite', 'name', 'runs', 'passed', 'failed', 'skipped', 'flips',
+        'last_status', 'history', 'history_len', 'duration_total', 'duration_sq_total',
+        'duration_min', 'duration_max', 'last_duration', 'first_seen', 'last_seen',
+        'last_run_id', 'duration_ewma', 'duration_window', 'duration_baseline',
+        'duration_score', 'slow_streak', 'slow_since'
+    )
+
+    def __init__(self, key: str, suite: str = '', name: str = ''):
+        self.key = key
+        self.suite = suite
+        self.name = name
+        self.runs = 0
+        self.passed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.flips = 0
+        self.last_status = None
+        self.history = 0
+        self.history_len = 0
+        self.duration_total = 0.0
+        self.duration_sq_total = 0.0
+        self.duration_min = None
+        self.duration_max = None
+        self.last_duration = None
+        self.first_seen = None
+        self.last_seen = None
+        self.last_run_id = None
+        self.duration_ewma = None
+        self.duration_window = ''  # последните DURATION_WINDOW времена, oldest first
+        self.duration_baseline = None
+        self.duration_score = None
+        self.slow_streak = 0
+        self.slow_since = None
+
+    @classmethod
+    def for_test(cls, test: Dict) -> 'TestAggregate':
+        return cls(test_key(test), test.get('suite') or '', test['name'])
+
+    @classmethod
+    def from_row(cls, row) -> 'TestAggregate':
+        agg = cls(row['key'])
+        # Архивите от преди duration статистиката нямат новите полета
+        present = set(row.keys())
+        for field in cls.FIELDS:
+            if field in present and row[field] is not None:
+                setattr(agg, field, row[field])
+        return agg
+
+    def to_row(self) -> tuple:
+        return tuple(getattr(self, field) for field in self.FIELDS)
+
+    def update(self, test: Dict, run_id: str, timestamp: float):
+        """Добавя резултата на теста от нов run (runs се подават хронологично)"""
+        status = test.get('status')
+        duration = float(test.get('duration') or 0)
+
+        self.runs += 1
+        if status in OUTCOME_STATUSES:
+            failed = status == 'FAIL'
+            if failed:
+                self.failed += 1
+            else:
+                self.passed += 1
+
+            if self.last_status in OUTCOME_STATUSES and self.last_status != status:
+                self.flips += 1
+            self.last_status = status
+            self.history = ((self.history << 1) | int(failed)) & HISTORY_MASK
+            self.history_len = min(self.history_len + 1, HISTORY_BITS)
+            self._update_durations(duration, timestamp)
+        else:
+            self.skipped += 1
+
+        self.duration_total += duration
+        self.duration_sq_total += duration * duration
+        self.duration_min = duration if self.duration_min is None else min(self.duration_min, duration)
+        self.duration_max = duration if self.duration_max is None else max(self.duration_max, duration)
+        self.last_duration = duration
+        if self.first_seen is None:
+            self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.last_run_id = run_id
+
+    def _update_durations(self, duration: float, timestamp: float):
+        """
+        EWMA, прозорецът и регресията спрямо прозореца преди това изпълнение.
+
+        Skipped тестовете не участват - времето им не казва нищо. При трайно
+        забавяне медианата се измества след ~DURATION_WINDOW/2 runs и
+        новото време става baseline (slow_streak се нулира).
+        """
+        window = self.durations
+        slow = False
+        if len(window) >= REGRESSION_MIN_SAMPLES:
+            median = _median(window)
+            mad = _median([abs(value - median) for value in window])
+            spread = max(MAD_SCALE * mad, MIN_SPREAD * median, 0.01)
+            self.duration_baseline = median
+            self.duration_score = round((duration - median) / spread, 2)
+            slow = (self.duration_score >= REGRESSION_Z
+                    and duration >= median * REGRESSION_MIN_RATIO
+                    and duration - median >= REGRESSION_MIN_SECONDS)
+        else:
+            self.duration_baseline = None
+            self.duration_score = None
+
+        if slow:
+            if not self.slow_streak:
+                self.slow_since = timestamp
+            self.slow_streak += 1
+        else:
+            self.slow_streak = 0
+            self.slow_since = None
+
+        if self.duration_ewma is None:
+            self.duration_ewma = duration
+        else:
+            self.duration_ewma += DURATION_EWMA_ALPHA * (duration - self.duration_ewma)
+        window.append(round(duration, 3))
+        self.duration_window = ','.join(str(value) for value in window[-DURATION_WINDOW:])
+
+    @property
+    def durations(self) -> List[float]:
+        """Времената в прозореца, oldest first"""
+        return [float(value) for value in self.duration_window.split(',')] if self.duration_window else []
+
+    def window(self, size: int) -> Dict:
+        """PASS/FAIL статистика за последните `size` изпълнения (до HISTORY_BITS)"""
+        count = max(0, min(size, self.history_len))
+        bits = self.history & ((1 << count) - 1)
+        pairs_mask = (1 << max(count - 1, 0)) - 1
+
+        # бит i е по-нов от бит i+1
+        transitions = (bits ^ (bits >> 1)) & pairs_mask
+        pass_to_fail = bits & ~(bits >> 1) & pairs_mask
+
+        failed = _popcount(bits)
+        flips = _popcount(transitions)
+        return {
+            'total': count,
+            'failed': failed,
+            'passed': count - failed,
+            'flips': flips,
+            'pass_to_fail': _popcount(pass_to_fail),
+            'fail_rate': round(failed / count * 100, 2) if count else 0,
+            'flakiness': round(flips / (count - 1), 3) if count > 1 else 0
+        }
+
+    @property
+    def mean_duration(self) -> float:
+        return self.duration_total / self.runs if self.runs else 0.0
+
+    @property
+    def expected_duration(self) -> float:
+        """Очаквано време на следващо изпълнение (EWMA, иначе средното)"""
+        return self.duration_ewma if self.duration_ewma is not None else self.mean_duration
+
+    @property
+    def duration_stddev(self) -> float:
+        if self.runs < 2:
+            return 0.0
+        mean = self.mean_duration
+        variance = max(self.duration_sq_total / self.runs - mean * mean, 0.0)
+        return math.sqrt(variance)
+
+    def to_dict(self, window: Optional[int] = None) -> Dict:
+        durations = self.durations
+        data = {
+            'key': self.key,
+            'suite': self.suite,
+            'name': self.name,
+            'runs': self.runs,
+            'passed': self.passed,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'flips': self.flips,
+            'last_status': self.last_status,
+            'last_run_id': self.last_run_id,
+            'first_seen': self.first_seen,
+            'last_seen': self.last_seen,
+            'duration': {
+                'mean': round(self.mean_duration, 3),
+                'stddev': round(self.duration_stddev, 3),
+                'min': self.duration_min,
+                'max': self.duration_max,
+                'last': self.last_duration,
+                'ewma': round(self.duration_ewma, 3) if self.duration_ewma is not None else None,
+                'median': _median(durations) if durations else None,
+                'p95': _p95(durations) if durations else None,
+                'baseline': self.duration_baseline,
+                'score': self.duration_score,
+                'slow_streak': self.slow_streak
+            }
+        }
+        if window:
+            data['window'] = self.window(window)
+        return data
+
+
+def flaky_tests(aggregates: Iterable[TestAggregate], window: int = 10,
+                min_flakiness: float = 0.2) -> list:
+    """
+    Flaky тестове в последните `window` изпълнения.
+
+    Тест е flaky ако има поне един PASS->FAIL преход и дял на смените на
+    статуса (flakiness) >= min_flakiness. Тест, който просто е счупен
+    (PPPPFFFF), има една смяна и не се брои за flaky.
+    """
+    flaky = []
+    for agg in aggregates:
+        stats = agg.window(window)
+        if stats['total'] < 3 or stats['pass_to_fail'] == 0:
+            continue
+        if stats['flakiness'] < min_flakiness:
+            continue
+
+        flaky.append({
+            'name': agg.name,
+            'suite': agg.suite,
+            'key': agg.key,
+            'fail_rate': stats['fail_rate'],
+            'passed': stats['passed'],
+            'failed': stats['failed'],
+            'total': stats['total'],
+            'flips': stats['flips'],
+            'pass_to_fail': stats['pass_to_fail'],
+            'flakiness': stats['flakiness']
+        })
+
+    return sorted(flaky, key=lambda x: (x['flakiness'], x['fail_rate']), reverse=True)
+
+
+def duration_regressions(aggregates: Iterable[TestAggregate], min_ratio: float = REGRESSION_MIN_RATIO,
+                         min_score: float = REGRESSION_Z) -> list:
+    """
+    Тестове, чието последно изпълнение е значимо по-бавно от прозореца преди него.
+
+    Флагът (slow_streak) се поставя при ingest с праговете по подразбиране;
+    min_ratio/min_score могат само да го затегнат. Подредени са по
+    добавеното време (last - baseline) - ефекта върху wall-clock-а на suite-а.
+    """
+    regressions = []
+    for agg in aggregates:
+        if not agg.slow_streak or not agg.duration_baseline:
+            continue
+        # Последното PASS/FAIL време (last_duration може да е на skip)
+        durations = agg.durations
+        duration = durations[-1]
+        ratio = duration / agg.duration_baseline
+        if ratio < min_ratio or agg.duration_score < min_score:
+            continue
+
+        regressions.append({
+            'name': agg.name,
+            'suite': agg.suite,
+            'key': agg.key,
+            'last_status': agg.last_status,
+            'last_run_id': agg.last_run_id,
+            'last_seen': agg.last_seen,
+            'duration': duration,
+            'baseline': agg.duration_baseline,
+            'p95': _p95(durations[:-1] or durations),
+            'ewma': round(agg.duration_ewma, 3),
+            'ratio': round(ratio, 2),
+            'added_seconds': round(duration - agg.duration_baseline, 3),
+            'score': agg.duration_score,
+            'streak': agg.slow_streak,
+            'since': agg.slow_since
+        })
+
+    return sorted(regressions, key=lambda x: (x['added_seconds'], x['ratio']), reverse=True)
@@ -0,0 +1,222 @@
+"""
+Robot Framework Metrics - Trend series
+Time-range заявки и downsampling на trend данните (на runs и на tag/suite статистиките)
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+
+# Метрика -> ключ в отговора на /api/trends
+SERIES_METRICS = {
+    'pass_rate': 'pass_rates',
+    'total': 'totals',
+    'passed': 'passed',
+    'failed': 'failed',
+    'duration': 'durations',
+}
+
+# Метриките на tag/suite серията (/api/tags/<tag>/history, /api/suites/<suite>/history)
+STAT_SERIES_METRICS = {
+    'pass_rate': 'pass_rates',
+    'total': 'totals',
+    'passed': 'passed',
+    'failed': 'failed',
+    'skipped': 'skipped',
+    'duration': 'durations',
+}
+
+STAT_KINDS = ('tag', 'suite')
+
+DOWNSAMPLE_MODES = ('avg', 'lttb')
+
+
+def epoch_to_iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts).astimezone().isoformat()
+
+
+def empty_series(metrics: Dict = SERIES_METRICS) -> Dict:
+    series = {'runs': [], 'timestamps': []}
+    for key in metrics.values():
+        series[key] = []
+    return series
+
+
+def points_to_series(points: List[Dict], metrics: Dict = SERIES_METRICS) -> Dict:
+    """Точки (dict-ове с ts/run_id/timestamp + метриките) -> паралелни масиви"""
+    series = empty_series(metrics)
+    for point in points:
+        series['runs'].append(point['run_id'])
+        series['timestamps'].append(point['timestamp'])
+        for metric, key in metrics.items():
+            series[key].append(point[metric])
+    return series
+
+
+def bucket_points(points: List[Dict], buckets: int, start: float, end: float,
+                  metrics: Dict = SERIES_METRICS) -> Dict:
+    """
+    Групира точките в `buckets` равни времеви интервала между start и end.
+
+    За всеки непразен bucket връща броя runs и min/max/avg на всяка метрика;
+    стойностите в основните масиви са средните. Точките от rollups носят
+    броя runs в 'runs' и тежат съответно.
+    """
+    series = empty_series(metrics)
+    series.pop('runs')
+    series['counts'] = []
+    series['ranges'] = {key: {'min': [], 'max': []} for key in metrics.values()}
+
+    if not points or buckets < 1:
+        return series
+
+    width = (end - start) / buckets if end > start else 1.0
+    grouped = {}
+    for point in points:
+        index = min(int((point['ts'] - start) / width), buckets - 1)
+        grouped.setdefault(index, []).append(point)
+
+    for index in sorted(grouped):
+        group = grouped[index]
+        series['timestamps'].append(epoch_to_iso(start + index * width))
+        weights = [point.get('runs', 1) for point in group]
+        series['counts'].append(sum(weights))
+        for metric, key in metrics.items():
+            values = [point[metric] for point in group]
+            weighted = sum(value * weight for value, weight in zip(values, weights))
+            series[key].append(round(weighted / sum(weights), 2))
+            series['ranges'][key]['min'].append(min(values))
+            series['ranges'][key]['max'].append(max(values))
+
+    return series
+
+
+def lttb(points: List[Dict], threshold: int, metric: str = 'pass_rate') -> List[Dict]:
+    """
+    Largest-Triangle-Three-Buckets downsampling по `metric`.
+
+    Запазва визуалната форма на графиката с `threshold` реални точки
+    (първата и последната винаги остават).
+    """
+    count = len(points)
+    if threshold >= count or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    every = (count - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Средна точка на следващия bucket
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, count)
+        avg_range = points[avg_start:avg_end] or [points[-1]]
+        avg_x = sum(p['ts'] for p in avg_range) / len(avg_range)
+        avg_y = sum(p[metric] for p in avg_range) / len(avg_range)
+
+        # Точката от текущия bucket с най-голям триъгълник
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        point_a = points[a]
+        max_area = -1.0
+        next_a = range_start
+
+        for j in range(range_start, range_end):
+            area = abs(
+                (point_a['ts'] - avg_x) * (points[j][metric] - point_a[metric]) -
+                (point_a['ts'] - points[j]['ts']) * (avg_y - point_a[metric])
+            )
+            if area > max_area:
+                max_area = area
+                next_a = j
+
+        sampled.append(points[next_a])
+        a = next_a
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def downsample(points: List[Dict], buckets: int, mode: str = 'avg',
+               start: Optional[float] = None, end: Optional[float] = None,
+               metrics: Dict = SERIES_METRICS) -> Dict:
+    """Trend серия за time-range заявка - bucket агрегати или LTTB"""
+    if mode not in DOWNSAMPLE_MODES:
+        raise ValueError(f"Unknown mode '{mode}' (expected one of: {', '.join(DOWNSAMPLE_MODES)})")
+
+    if start is None:
+        start = points[0]['ts'] if points else 0.0
+    if end is None:
+        end = points[-1]['ts'] if points else 0.0
+
+    if mode == 'lttb':
+        series = points_to_series(lttb(points, buckets), metrics)
+    else:
+        series = bucket_points(points, buckets, start, end, metrics)
+
+    series.update({
+        'mode': mode,
+        'from': epoch_to_iso(start) if points else None,
+        'to': epoch_to_iso(end) if points else None,
+        'points_in_range': len(points)
+    })
+    return series
+
+
+# ----------------------------------------------------------------------
+# Tag/suite статистики на run
+# ----------------------------------------------------------------------
+
+def normalize_tag(tag: str) -> str:
+    """RF сравнява таговете без главни букви, интервали и '_'"""
+    return tag.lower().replace(' ', '').replace('_', '')
+
+
+def test_stat_totals(tests: Iterable[Dict]) -> Dict:
+    """
+    Време и skipped тестове по tag и по suite за един run.
+
+    Тест от suite 'A.B.C' влиза и в 'A', и в 'A.B' - така както RF брои
+    suite статистиките. Връща {(kind, key): [duration, skipped]}.
+    """
+    totals = {}
+    for test in tests:
+        duration = test.get('duration') or 0
+        skipped = 1 if test.get('status') == 'SKIP' else 0
+        keys = {('tag', normalize_tag(tag)) for tag in test.get('tags') or []}
+        parts = (test.get('suite') or '').split('.')
+        keys.update(('suite', '.'.join(parts[:i])) for i in range(1, len(parts) + 1) if parts[0])
+        for key in keys:
+            entry = totals.get(key)
+            if entry is None:
+                entry = totals[key] = [0.0, 0]
+            entry[0] += duration
+            entry[1] += skipped
+    return totals
+
+
+def stat_totals(totals: Dict, kind: str, name: str) -> List:
+    """[duration, skipped] на tag/suite статистика ([0.0, 0] ако няма тестове)"""
+    key = normalize_tag(name) if kind == 'tag' else name
+    return totals.get((kind, key)) or [0.0, 0]
+
+
+def add_stat_durations(tag_stats: List[Dict], suite_stats: List[Dict], tests: List[Dict]):
+    """
+    Добавя 'duration' (сумарното време на тестовете) към tag/suite
+    статистиките. Комбинираните тагове (--tagstatcombine) нямат тестове с
+    точно това име и остават с 0.
+    """
+    totals = test_stat_totals(tests)
+    for kind, stats in (('tag', tag_stats), ('suite', suite_stats)):
+        for stat in stats:
+            stat['duration'] = round(stat_totals(totals, kind, stat['name'])[0], 2)
+
+
+def stat_point(ts: float, run_id: Optional[str], timestamp: str, stat: Dict) -> Dict:
+    """Точка от серията на tag/suite (runs отпреди skipped/duration имат 0)"""
+    return {
+        'ts': ts,
+        'run_id': run_id,
+        'timestamp': timestamp,
+        **{metric: stat.get(metric) or 0 for metric in STAT_SERIES_METRICS}
+    }
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Pabot scheduling from historical test durations
+
+Expected durations come from the metrics dashboard (/api/durations) or a
+JSON file with the same format. Suites (or tests of heavy suites) are
+ordered longest-processing-time first: pabot hands the next item to the
+first idle process, so an LPT ordering gives the LPT schedule and adapts
+when a prediction is off. Tests unknown to the history are appended by
+pabot after the ordered items.
+"""
+import fnmatch
+import heapq
+import json
+import urllib.parse
+import urllib.request
+
+
+# Suites are split into tests when they alone take longer than this
+# fraction of the ideal per-process share of the total time
+HEAVY_SUITE_SHARE = 1.0
+
+# Auto process count: the smallest count whose predicted makespan is
+# within this fraction of the best one
+MAKESPAN_TOLERANCE = 0.05
+
+
+def fetch_tests(source, tag=None, window=10, timeout=5.0, namespace=None):
+    """
+    Per-test history from /api/durations - suite, name, expected duration
+    and the outcomes of the last `window` runs.
+
+    source is the dashboard base URL (http://metrics:5000) or a path to a
+    JSON file saved from /api/durations. namespace selects the dashboard
+    history (project/branch/environment) the durations come from.
+    """
+    if source.startswith(('http://', 'https://')):
+        params = {'window': window}
+        if tag:
+            params['tag'] = tag
+        if namespace:
+            params['ns'] = namespace
+        url = source.rstrip('/') + '/api/durations?' + urllib.parse.urlencode(params)
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            data = json.load(response)
+    else:
+        with open(source, 'r') as f:
+            data = json.load(f)
+    return data.get('tests', [])
+
+
+def test_longname(test):
+    return f"{test['suite']}.{test['name']}" if test['suite'] else test['name']
+
+
+def durations_by_suite(tests):
+    """Expected durations as {suite longname: {test name: seconds}}"""
+    durations = {}
+    for test in tests:
+        durations.setdefault(test['suite'], {})[test['name']] = float(test['duration'] or 0)
+    return durations
+
+
+def _matches(longname, patterns, parents=False):
+    """
+    Robot-like --suite/--test match against the name, full name or any
+    dotted suffix of longname; with parents, a selected parent suite also
+    selects its children.
+    """
+    if not patterns:
+        return True
+    parts = longname.lower().split('.')
+    ends = range(1, len(parts) + 1) if parents else [len(parts)]
+    candidates = ['.'.join(parts[start:end]) for end in ends for start in range(end)]
+    return any(fnmatch.fnmatchcase(candidate, pattern.lower())
+               for pattern in patterns for candidate in candidates)
+
+
+def filter_tests(tests, suites=None, names=None):
+    """Keeps the tests selected by --suite and --test (tags are filtered by the API)"""
+    return [test for test in tests
+            if _matches(test['suite'], suites, parents=True) and _matches(test_longname(test), names)]
+
+
+def plan_items(durations, processes, split_heavy=False):
+    """
+    Scheduling items - (kind, longname, seconds), kind is 'suite' or 'test'.
+
+    With split_heavy, suites longer than the per-process share of the total
+    are split into their tests (needs pabot --testlevelsplit).
+    """
+    totals = {suite: sum(tests.values()) for suite, tests in durations.items()}
+    threshold = sum(totals.values()) / max(processes, 1) * HEAVY_SUITE_SHARE
+
+    items = []
+    for suite, tests in durations.items():
+        if split_heavy and processes > 1 and len(tests) > 1 and totals[suite] > threshold:
+            items.extend(('test', f'{suite}.{name}', seconds) for name, seconds in tests.items())
+        else:
+            items.append(('suite', suite, totals[suite]))
+    return sorted(items, key=lambda item: (-item[2], item[1]))
+
+
+def lpt_makespan(items, processes):
+    """Predicted wall time when items (in order) go to the least loaded process"""
+    loads = [0.0] * max(processes, 1)
+    for _, _, seconds in items:
+        heapq.heapreplace(loads, loads[0] + seconds)
+    return max(loads)
+
+
+def _pick_plan(plans):
+    """The plan with the fewest processes within MAKESPAN_TOLERANCE of the best makespan"""
+    best = min(plan['makespan'] for plan in plans)
+    plan = next(p for p in plans if p['makespan'] <= best * (1 + MAKESPAN_TOLERANCE))
+    plan['total'] = sum(seconds for _, _, seconds in plan['items'])
+    plan['testlevelsplit'] = any(kind == 'test' for kind, _, _ in plan['items'])
+    return plan
+
+
+def plan_schedule(durations, processes, split_heavy=False, auto_processes=False):
+    """
+    Plan for a pabot run: items in LPT order, process count and predicted makespan.
+
+    With auto_processes, `processes` is the upper bound and the smallest
+    count within MAKESPAN_TOLERANCE of the best predicted makespan is used
+    (more browsers than that only add load on the system under test).
+    """
+    candidates = range(1, processes + 1) if auto_processes else [processes]
+    plans = []
+    for count in candidates:
+        items = plan_items(durations, count, split_heavy)
+        plans.append({
+            'processes': count,
+            'items': items,
+            'makespan': lpt_makespan(items, count)
+        })
+    return _pick_plan(plans)
+
+
+def plan_ordered(items, processes, auto_processes=False):
+    """Same as plan_schedule, for items whose order is already fixed (test selection)"""
+    candidates = range(1, processes + 1) if auto_processes else [processes]
+    return _pick_plan([
+        {'processes': count, 'items': list(items), 'makespan': lpt_makespan(items, count)}
+        for count in candidates
+    ])
+
+
+def write_ordering_file(path, items):
+    """Pabot --ordering file - one --suite/--test line per item"""
+    with open(path, 'w') as f:
+        for kind, longname, _ in items:
+            f.write(f'--{kind} {longname}\n')
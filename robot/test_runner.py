@@ -4,11 +4,62 @@ Robot Framework Test Runner with Pabot support
 """
 import os
 import sys
+import json
+import time
+import zlib
 import subprocess
 import argparse
+import urllib.error
+import urllib.parse
+import urllib.request
 from pathlib import Path
 from datetime import datetime
 
+from pabot_scheduling import (durations_by_suite, fetch_tests, filter_tests, plan_ordered, plan_schedule,
+                              test_longname, write_ordering_file)
+from test_selection import RESTRICTING_STRATEGIES, STRATEGIES, select_tests, write_selection_file
+
+
+PUSH_CHUNK_SIZE = 256 * 1024
+PUSH_ATTEMPTS = 5
+
+
+def _gzip_chunks(path):
+    """output.xml as gzip chunks, compressed while it is read"""
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(PUSH_CHUNK_SIZE), b''):
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+    yield compressor.flush()
+
+
+def push_results(output_xml, metrics_url, namespace=None, timeout=300, attempts=PUSH_ATTEMPTS):
+    """
+    Streams output.xml gzip-compressed to the dashboard's POST /api/ingest
+    (chunked, never held in memory) and returns its JSON response. A busy
+    dashboard answers 503 - the push is retried after its Retry-After.
+    """
+    url = metrics_url.rstrip('/') + '/api/ingest'
+    if namespace:
+        url += '?' + urllib.parse.urlencode({'ns': namespace})
+
+    for attempt in range(1, attempts + 1):
+        request = urllib.request.Request(url, data=_gzip_chunks(output_xml), method='POST', headers={
+            'Content-Type': 'application/xml',
+            'Content-Encoding': 'gzip'
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            if e.code != 503 or attempt == attempts:
+                raise
+            retry_after = float(e.headers.get('Retry-After') or 5)
+            print(f"⏭️  Dashboard busy, retrying push in {retry_after:.0f}s ({attempt}/{attempts})")
+            time.sleep(retry_after)
+
 
 class TestRunner:
     def __init__(self):
@@ -16,14 +67,100 @@ class TestRunner:
         self.test_dir = '/robot_src/tests'
         self.processes = int(os.getenv('PROCESSES', '6'))
         self.browser = os.getenv('BROWSER', 'headlesschrome')
-        
-    def build_command(self, tag=None, suite=None, test=None, processes=None):
-        """Build robot/pabot command"""
+
+        # Historical durations for pabot scheduling - dashboard URL or JSON file
+        metrics_url = None
+        if os.getenv('METRICS_HOST'):
+            metrics_url = f"http://{os.getenv('METRICS_HOST')}:{os.getenv('METRICS_PORT', '5000')}"
+        self.durations_source = os.getenv('PABOT_DURATIONS', metrics_url)
+        self.namespace = os.getenv('METRICS_NAMESPACE') or None
+
+        # Push output.xml to the dashboard's /api/ingest after the run
+        # (for agents that do not share the results directory with it)
+        self.metrics_url = metrics_url
+        self.push = os.getenv('METRICS_PUSH', 'false').lower() == 'true'
+        self.schedule = os.getenv('PABOT_SCHEDULE', 'true').lower() == 'true'
+        self.split_heavy = os.getenv('PABOT_SPLIT_HEAVY', 'false').lower() == 'true'
+        self.auto_processes = os.getenv('PABOT_AUTO_PROCESSES', 'false').lower() == 'true'
+        self.ordering_file = os.path.join(self.output_dir, 'pabot_ordering.txt')
+
+        # History-based test selection (--strategy)
+        self.strategy = os.getenv('TEST_STRATEGY') or None
+        self.strategy_runs = int(os.getenv('STRATEGY_RUNS', '10'))
+        self.budget_minutes = float(os.getenv('TIME_BUDGET_MINUTES', '0'))
+        self.selection_file = os.path.join(self.output_dir, 'selected_tests.txt')
+
+    def plan_run(self, tag=None, suite=None, test=None, processes=None):
+        """
+        Run plan from the metrics history (None if there is no history).
+
+        Without a strategy it is an LPT ordering of the suites; with one,
+        the selected tests in priority order (restricting strategies also
+        limit the run to them, the others only order it). Failures to reach the
+        dashboard never block the run - the full suite then runs without
+        an ordering file.
+        """
         procs = processes or self.processes
+        if not self.strategy and (not self.schedule or procs < 2):
+            return None
+        fallback = ', running the full suite' if self.strategy else ''
+        if not self.durations_source:
+            if self.strategy:
+                print(f"⚠️  No metrics history configured (METRICS_HOST){fallback}")
+            return None
+
+        try:
+            tests = fetch_tests(self.durations_source, tag=tag, window=self.strategy_runs,
+                                namespace=self.namespace)
+        except Exception as e:
+            print(f"⚠️  No history from {self.durations_source}: {e}{fallback}")
+            return None
+
+        tests = filter_tests(tests, suites=[suite] if suite else None, names=[test] if test else None)
+        if not tests:
+            print(f"⚠️  No history for the selected tests{fallback or ', running without ordering'}")
+            return None
+
+        if self.strategy:
+            selected = select_tests(tests, self.strategy, budget_seconds=self.budget_minutes * 60,
+                                    processes=procs)
+            if not selected:
+                print(f"⚠️  Strategy {self.strategy} selected no tests{fallback}")
+                return None
+            items = [('test', test_longname(t), float(t['duration'] or 0)) for t in selected]
+            plan = plan_ordered(items, procs, auto_processes=self.auto_processes)
+            if self.strategy in RESTRICTING_STRATEGIES:
+                write_selection_file(self.selection_file, selected)
+                print(f"🎯 Strategy {self.strategy}: {len(selected)} of {len(tests)} tests")
+            elif plan['processes'] > 1:
+                # Only the order changes - pabot runs tests missing from the ordering file last
+                print(f"🎯 Strategy {self.strategy}: {len(selected)} tests with history first, "
+                      f"then the rest of the suite")
+            else:
+                print(f"⚠️  Strategy {self.strategy} orders tests through pabot --ordering; "
+                      f"a single process runs the full suite in its normal order")
+        else:
+            plan = plan_schedule(durations_by_suite(tests), procs, split_heavy=self.split_heavy,
+                                 auto_processes=self.auto_processes)
+
+        if plan['processes'] > 1:
+            write_ordering_file(self.ordering_file, plan['items'])
+        print(f"📊 Schedule: {len(plan['items'])} items, {plan['processes']} processes, "
+              f"predicted {plan['makespan'] / 60:.1f} min of {plan['total'] / 60:.1f} min total"
+              f"{', test level split' if plan['testlevelsplit'] else ''}")
+        return plan
+
+    def build_command(self, tag=None, suite=None, test=None, processes=None, plan=None):
+        """Build robot/pabot command"""
+        procs = plan['processes'] if plan else processes or self.processes
         
         # Base command
         if procs > 1:
             cmd = ['pabot', '--processes', str(procs)]
+            if plan:
+                if plan['testlevelsplit']:
+                    cmd.append('--testlevelsplit')
+                cmd.extend(['--ordering', self.ordering_file])
         else:
             cmd = ['robot']
         
@@ -49,8 +186,11 @@ class TestRunner:
         
         if suite:
             cmd.extend(['--suite', suite])
-            
-        if test:
+
+        # The selection already honours --test (several --test options are ORed)
+        if self.strategy in RESTRICTING_STRATEGIES and plan:
+            cmd.extend(['--argumentfile', self.selection_file])
+        elif test:
             cmd.extend(['--test', test])
         
         # Test directory
@@ -60,7 +200,8 @@ class TestRunner:
     
     def run(self, tag=None, suite=None, test=None, processes=None):
         """Execute tests"""
-        cmd = self.build_command(tag, suite, test, processes)
+        plan = self.plan_run(tag, suite, test, processes)
+        cmd = self.build_command(tag, suite, test, processes, plan=plan)
         
         print("=" * 60)
         print("Command:", ' '.join(cmd))
@@ -69,11 +210,33 @@ class TestRunner:
         
         try:
             result = subprocess.run(cmd, check=False)
-            return result.returncode
         except Exception as e:
             print(f"Error running tests: {e}")
             return 1
 
+        if self.push:
+            self.push_results()
+        return result.returncode
+
+    def push_results(self):
+        """Pushes output.xml to the dashboard - a failed push never fails the run"""
+        output_xml = os.path.join(self.output_dir, 'output.xml')
+        if not self.metrics_url:
+            print("⚠️  No metrics dashboard configured (METRICS_HOST), results not pushed")
+            return None
+        if not os.path.exists(output_xml):
+            print(f"⚠️  {output_xml} not found, results not pushed")
+            return None
+
+        try:
+            result = push_results(output_xml, self.metrics_url, namespace=self.namespace)
+        except Exception as e:
+            print(f"⚠️  Could not push results to {self.metrics_url}: {e}")
+            return None
+        state = 'created' if result.get('created') else 'already in history'
+        print(f"✓ Results pushed to {self.metrics_url}: run {result.get('run_id')} ({state})")
+        return result.get('run_id')
+
 
 def main():
     parser = argparse.ArgumentParser(description='Robot Framework Test Runner')
@@ -82,10 +245,45 @@ def main():
     parser.add_argument('--test', help='Run specific test')
     parser.add_argument('--processes', '-p', type=int, help='Number of parallel processes')
     parser.add_argument('--interactive', '-i', action='store_true', help='Interactive mode')
+    parser.add_argument('--durations', help='Dashboard URL or /api/durations JSON file for scheduling')
+    parser.add_argument('--namespace', help='Metrics history namespace (project[/branch[/environment]])')
+    parser.add_argument('--push', metavar='URL', nargs='?', const='',
+                        help='Push output.xml to the metrics dashboard after the run (default: METRICS_HOST)')
+    parser.add_argument('--no-schedule', action='store_true', help='Run pabot without an ordering file')
+    parser.add_argument('--split-heavy', action='store_true',
+                        help='Split suites longer than a process share into tests (--testlevelsplit)')
+    parser.add_argument('--auto-processes', action='store_true',
+                        help='Pick the process count (up to --processes) from the predicted makespan')
+    parser.add_argument('--strategy', choices=STRATEGIES,
+                        help='Select and order tests from the metrics history')
+    parser.add_argument('--strategy-runs', type=int,
+                        help='Runs of history the strategies look at (default 10)')
+    parser.add_argument('--budget', type=float, help='Wall time budget in minutes (time-budget strategy)')
     
     args = parser.parse_args()
     
     runner = TestRunner()
+    if args.durations:
+        runner.durations_source = args.durations
+    if args.namespace:
+        runner.namespace = args.namespace
+    if args.push is not None:
+        runner.push = True
+        runner.metrics_url = args.push or runner.metrics_url
+    if args.no_schedule:
+        runner.schedule = False
+    if args.split_heavy:
+        runner.split_heavy = True
+    if args.auto_processes:
+        runner.auto_processes = True
+    if args.strategy:
+        runner.strategy = args.strategy
+    if args.strategy_runs:
+        runner.strategy_runs = args.strategy_runs
+    if args.budget:
+        runner.budget_minutes = args.budget
+    if runner.strategy == 'time-budget' and not runner.budget_minutes:
+        parser.error('--strategy time-budget requires --budget (or TIME_BUDGET_MINUTES)')
     
     if args.interactive:
         print("\n🤖 Robot Framework Interactive Mode")
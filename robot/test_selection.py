@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+History-based test selection for the runner
+
+Every strategy works on the per-test history from /api/durations and
+returns the tests to run, highest priority first. Within a priority
+group tests are ordered longest first, so pabot still gets an LPT
+schedule.
+
+failed-first and flaky-first only reorder: the whole suite still runs,
+so tests without history (e.g. newly added ones) run after the ordered
+ones. recent-failures and time-budget restrict the run to their selection.
+"""
+from pabot_scheduling import lpt_makespan, test_longname
+
+
+STRATEGIES = ('failed-first', 'flaky-first', 'recent-failures', 'time-budget')
+
+# Strategies that run only the selected tests (the others order the full suite)
+RESTRICTING_STRATEGIES = ('recent-failures', 'time-budget')
+
+
+def _longest_first(tests):
+    return sorted(tests, key=lambda t: (-float(t['duration'] or 0), test_longname(t)))
+
+
+def _items(tests):
+    return [('test', test_longname(t), float(t['duration'] or 0)) for t in tests]
+
+
+def failure_rate(test):
+    """Failure rate in the window, smoothed so tests with little history are not zero"""
+    return (test['failed'] + 1) / (test['total'] + 2)
+
+
+def failed_first(tests):
+    """Full suite - the tests that failed in their last run go first"""
+    failed = [t for t in tests if t['last_status'] == 'FAIL']
+    rest = [t for t in tests if t['last_status'] != 'FAIL']
+    return _longest_first(failed) + _longest_first(rest)
+
+
+def flaky_first(tests):
+    """Full suite - tests that flipped PASS/FAIL in the window go first, most flaky first"""
+    flaky = sorted((t for t in tests if t['flakiness'] > 0),
+                   key=lambda t: (-t['flakiness'], test_longname(t)))
+    rest = [t for t in tests if t['flakiness'] <= 0]
+    return flaky + _longest_first(rest)
+
+
+def recent_failures(tests):
+    """Only the tests that failed at least once in the window"""
+    return _longest_first(t for t in tests if t['failed'])
+
+
+def time_budget(tests, budget_seconds, processes=1):
+    """
+    Subset that fits `budget_seconds` of wall time on `processes` processes
+    and catches the most historical failures: greedy by failure rate per
+    second of run time (0/1 knapsack approximation).
+    """
+    capacity = budget_seconds * max(processes, 1)
+    ranked = sorted(tests, key=lambda t: (-failure_rate(t) / max(float(t['duration'] or 0), 0.1),
+                                          test_longname(t)))
+    selected, used = [], 0.0
+    for test in ranked:
+        seconds = float(test['duration'] or 0)
+        if used + seconds <= capacity:
+            selected.append(test)
+            used += seconds
+
+    # The sum does not bound the makespan - drop the least valuable tests until it fits
+    ordered = _longest_first(selected)
+    while ordered and lpt_makespan(_items(ordered), processes) > budget_seconds:
+        selected.pop()
+        ordered = _longest_first(selected)
+    return ordered
+
+
+def select_tests(tests, strategy, budget_seconds=None, processes=1):
+    """Ordered run set for `strategy` (one of STRATEGIES)"""
+    if strategy == 'failed-first':
+        return failed_first(tests)
+    if strategy == 'flaky-first':
+        return flaky_first(tests)
+    if strategy == 'recent-failures':
+        return recent_failures(tests)
+    if strategy == 'time-budget':
+        if not budget_seconds:
+            raise ValueError('time-budget strategy needs a budget')
+        return time_budget(tests, budget_seconds, processes)
+    raise ValueError(f"Unknown strategy: {strategy} (expected: {', '.join(STRATEGIES)})")
+
+
+def write_selection_file(path, tests):
+    """Robot --argumentfile with one --test per selected test"""
+    with open(path, 'w') as f:
+        for test in tests:
+            f.write(f'--test {test_longname(test)}\n')